@@ -18,6 +18,7 @@ from app.models.password_reset_token import PasswordResetToken
 from app.models.file import File
 from app.models.file_encryption import FileEncryption
 from app.models.folder import Folder
+from app.models.blob import Blob
 
 # Add the path to the project root (BackEnd folder) so that Alembic can find the app module
 # The path is relative to the alembic folder, so '..'
@@ -0,0 +1,33 @@
+"""Add scan_status and scanned_at to File
+
+Revision ID: 3c9d2e7a51b4
+Revises: 68fe86ed684a
+Create Date: 2026-10-19 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9d2e7a51b4'
+down_revision: Union[str, None] = '68fe86ed684a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing files were scanned inline before saving, so they are clean
+    op.add_column('files', sa.Column('scan_status', sa.String(length=20), nullable=False, server_default=sa.text("'clean'")))
+    op.add_column('files', sa.Column('scanned_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_files_scan_status'), 'files', ['scan_status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_files_scan_status'), table_name='files')
+    op.drop_column('files', 'scanned_at')
+    op.drop_column('files', 'scan_status')
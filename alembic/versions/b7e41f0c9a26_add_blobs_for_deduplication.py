@@ -0,0 +1,44 @@
+"""Add blobs table for content-addressed deduplication
+
+Revision ID: b7e41f0c9a26
+Revises: 3c9d2e7a51b4
+Create Date: 2026-10-19 11:03:54.918233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e41f0c9a26'
+down_revision: Union[str, None] = '3c9d2e7a51b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('files', sa.Column('blob_hash', sa.String(length=64), nullable=True))
+    # Existing files keep their per-user encryption and object paths
+    op.add_column('files', sa.Column('encryption_mode', sa.String(length=20), nullable=False, server_default=sa.text("'cbc'")))
+    op.create_index(op.f('ix_files_blob_hash'), 'files', ['blob_hash'], unique=False)
+    op.create_foreign_key('fk_files_blob_hash_blobs', 'files', 'blobs', ['blob_hash'], ['hash'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_files_blob_hash_blobs', 'files', type_='foreignkey')
+    op.drop_index(op.f('ix_files_blob_hash'), table_name='files')
+    op.drop_column('files', 'encryption_mode')
+    op.drop_column('files', 'blob_hash')
+    op.drop_table('blobs')
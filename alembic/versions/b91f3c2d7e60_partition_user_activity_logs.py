@@ -0,0 +1,122 @@
+"""Partition user_activity_logs by month and deduplicate its indexes
+
+Revision ID: b91f3c2d7e60
+Revises: b7e41f0c9a26
+Create Date: 2026-10-19 16:20:41.553108
+
+"""
+from typing import Sequence, Union
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b91f3c2d7e60'
+down_revision: Union[str, None] = 'b7e41f0c9a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of the current month; the retention task keeps creating them afterwards
+PARTITIONS_AHEAD = 3
+
+OLD_INDEXES = [
+    'idx_user_activity_logs_action_time',
+    'idx_user_activity_logs_date_range',
+    'idx_user_activity_logs_user_action',
+    'idx_user_activity_logs_user_id',
+    'ix_user_activity_logs_action_time',
+    'ix_user_activity_logs_user_id',
+]
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Partitioning is PostgreSQL-only: other databases only get the deduplicated indexes
+        op.drop_index('idx_user_activity_logs_date_range', table_name='user_activity_logs')
+        op.drop_index('ix_user_activity_logs_action_time', table_name='user_activity_logs')
+        op.drop_index('ix_user_activity_logs_user_id', table_name='user_activity_logs')
+        op.drop_index('idx_user_activity_logs_user_id', table_name='user_activity_logs')
+        op.create_index('idx_user_activity_logs_user_time', 'user_activity_logs', ['user_id', 'action_time'], unique=False)
+        return
+    for name in OLD_INDEXES:
+        op.drop_index(name, table_name='user_activity_logs')
+    op.rename_table('user_activity_logs', 'user_activity_logs_unpartitioned')
+    # The partition key must be part of the primary key of a partitioned table.
+    # The constraint gets a new name: the renamed table still owns user_activity_logs_pkey.
+    op.execute("""
+        CREATE TABLE user_activity_logs (
+            id UUID NOT NULL,
+            user_id UUID NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            action_type VARCHAR(50) NOT NULL,
+            action_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            ip_address VARCHAR(45),
+            user_agent VARCHAR(255),
+            CONSTRAINT user_activity_logs_time_pkey PRIMARY KEY (id, action_time)
+        ) PARTITION BY RANGE (action_time)
+    """)
+    first = bind.execute(sa.text("SELECT min(action_time) FROM user_activity_logs_unpartitioned")).scalar()
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = (first.astimezone(timezone.utc).date().replace(day=1) if first else current)
+    while month <= _add_months(current, PARTITIONS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE user_activity_logs_y{month.year}m{month.month:02d} PARTITION OF user_activity_logs "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        month = upper
+    # Catches rows beyond the created months, so an insert never fails for a missing partition
+    op.execute("CREATE TABLE user_activity_logs_default PARTITION OF user_activity_logs DEFAULT")
+    op.execute("""
+        INSERT INTO user_activity_logs (id, user_id, action_type, action_time, ip_address, user_agent)
+        SELECT id, user_id, action_type, action_time, ip_address, user_agent FROM user_activity_logs_unpartitioned
+    """)
+    op.drop_table('user_activity_logs_unpartitioned')
+    # Indexes on the parent are created on every partition
+    op.create_index('idx_user_activity_logs_action_time', 'user_activity_logs', ['action_time'], unique=False)
+    op.create_index('idx_user_activity_logs_user_time', 'user_activity_logs', ['user_id', 'action_time'], unique=False)
+    op.create_index('idx_user_activity_logs_user_action', 'user_activity_logs', ['user_id', 'action_type'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        op.drop_index('idx_user_activity_logs_user_time', table_name='user_activity_logs')
+        op.create_index('idx_user_activity_logs_user_id', 'user_activity_logs', ['user_id'], unique=False)
+        op.create_index(op.f('ix_user_activity_logs_user_id'), 'user_activity_logs', ['user_id'], unique=False)
+        op.create_index(op.f('ix_user_activity_logs_action_time'), 'user_activity_logs', ['action_time'], unique=False)
+        op.create_index('idx_user_activity_logs_date_range', 'user_activity_logs', ['action_time'], unique=False)
+        return
+    op.rename_table('user_activity_logs', 'user_activity_logs_partitioned')
+    op.create_table('user_activity_logs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('action_type', sa.String(length=50), nullable=False),
+    sa.Column('action_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('ip_address', sa.String(length=45), nullable=True),
+    sa.Column('user_agent', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id')
+    )
+    op.execute("""
+        INSERT INTO user_activity_logs (id, user_id, action_type, action_time, ip_address, user_agent)
+        SELECT id, user_id, action_type, action_time, ip_address, user_agent FROM user_activity_logs_partitioned
+    """)
+    # Dropping the parent drops all partitions
+    op.drop_table('user_activity_logs_partitioned')
+    op.create_index('idx_user_activity_logs_action_time', 'user_activity_logs', ['action_time'], unique=False)
+    op.create_index('idx_user_activity_logs_date_range', 'user_activity_logs', ['action_time'], unique=False)
+    op.create_index('idx_user_activity_logs_user_action', 'user_activity_logs', ['user_id', 'action_type'], unique=False)
+    op.create_index('idx_user_activity_logs_user_id', 'user_activity_logs', ['user_id'], unique=False)
+    op.create_index(op.f('ix_user_activity_logs_action_time'), 'user_activity_logs', ['action_time'], unique=False)
+    op.create_index(op.f('ix_user_activity_logs_user_id'), 'user_activity_logs', ['user_id'], unique=False)
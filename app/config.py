@@ -16,12 +16,16 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
+# Secret mixed into convergent encryption keys of deduplicated blobs. Changing it makes existing blobs unreadable.
+BLOB_ENCRYPTION_SECRET = os.getenv("BLOB_ENCRYPTION_SECRET", "dev-blob-secret")
 
 class Settings(BaseSettings):
     DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/postgres")
     TEST_DATABASE_URL: str = os.getenv("TEST_DATABASE_URL", "sqlite+aiosqlite:///./test.db")
     REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    # "inline" - scan uploads before saving them, "async" - save as pending_scan and scan in Celery
+    SCAN_MODE: str = os.getenv("SCAN_MODE", "inline")
 
     @property
     def effective_database_url(self) -> str:
@@ -0,0 +1,175 @@
+# fastapi
+from fastapi import Depends, Request
+# app
+from app.db.database import AsyncSessionLocal
+from app.core.security import get_current_user
+from app.repositories.user_activity_log_repo import insert_logs
+# other
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+from typing import Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Events waiting to be written per worker; when the queue is full new events are dropped and counted
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+# A batch is written when it has AUDIT_BATCH_SIZE events or AUDIT_FLUSH_INTERVAL_MS after its first event
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", 200))
+
+# Writes user activity events in batches: record() only puts the event into a bounded in-memory queue,
+# a background task of the worker inserts the queued events with one multi-row INSERT per batch.
+# Requests never wait for the audit log: if the database falls behind and the queue fills up,
+# events are dropped and counted instead of slowing requests down.
+class AuditWriter:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval_ms: int = AUDIT_FLUSH_INTERVAL_MS
+    ):
+        self.session_factory = session_factory
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = None
+        self._batch_ready = None
+        self._task = None
+        self._writing = None
+        # Event taken from the queue while the writer waits for the rest of its batch
+        self._current = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    # Starts the background writer (in the application lifespan)
+    def start(self) -> None:
+        if self._task:
+            return
+        self._queue = asyncio.Queue(self.queue_size)
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    # Stops the writer and writes out everything still queued
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # A batch being written when the task was cancelled is finished, not lost
+        if self._writing:
+            await self._writing
+        # So is the event the writer was waiting with
+        if self._current is not None:
+            await self._write([self._current] + self._take_batch(self.batch_size - 1))
+            self._current = None
+        while not self._queue.empty():
+            await self._write(self._take_batch())
+
+    # Queues an event. Never blocks; events recorded while the writer is not running are ignored.
+    def record(
+        self,
+        user_id: UUID,
+        action_type: str,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None
+    ) -> None:
+        if not self._task:
+            return
+        try:
+            self._queue.put_nowait({
+                "id": uuid4(),
+                "user_id": user_id,
+                "action_type": action_type[:50],
+                # The time of the action, not of the write
+                "action_time": datetime.now(timezone.utc),
+                "ip_address": ip_address[:45] if ip_address else None,
+                "user_agent": user_agent[:255] if user_agent else None
+            })
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    def _take_batch(
+        self,
+        limit: Optional[int] = None
+    ) -> list:
+        batch = []
+        while len(batch) < (self.batch_size if limit is None else limit) and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            first = self._current = await self._queue.get()
+            # Wait for more events unless a full batch is already queued
+            if self._queue.qsize() + 1 < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            batch = [first] + self._take_batch(self.batch_size - 1)
+            self._current = None
+            self._writing = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    async def _write(
+        self,
+        batch: list
+    ) -> None:
+        if not batch:
+            return
+        try:
+            async with self.session_factory() as session:
+                self.written += await insert_logs(session, batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} audit events: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+audit_writer = AuditWriter()
+
+# Records an event of the user with the client address and user agent of the request
+def record_event(
+    request: Request,
+    user_id: UUID,
+    action_type: str
+) -> None:
+    audit_writer.record(
+        user_id,
+        action_type,
+        request.client.host if request.client else None,
+        request.headers.get("user-agent")
+    )
+
+# Route dependency that records the action of the current user once the route succeeded
+# (an error response is not recorded). Usage: dependencies=[audit("file_delete")]
+def audit(
+    action_type: str
+):
+    async def dependency(
+        request: Request,
+        current_user=Depends(get_current_user)
+    ):
+        yield
+        record_event(request, current_user.id, action_type)
+    return Depends(dependency)
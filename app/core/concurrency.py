@@ -0,0 +1,223 @@
+# fastapi
+from fastapi import Depends, HTTPException, Request
+# app
+from app.core.security import get_current_user
+from app.utils.redis_client import acquire_concurrency_lease, release_concurrency_lease, renew_concurrency_leases
+# other
+from contextlib import asynccontextmanager
+from collections import Counter
+from uuid import uuid4
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a request waits in a worker's queue for a free slot before it gets 503
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", 10))
+# A global slot is freed after this many seconds if its worker died without releasing it.
+# Workers renew the leases of slots they hold every third of this time, so long requests keep their slot.
+CONCURRENCY_LEASE_SECONDS = int(os.getenv("CONCURRENCY_LEASE_SECONDS", 60))
+# Sent as Retry-After with 429 and 503 responses
+CONCURRENCY_RETRY_AFTER = int(os.getenv("CONCURRENCY_RETRY_AFTER", 5))
+
+# Reads the limits of a limiter, e.g. CONCURRENCY_UPLOAD_LOCAL, CONCURRENCY_UPLOAD_PER_USER, CONCURRENCY_UPLOAD_GLOBAL
+def _limit(
+    name: str,
+    kind: str,
+    default: int
+) -> int:
+    return int(os.getenv(f"CONCURRENCY_{name.upper()}_{kind}", default))
+
+# Bounds the number of heavy requests (uploads, downloads, archives) running at the same time.
+# Three caps apply, checked in this order:
+#   - per user: at most per_user_limit requests of one user, in this worker and across all workers (429);
+#   - per worker: at most local_limit requests run in this process, others wait in a queue of at most
+#     queue_size requests for queue_timeout seconds (503 when the queue is full or the wait times out);
+#   - global: at most global_limit requests across all workers, counted with leases in Redis (503).
+# Rejected requests get Retry-After. If Redis is unavailable only the per-worker caps apply.
+class ConcurrencyLimiter:
+    def __init__(
+        self,
+        name: str,
+        local_limit: int,
+        per_user_limit: int = 0,
+        global_limit: int = 0,
+        queue_size: int = 100,
+        queue_timeout: float = CONCURRENCY_QUEUE_TIMEOUT,
+        lease_seconds: int = CONCURRENCY_LEASE_SECONDS,
+        retry_after: int = CONCURRENCY_RETRY_AFTER
+    ):
+        self.name = name
+        self.local_limit = local_limit
+        self.per_user_limit = per_user_limit
+        self.global_limit = global_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease_seconds = lease_seconds
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(local_limit)
+        self._users = Counter()
+        # Leases held by this worker: token -> user key, renewed by the heartbeat task while not empty
+        self._leases = {}
+        self._heartbeat = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_user = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_global = 0
+        self.redis_errors = 0
+
+    def _reject(
+        self,
+        status_code: int,
+        detail: str
+    ) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    # Holds a slot for the user while the block runs. Raises HTTPException 429/503 if no slot is available.
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_key: str
+    ):
+        if self.per_user_limit and self._users[user_key] >= self.per_user_limit:
+            self.rejected_user += 1
+            raise self._reject(429, "Too many concurrent requests")
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            self.rejected_queue_full += 1
+            raise self._reject(503, "Server is busy, try again later")
+        self._users[user_key] += 1
+        try:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise self._reject(503, "Server is busy, try again later")
+            finally:
+                self.waiting -= 1
+            try:
+                token = await self._acquire_lease(user_key)
+                self.active += 1
+                self.admitted += 1
+                try:
+                    yield
+                finally:
+                    self.active -= 1
+                    if token:
+                        await self._release_lease(user_key, token)
+            finally:
+                self._semaphore.release()
+        finally:
+            self._users[user_key] -= 1
+            if not self._users[user_key]:
+                del self._users[user_key]
+
+    # Takes a global slot; returns its token, or None if there is no global limit or Redis is unavailable
+    async def _acquire_lease(
+        self,
+        user_key: str
+    ):
+        if not self.global_limit and not self.per_user_limit:
+            return None
+        token = uuid4().hex
+        try:
+            result = await acquire_concurrency_lease(
+                self.name, user_key, token, time.time(), self.lease_seconds, self.global_limit, self.per_user_limit
+            )
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Global concurrency limit {self.name} unavailable: {e}")
+            return None
+        if result == 1:
+            self.rejected_user += 1
+            raise self._reject(429, "Too many concurrent requests")
+        if result == 2:
+            self.rejected_global += 1
+            raise self._reject(503, "Server is busy, try again later")
+        self._leases[token] = user_key
+        if not self._heartbeat or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._renew_leases())
+        return token
+
+    async def _release_lease(
+        self,
+        user_key: str,
+        token: str
+    ) -> None:
+        self._leases.pop(token, None)
+        try:
+            await release_concurrency_lease(self.name, user_key, token)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Failed to release concurrency lease {self.name}: {e}")
+
+    # Extends the leases held by this worker in one Redis call per interval; stops when none are held
+    async def _renew_leases(self) -> None:
+        while self._leases:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self._leases:
+                break
+            try:
+                await renew_concurrency_leases(self.name, list(self._leases.items()), time.time(), self.lease_seconds)
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Failed to renew concurrency leases {self.name}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "local_limit": self.local_limit,
+            "per_user_limit": self.per_user_limit,
+            "global_limit": self.global_limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_user": self.rejected_user,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "rejected_global": self.rejected_global,
+            "redis_errors": self.redis_errors
+        }
+
+# Single-request uploads, archive imports and completion of multipart uploads
+upload_limiter = ConcurrencyLimiter(
+    "upload", _limit("upload", "LOCAL", 8), _limit("upload", "PER_USER", 4), _limit("upload", "GLOBAL", 64)
+)
+# Parts of multipart uploads: clients send them in parallel, so the per-user cap is higher
+chunk_limiter = ConcurrencyLimiter(
+    "chunk", _limit("chunk", "LOCAL", 32), _limit("chunk", "PER_USER", 8), _limit("chunk", "GLOBAL", 256)
+)
+download_limiter = ConcurrencyLimiter(
+    "download", _limit("download", "LOCAL", 32), _limit("download", "PER_USER", 8), _limit("download", "GLOBAL", 256)
+)
+# Streamed ZIP archives keep a worker busy for the whole download
+archive_limiter = ConcurrencyLimiter(
+    "archive", _limit("archive", "LOCAL", 4), _limit("archive", "PER_USER", 1), _limit("archive", "GLOBAL", 16)
+)
+
+concurrency_limiters = [upload_limiter, chunk_limiter, download_limiter, archive_limiter]
+
+# Route dependency that runs the route (including sending a streamed response) in a slot of the limiter.
+# Callers are the current user; routes without authentication pass per_client=True to count by client address.
+# Usage: dependencies=[limit_concurrency(upload_limiter)]
+def limit_concurrency(
+    limiter: ConcurrencyLimiter,
+    per_client: bool = False
+):
+    if per_client:
+        async def dependency(
+            request: Request
+        ):
+            async with limiter.slot(f"client:{request.client.host if request.client else '-'}"):
+                yield
+    else:
+        async def dependency(
+            current_user=Depends(get_current_user)
+        ):
+            async with limiter.slot(str(current_user.id)):
+                yield
+    return Depends(dependency)
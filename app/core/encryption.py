@@ -3,6 +3,9 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.padding import PKCS7
 from cryptography.hazmat.backends import default_backend
+from app.config import BLOB_ENCRYPTION_SECRET
+import hashlib
+import hmac
 import os
 
 # Generate a key based on a password
@@ -54,4 +57,123 @@ def decrypt_file(
     unpadder = PKCS7(algorithms.AES.block_size).unpadder()
     decrypted_data = unpadder.update(decrypted_padded_data) + unpadder.finalize()
 
-    return decrypted_data
\ No newline at end of file
+    return decrypted_data
+
+# Derives the key and iv for convergent encryption from the content SHA-256.
+# Identical content gives identical ciphertext, so one stored blob is shared by every file with this content.
+# The server secret prevents anyone without it from confirming a guessed file by its ciphertext.
+def convergent_params(
+    content_hash: str
+) -> tuple[bytes, bytes]:
+    secret = BLOB_ENCRYPTION_SECRET.encode()
+    key = hmac.new(secret, b"key:" + content_hash.encode(), hashlib.sha256).digest()
+    iv = hmac.new(secret, b"iv:" + content_hash.encode(), hashlib.sha256).digest()[:16]
+    return key, iv
+
+# Encrypts content with convergent encryption (AES-CBC, key and iv derived from content_hash)
+def encrypt_convergent(
+    file_data: bytes,
+    content_hash: str
+) -> bytes:
+    key, iv = convergent_params(content_hash)
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend()).encryptor()
+    padder = PKCS7(algorithms.AES.block_size).padder()
+    padded_data = padder.update(file_data) + padder.finalize()
+    return encryptor.update(padded_data) + encryptor.finalize()
+
+# Derives the AES key of a file encrypted with AES-CTR (multipart uploads) from its salt
+def ctr_key(
+    salt: bytes
+) -> bytes:
+    return hmac.new(BLOB_ENCRYPTION_SECRET.encode(), b"ctr:" + salt, hashlib.sha256).digest()
+
+# Encrypts or decrypts (CTR is symmetric) data located at the given byte offset of a file.
+# CTR is seekable: the counter block for an offset is iv + offset // 16, so parts of a file
+# can be processed independently, in parallel and in any order.
+def ctr_transform_at(
+    key: bytes,
+    iv: bytes,
+    offset: int,
+    data: bytes
+) -> bytes:
+    encryptor = ctr_cipher_at(key, iv, offset)
+    return encryptor.update(data) + encryptor.finalize()
+
+# Returns an AES-CTR cipher context positioned at the given byte offset of a file.
+# Successive update() calls continue the keystream, so a stream can be encrypted chunk by chunk.
+def ctr_cipher_at(
+    key: bytes,
+    iv: bytes,
+    offset: int
+):
+    counter = (int.from_bytes(iv, "big") + offset // 16) % (1 << 128)
+    encryptor = Cipher(algorithms.AES(key), modes.CTR(counter.to_bytes(16, "big")), backend=default_backend()).encryptor()
+    # An offset inside a block: drop the keystream bytes that belong to the previous data
+    encryptor.update(b"\0" * (offset % 16))
+    return encryptor
+
+# Encrypts a derivative of a file (e.g. a preview) with AES-CTR under a key bound to the file id.
+# A random IV is stored in front of the ciphertext, so the derivative is decrypted from one object read.
+def encrypt_derivative(
+    data: bytes,
+    file_id: bytes
+) -> bytes:
+    iv = os.urandom(16)
+    return iv + ctr_transform_at(ctr_key(b"derivative:" + file_id), iv, 0, data)
+
+# Decrypts a derivative encrypted by encrypt_derivative
+def decrypt_derivative(
+    data: bytes,
+    file_id: bytes
+) -> bytes:
+    return ctr_transform_at(ctr_key(b"derivative:" + file_id), data[:16], 0, data[16:])
+
+# Streaming counterpart of decrypt_file: feed encrypted chunks to update() and call finalize() at the end.
+# Keeps only one AES block of state, so large files can be decrypted without loading them into memory.
+class FileDecryptor:
+    def __init__(
+        self,
+        key: bytes,
+        iv: bytes
+    ):
+        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+        self._decryptor = cipher.decryptor()
+        self._unpadder = PKCS7(algorithms.AES.block_size).unpadder()
+
+    def update(
+        self,
+        chunk: bytes
+    ) -> bytes:
+        return self._unpadder.update(self._decryptor.update(chunk))
+
+    def finalize(self) -> bytes:
+        return self._unpadder.update(self._decryptor.finalize()) + self._unpadder.finalize()
+
+# Streaming decryptor for files encrypted with AES-CTR
+class CTRDecryptor:
+    def __init__(
+        self,
+        key: bytes,
+        iv: bytes
+    ):
+        self._decryptor = Cipher(algorithms.AES(key), modes.CTR(iv), backend=default_backend()).decryptor()
+
+    def update(
+        self,
+        chunk: bytes
+    ) -> bytes:
+        return self._decryptor.update(chunk)
+
+    def finalize(self) -> bytes:
+        return self._decryptor.finalize()
+
+# Decryptor for content encrypted by the storage itself (SSE): MinIO returns plaintext
+class PassthroughDecryptor:
+    def update(
+        self,
+        chunk: bytes
+    ) -> bytes:
+        return chunk
+
+    def finalize(self) -> bytes:
+        return b""
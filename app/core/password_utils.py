@@ -1,6 +1,20 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import asyncio
+import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor of new hashes. Hashes with another cost are replaced at the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Threads hashing passwords per worker: at most this many bcrypt computations run at once, others wait
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so hashing in these threads leaves the event loop free for other requests
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+# Bulk provisioning hashes in its own thread, so it never takes the threads logins and registrations use
+_bulk_hash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-hash-bulk")
 
 # Hashes the user's password using bcrypt
 def hash_password(
@@ -14,3 +28,27 @@ def verify_password(
     hashed_password: str
 ) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+# Hashes the password in the hashing pool
+async def hash_password_async(
+    password: str
+) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, pwd_context.hash, password)
+
+# Hashes the passwords one after another in the bulk hashing thread
+async def hash_passwords_bulk(
+    passwords: List[str]
+) -> List[str]:
+    return await asyncio.get_running_loop().run_in_executor(
+        _bulk_hash_executor, lambda: [pwd_context.hash(password) for password in passwords]
+    )
+
+# Checks the password in the hashing pool. Returns (matches, new hash); the new hash is set
+# when the password matches but its hash uses an outdated scheme or cost and should be replaced.
+async def verify_and_update_password(
+    plain_password: str,
+    hashed_password: str
+) -> tuple:
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
@@ -0,0 +1,273 @@
+# fastapi
+from fastapi import Depends, HTTPException, Request
+# app
+from app.utils.redis_client import sync_rate_limit_counters, check_rate_limit_counter
+# other
+from collections import OrderedDict
+import asyncio
+import ipaddress
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Hits counted while Redis was unavailable are sent to Redis in one batch this often
+RATE_LIMIT_SYNC_INTERVAL_MS = int(os.getenv("RATE_LIMIT_SYNC_INTERVAL_MS", 200))
+# Most keys a worker keeps windows and pending hits for; the least recently used ones are forgotten first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# Comma-separated addresses or networks of the reverse proxies whose X-Forwarded-For header is trusted
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()
+]
+
+# Best known state of one limited key in the current window: the counts of all workers as of the last
+# answer from Redis plus the hits of this worker since then
+class _Window:
+    __slots__ = ("number", "seconds", "current", "previous")
+
+    def __init__(
+        self,
+        number: int,
+        seconds: int
+    ):
+        self.number = number
+        self.seconds = seconds
+        self.current = 0
+        self.previous = 0
+
+# Sliding-window rate limiter shared by the workers through Redis, with a local pre-check:
+#   - over the limit by what the worker already knows (its own hits and the last totals from Redis):
+#     rejected without Redis. This is what absorbs credential-stuffing bursts;
+#   - otherwise Redis decides with an atomic check-and-increment, so all workers together
+#     never admit more than the limit.
+# Windows are fixed in Redis; the sliding count is the current window plus the previous one weighted
+# by how much of it still overlaps. If Redis is unavailable the worker limits on its own counts
+# and sends those hits to Redis in a batch once it is back.
+class HybridRateLimiter:
+    def __init__(
+        self,
+        sync_interval_ms: int = RATE_LIMIT_SYNC_INTERVAL_MS,
+        prefix: str = "rate-limit",
+        max_keys: int = RATE_LIMIT_MAX_KEYS
+    ):
+        self.sync_interval = sync_interval_ms / 1000
+        self.prefix = prefix
+        self.max_keys = max_keys
+        # Both are kept in least recently used order, so a flood of distinct keys can not grow them without bound
+        self._windows = OrderedDict()
+        # (key, window number, window length) -> hits not yet sent to Redis
+        self._pending = OrderedDict()
+        self._task = None
+        # Allowed on local counts alone, only while Redis is unavailable
+        self.local_allowed = 0
+        self.local_rejected = 0
+        self.remote_allowed = 0
+        self.remote_rejected = 0
+        self.sync_batches = 0
+        self.redis_errors = 0
+        self.evicted = 0
+
+    # Starts the background synchronisation (in the application lifespan)
+    def start(self) -> None:
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    # Stops the synchronisation and sends the pending hits
+    async def stop(self) -> None:
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.sync()
+
+    def _counter_key(
+        self,
+        key: str,
+        number: int
+    ) -> str:
+        return f"{self.prefix}:{key}:{number}"
+
+    def _window(
+        self,
+        key: str,
+        number: int,
+        seconds: int
+    ) -> _Window:
+        window = self._windows.get(key)
+        if window is None or window.number != number:
+            rolled = _Window(number, seconds)
+            if window is not None and window.number == number - 1:
+                rolled.previous = window.current
+            self._windows[key] = window = rolled
+        self._windows.move_to_end(key)
+        while len(self._windows) > self.max_keys:
+            self._windows.popitem(last=False)
+            self.evicted += 1
+        return window
+
+    # Adds hits to be sent to Redis. Without Redis the oldest pending hits are dropped once max_keys is reached.
+    def _add_pending(
+        self,
+        pending_key: tuple,
+        hits: int
+    ) -> None:
+        self._pending[pending_key] = self._pending.get(pending_key, 0) + hits
+        self._pending.move_to_end(pending_key)
+        while len(self._pending) > self.max_keys:
+            self._pending.popitem(last=False)
+            self.evicted += 1
+
+    # Counts a request of the key. Returns 0 if it is allowed, otherwise the seconds until it may be retried.
+    async def hit(
+        self,
+        key: str,
+        times: int,
+        seconds: int,
+        now: float = None
+    ) -> int:
+        now = time.time() if now is None else now
+        number = int(now // seconds)
+        elapsed = now - number * seconds
+        weight = 1 - elapsed / seconds
+        retry_after = max(1, math.ceil(seconds - elapsed))
+        window = self._window(key, number, seconds)
+        estimate = window.previous * weight + window.current
+        if estimate + 1 > times:
+            self.local_rejected += 1
+            return retry_after
+        pending_key = (key, number, seconds)
+        pending = self._pending.pop(pending_key, 0)
+        try:
+            allowed, current, previous = await check_rate_limit_counter(
+                self._counter_key(key, number), self._counter_key(key, number - 1), times, weight, seconds * 1000, pending
+            )
+        except Exception as e:
+            # Without Redis the local counts decide; the hits are sent with a later batch
+            self.redis_errors += 1
+            logger.warning(f"Rate limit check in Redis failed: {e}")
+            self._add_pending(pending_key, pending)
+            self._count(key, window, seconds)
+            self.local_allowed += 1
+            return 0
+        window = self._window(key, number, seconds)
+        # Hits of this worker counted while waiting for Redis are not in its answer yet
+        window.current = current + self._pending.get(pending_key, 0)
+        window.previous = previous
+        if allowed:
+            self.remote_allowed += 1
+            return 0
+        self.remote_rejected += 1
+        return retry_after
+
+    def _count(
+        self,
+        key: str,
+        window: _Window,
+        seconds: int
+    ) -> None:
+        window.current += 1
+        self._add_pending((key, window.number, seconds), 1)
+
+    # Sends the pending hits to Redis in one call and takes over the totals of all workers
+    async def sync(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, OrderedDict()
+        items = list(batch.items())
+        try:
+            totals = await sync_rate_limit_counters([
+                (self._counter_key(key, number), self._counter_key(key, number - 1), hits, seconds * 1000)
+                for (key, number, seconds), hits in items
+            ])
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Rate limit synchronisation failed: {e}")
+            for pending_key, hits in items:
+                self._add_pending(pending_key, hits)
+            return
+        self.sync_batches += 1
+        for ((key, number, seconds), _), (current, previous) in zip(items, totals):
+            window = self._windows.get(key)
+            if window is not None and window.number == number:
+                window.current = current + self._pending.get((key, number, seconds), 0)
+                window.previous = previous
+
+    # Forgets keys whose counts no longer affect the sliding window (not hit in the current or previous window)
+    def _prune(
+        self,
+        now: float
+    ) -> None:
+        for key, window in list(self._windows.items()):
+            if int(now // window.seconds) > window.number + 1:
+                del self._windows[key]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+            self._prune(time.time())
+
+    def stats(self) -> dict:
+        local = self.local_allowed + self.local_rejected
+        remote = self.remote_allowed + self.remote_rejected
+        return {
+            "local_allowed": self.local_allowed,
+            "local_rejected": self.local_rejected,
+            "remote_allowed": self.remote_allowed,
+            "remote_rejected": self.remote_rejected,
+            "local_ratio": round(local / (local + remote), 4) if local + remote else None,
+            "keys": len(self._windows),
+            "pending_keys": len(self._pending),
+            "sync_batches": self.sync_batches,
+            "redis_errors": self.redis_errors,
+            "evicted": self.evicted
+        }
+
+rate_limiter = HybridRateLimiter()
+
+def _is_trusted_proxy(
+    address: str
+) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+# Identifies the client by the connection address. X-Forwarded-For is only used when the connection
+# comes from a trusted proxy: the client is the last address in it not added by a trusted proxy,
+# since everything before that could have been sent by the client itself.
+def client_address(
+    request: Request
+) -> str:
+    address = request.client.host if request.client else "-"
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded or not _is_trusted_proxy(address):
+        return address
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
+
+# Route dependency allowing a client at most `times` requests to the route per `seconds`.
+# Rejected requests get 429 with Retry-After. Usage: dependencies=[rate_limit(times=5, seconds=60)]
+def rate_limit(
+    times: int,
+    seconds: int
+):
+    async def dependency(
+        request: Request
+    ):
+        retry_after = await rate_limiter.hit(f"{client_address(request)}:{request.scope['path']}:{times}:{seconds}", times, seconds)
+        if retry_after:
+            raise HTTPException(status_code=429, detail="Too Many Requests", headers={"Retry-After": str(retry_after)})
+    return Depends(dependency)
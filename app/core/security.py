@@ -5,33 +5,18 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 # app
 from app.db.database import get_db
-from app.models.user import User
+from app.models.user import User, UserRole
+from app.core.password_utils import pwd_context, hash_password, verify_password
 # other
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from uuid import UUID
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = "test_secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days by default
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
-# Hashes the user's password using bcrypt
-def hash_password(
-    password: str
-) -> str:
-    return pwd_context.hash(password)
-
-# Checks if a password matches a hash using bcrypt
-def verify_password(
-    plain_password: str,
-    hashed_password: str
-) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 # Creates a JWT access token with a specified lifetime
 def create_access_token(
     data: dict,
@@ -65,4 +50,12 @@ async def get_current_user(
     if not user:
         print(f"[get_current_user] User not found by id: {user_id}")
         raise HTTPException(status_code=404, detail="User not found")
-    return user
\ No newline at end of file
+    return user
+
+# Gets the current user and checks that they are an administrator
+async def get_current_admin(
+    current_user: User = Depends(get_current_user)
+) -> User:
+    if current_user.role != UserRole.admin:
+        raise HTTPException(status_code=403, detail="Administrator privileges required")
+    return current_user
@@ -6,15 +6,15 @@ from app.routes.user_settings import router as user_settings_router
 from app.routes.password_reset_tokens import router as password_reset_tokens_router
 from app.routes.files import router as files_router
 from app.routes.folders import router as folders_router
+from app.routes.metrics import router as metrics_router
 from contextlib import asynccontextmanager
-from fastapi_limiter import FastAPILimiter
-import redis.asyncio as redis
-import os
 from app.middleware.logging_middleware import LoggingMiddleware
-import logging
+from app.utils.log_queue import setup_queue_logging, stop_queue_logging
+from app.core.audit import audit_writer
+from app.core.rate_limit import rate_limiter
 
-# Настройка базового логгера (если нужно)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+# Logging goes through queues: records are written to the console by listener threads, not by the request path
+setup_queue_logging()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -24,11 +24,13 @@ async def lifespan(app: FastAPI):
         pass
     except Exception as e:
         print(f"Error checking or creating MinIO bucket: {e}")
-    # Инициализация FastAPI-Limiter
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-    redis_client = redis.from_url(redis_url, encoding="utf8", decode_responses=True)
-    await FastAPILimiter.init(redis_client)
+    # Rate limit hits counted by this worker are sent to Redis in batches
+    rate_limiter.start()
+    audit_writer.start()
     yield
+    await audit_writer.stop()
+    await rate_limiter.stop()
+    stop_queue_logging()
 
 app = FastAPI(
     title="BattareyCloud API",
@@ -47,6 +49,7 @@ app.include_router(user_settings_router)
 app.include_router(password_reset_tokens_router)
 app.include_router(files_router)
 app.include_router(folders_router)
+app.include_router(metrics_router)
 
 @app.get("/")
 async def root():
@@ -1,10 +1,12 @@
 import logging
+import os
 import time
-from starlette.requests import Request
 from starlette.types import ASGIApp, Receive, Scope, Send, Message
 import json
 
 PRIVATE_FIELDS = {"password", "token", "access_token", "refresh_token"}
+# Request bodies are logged only for JSON requests up to this size; larger bodies and uploads are never buffered
+LOG_BODY_MAX_BYTES = int(os.getenv("LOG_BODY_MAX_BYTES", 4096))
 
 def filter_private_data(data):
     if isinstance(data, dict):
@@ -13,6 +15,19 @@ def filter_private_data(data):
         return [filter_private_data(i) for i in data]
     return data
 
+# Decides from the headers whether the request body is worth capturing: a JSON body of a known small size
+def _should_capture_body(
+    scope: Scope
+) -> bool:
+    if scope.get("method") not in ("POST", "PUT", "PATCH") or LOG_BODY_MAX_BYTES <= 0:
+        return False
+    headers = dict(scope.get("headers") or [])
+    content_type = headers.get(b"content-type", b"").split(b";")[0].strip().lower()
+    if content_type != b"application/json":
+        return False
+    content_length = headers.get(b"content-length", b"")
+    return content_length.isdigit() and int(content_length) <= LOG_BODY_MAX_BYTES
+
 class LoggingMiddleware:
     def __init__(self, app: ASGIApp):
         self.app = app
@@ -25,34 +40,18 @@ class LoggingMiddleware:
         method = scope.get("method")
         path = scope.get("path")
         start_time = time.time()
-        request_body = None
-        # Читаем тело запроса только для POST/PUT/PATCH
-        if method in ("POST", "PUT", "PATCH"):
-            body_bytes = b""
-            more_body = True
-            # Считываем всё тело запроса
-            while more_body:
-                message = await receive()
+        # The body is never read ahead: the application consumes the stream as usual and small JSON bodies
+        # are copied on the way, so logging does not add memory or latency to uploads
+        captured = [] if _should_capture_body(scope) else None
+        if captured is not None:
+            downstream_receive = receive
+
+            async def receive() -> Message:
+                message = await downstream_receive()
                 if message["type"] == "http.request":
-                    body_bytes += message.get("body", b"")
-                    more_body = message.get("more_body", False)
-            if body_bytes:
-                try:
-                    request_body = json.loads(body_bytes.decode())
-                    request_body = filter_private_data(request_body)
-                except Exception:
-                    request_body = "<non-json body>"
-            # Подменяем receive, чтобы downstream мог снова прочитать body
-            body_consumed = False
-            async def replay_receive():
-                nonlocal body_consumed
-                if not body_consumed:
-                    body_consumed = True
-                    return {"type": "http.request", "body": body_bytes, "more_body": False}
-                return {"type": "http.request", "body": b"", "more_body": False}
-            receive = replay_receive
+                    captured.append(message.get("body", b""))
+                return message
         response_status = None
-        process_time = None
         async def send_wrapper(message):
             nonlocal response_status
             if message["type"] == "http.response.start":
@@ -68,7 +67,11 @@ class LoggingMiddleware:
             await self.app(scope, receive, send_wrapper)
         except Exception as exc:
             process_time = (time.time() - start_time) * 1000
-            self.logger.error("%s %s - ERROR: %s - %.2fms - body: %s", method, path, exc, process_time, request_body)
+            request_body = self._request_body(captured)
+            self.logger.error(
+                "%s %s - ERROR: %s - %.2fms - body: %s", method, path, exc, process_time, request_body,
+                extra={"method": method, "path": path, "duration_ms": round(process_time, 2), "error": str(exc)}
+            )
             raise
         process_time = (time.time() - start_time) * 1000
         # safe_status — только строка с числовым статусом или '-'
@@ -76,4 +79,22 @@ class LoggingMiddleware:
             safe_status = str(response_status)
         else:
             safe_status = "-"
-        self.logger.info("%s %s - %s - %.2fms - body: %s", method, path, safe_status, process_time, request_body)
+        self.logger.info(
+            "%s %s - %s - %.2fms - body: %s", method, path, safe_status, process_time, self._request_body(captured),
+            extra={"method": method, "path": path, "status_code": response_status, "duration_ms": round(process_time, 2)}
+        )
+
+    # Parses the captured body with private fields masked (None if it was not captured)
+    @staticmethod
+    def _request_body(
+        captured
+    ):
+        if not captured:
+            return None
+        body_bytes = b"".join(captured)
+        if not body_bytes or len(body_bytes) > LOG_BODY_MAX_BYTES:
+            return None
+        try:
+            return filter_private_data(json.loads(body_bytes))
+        except Exception:
+            return "<non-json body>"
@@ -5,4 +5,5 @@ from .user_settings import UserSettings
 from .password_reset_token import PasswordResetToken
 from .file import File
 from .file_encryption import FileEncryption
-from .folder import Folder
\ No newline at end of file
+from .folder import Folder
+from .blob import Blob
\ No newline at end of file
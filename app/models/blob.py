@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, BigInteger, Integer, DateTime
+from app.db.database import Base
+from datetime import datetime, timezone
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 of the plaintext content
+    path = Column(String, nullable=False)  # Key/path to MinIO
+    size = Column(BigInteger, nullable=False)
+    refcount = Column(Integer, default=0, nullable=False)  # Number of files (including trash) pointing at the blob
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
\ No newline at end of file
@@ -2,8 +2,21 @@ from sqlalchemy import Column, String, BigInteger, DateTime, ForeignKey, Boolean
 from app.db.database import Base
 from app.db.types import GUID
 import uuid
+import enum
 from datetime import datetime, timezone
 
+class ScanStatus(str, enum.Enum):
+    pending_scan = "pending_scan"
+    clean = "clean"
+    infected = "infected"
+    scan_failed = "scan_failed"  # The object could not be read or scanned; the file is never handed out
+
+class EncryptionMode(str, enum.Enum):
+    cbc = "cbc"  # AES-CBC with a per-user PBKDF2 key, salt and iv in file_encryption
+    convergent = "convergent"  # AES-CBC with a key derived from the content hash, content stored as a shared blob
+    sse = "sse"  # Encrypted by the storage (MinIO SSE-S3), used for uploads sent directly to MinIO
+    ctr = "ctr"  # AES-CTR with a per-file key, salt and iv in file_encryption; used for multipart uploads (parts are encrypted independently)
+
 class File(Base):
     __tablename__ = "files"
 
@@ -17,4 +30,8 @@ class File(Base):
     path = Column(String, nullable=False)  # Key/path to MinIO
     is_deleted = Column(Boolean, default=False, nullable=False)
     deleted_at = Column(DateTime(timezone=True), nullable=True)
-    is_infected = Column(Boolean, default=False, nullable=False)
\ No newline at end of file
+    is_infected = Column(Boolean, default=False, nullable=False)
+    scan_status = Column(String(20), default=ScanStatus.clean.value, nullable=False, index=True)
+    scanned_at = Column(DateTime(timezone=True), nullable=True)
+    blob_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True, index=True)
+    encryption_mode = Column(String(20), default=EncryptionMode.cbc.value, nullable=False)
\ No newline at end of file
@@ -1,22 +1,63 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Index
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, event, text
 from app.db.database import Base
 from app.db.types import GUID
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 class UserActivityLog(Base):
     __tablename__ = "user_activity_logs"
 
-    id = Column(GUID(), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
-    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # On PostgreSQL the table is range-partitioned by month on action_time, so the partition key
+    # is part of the primary key (see the b91f3c2d7e60 migration and tasks/activity_logs.py)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     action_type = Column(String(50), nullable=False)
-    action_time = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    action_time = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc), nullable=False)
     ip_address = Column(String(45))
     user_agent = Column(String(255))
 
     __table_args__ = (
-        Index("idx_user_activity_logs_user_id", "user_id"),
         Index("idx_user_activity_logs_action_time", "action_time"),
+        Index("idx_user_activity_logs_user_time", "user_id", "action_time"),
         Index("idx_user_activity_logs_user_action", "user_id", "action_type"),
-        Index("idx_user_activity_logs_date_range", "action_time"),
-    )
\ No newline at end of file
+        {"postgresql_partition_by": "RANGE (action_time)"},
+    )
+
+# Name of the monthly partition holding logs of the month
+def partition_name(
+    month: date
+) -> str:
+    return f"user_activity_logs_y{month.year}m{month.month:02d}"
+
+# First day of the month shifted by the number of months
+def add_months(
+    month: date,
+    months: int
+) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+# Statement creating the monthly partition of the month
+def partition_ddl(
+    month: date
+) -> str:
+    return (
+        f"CREATE TABLE {partition_name(month)} PARTITION OF user_activity_logs "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+    )
+
+# Tables created from the metadata (tests, fresh databases without migrations) get the partitions of the current
+# and the next month like the migration, so new rows do not land in the default partition before the retention
+# task runs; it adds the later months
+@event.listens_for(UserActivityLog.__table__, "after_create")
+def create_initial_partitions(
+    target,
+    connection,
+    **kw
+):
+    if connection.dialect.name != "postgresql":
+        return
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    for month in (current, add_months(current, 1)):
+        connection.execute(text(partition_ddl(month)))
+    connection.execute(text("CREATE TABLE IF NOT EXISTS user_activity_logs_default PARTITION OF user_activity_logs DEFAULT"))
@@ -0,0 +1,188 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models.file import File, ScanStatus
+from app.models.folder import Folder
+from app.repositories.file_repo import get_files_by_ids, get_encryption_params, build_file_decryptor
+from app.utils.minio_utils import iter_object_chunks
+from app.utils.zip_stream import ZipStreamWriter
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from urllib.parse import quote
+from collections import deque
+from uuid import UUID
+from typing import List, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# How many files are fetched from MinIO ahead of the one being written
+ARCHIVE_PREFETCH_FILES = int(os.getenv("ARCHIVE_PREFETCH_FILES", 4))
+# Decrypted chunks buffered per prefetched file: memory is bounded by files * chunks * chunk size
+ARCHIVE_PREFETCH_CHUNKS = 4
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Makes a file or folder name safe to use as one path component inside the archive
+def _safe_name(
+    name: str
+) -> str:
+    name = name.replace("/", "_").replace("\\", "_").strip()
+    return name if name not in ("", ".", "..") else "_"
+
+# Returns a name not used yet in the same directory of the archive: "a.txt", "a (1).txt", ...
+def _unique_name(
+    name: str,
+    used: set
+) -> str:
+    candidate = name
+    stem, dot, ext = name.rpartition(".")
+    if not stem:
+        stem, dot, ext = name, "", ""
+    counter = 1
+    while candidate.lower() in used:
+        candidate = f"{stem} ({counter}){dot}{ext}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+# Files whose content can be handed out: pending and infected files are not archived
+def _is_available(
+    file: File
+) -> bool:
+    return not file.is_infected and file.scan_status == ScanStatus.clean.value
+
+# Collects the archive entries of a folder subtree: [(path in the archive, file)].
+# All folders of the user are loaded with one query and the subtree is walked in memory,
+# then the files of the subtree are loaded with one more query.
+async def get_folder_archive_entries(
+    db: AsyncSession,
+    user_id: UUID,
+    folder_id: UUID
+) -> Tuple[str, List[Tuple[str, File]]]:
+    result = await db.execute(select(Folder).where(Folder.user_id == user_id))
+    folders = {folder.id: folder for folder in result.scalars().all()}
+    root = folders.get(folder_id)
+    if not root:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    children = {}
+    for folder in folders.values():
+        children.setdefault(folder.parent_id, []).append(folder)
+    root_name = _safe_name(root.name)
+    paths = {root.id: root_name}
+    used_names = {root.id: set()}
+    queue = deque([root.id])
+    while queue:
+        parent_id = queue.popleft()
+        for child in sorted(children.get(parent_id, []), key=lambda folder: folder.name):
+            name = _unique_name(_safe_name(child.name), used_names[parent_id])
+            paths[child.id] = f"{paths[parent_id]}/{name}"
+            used_names[child.id] = set()
+            queue.append(child.id)
+    result = await db.execute(
+        select(File)
+        .where(File.folder_id.in_(list(paths)), File.user_id == user_id, File.is_deleted == False)
+        .order_by(File.folder_id, File.filename)
+    )
+    entries = []
+    for file in result.scalars().all():
+        if not _is_available(file):
+            continue
+        name = _unique_name(_safe_name(file.filename), used_names[file.folder_id])
+        entries.append((f"{paths[file.folder_id]}/{name}", file))
+    return root_name, entries
+
+# Collects the archive entries of selected files of the user (flat, in the requested order)
+async def get_files_archive_entries(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID]
+) -> List[Tuple[str, File]]:
+    files = await get_files_by_ids(db, user_id, file_ids)
+    used = set()
+    return [
+        (_unique_name(_safe_name(files[file_id].filename), used), files[file_id])
+        for file_id in dict.fromkeys(file_ids)
+        if file_id in files and _is_available(files[file_id])
+    ]
+
+# Fetches a file from MinIO and puts its decrypted chunks into the queue.
+# None marks the end of the file, an exception is passed to the writer as is.
+async def _fetch_file(
+    file: File,
+    file_enc,
+    queue: asyncio.Queue
+) -> None:
+    try:
+        # Key derivation of per-user encrypted files is CPU-bound, keep it off the event loop
+        decryptor = await asyncio.to_thread(build_file_decryptor, file, file_enc)
+        async for chunk in iter_object_chunks(file.path, ARCHIVE_CHUNK_SIZE):
+            data = decryptor.update(chunk)
+            if data:
+                await queue.put(data)
+        tail = decryptor.finalize()
+        if tail:
+            await queue.put(tail)
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+# Streams a ZIP archive of the entries as a download. Encryption params are loaded before the response starts,
+# so the stream only needs MinIO. Up to ARCHIVE_PREFETCH_FILES files are fetched concurrently,
+# each with a bounded buffer, so memory use does not depend on the size of the archive.
+async def stream_archive(
+    db: AsyncSession,
+    entries: List[Tuple[str, File]],
+    archive_name: str
+) -> StreamingResponse:
+    encryption = await get_encryption_params(db, [file.id for _, file in entries])
+    return StreamingResponse(
+        _archive_chunks(entries, encryption),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(archive_name)}.zip"}
+    )
+
+# Yields the archive bytes while the prefetched files are written into it one by one
+async def _archive_chunks(
+    entries: List[Tuple[str, File]],
+    encryption: dict
+):
+    writer = ZipStreamWriter()
+    remaining = iter(entries)
+    pending = deque()
+
+    def prefetch_next():
+        entry = next(remaining, None)
+        if entry:
+            queue = asyncio.Queue(ARCHIVE_PREFETCH_CHUNKS)
+            task = asyncio.create_task(_fetch_file(entry[1], encryption.get(entry[1].id), queue))
+            pending.append((entry, queue, task))
+
+    for _ in range(ARCHIVE_PREFETCH_FILES):
+        prefetch_next()
+    # The fetch of the entry being written is no longer in pending but must be cancelled too
+    current = None
+    try:
+        while pending:
+            (name, file), queue, current = pending.popleft()
+            writer.start_entry(name, file.size, file.uploaded_at.timestamp() if file.uploaded_at else None)
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    # The response has already started: abort it instead of sending a corrupted archive
+                    logger.error(f"Failed to archive file {file.id}: {chunk}")
+                    raise chunk
+                writer.write(chunk)
+                yield writer.drain()
+            writer.end_entry()
+            yield writer.drain()
+            prefetch_next()
+        writer.close()
+        yield writer.drain()
+    finally:
+        if current:
+            current.cancel()
+        for _, _, task in pending:
+            task.cancel()
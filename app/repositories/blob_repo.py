@@ -0,0 +1,131 @@
+# sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import update, delete, func, exists
+from sqlalchemy.dialects import postgresql, sqlite
+# app
+from app.models.blob import Blob
+from app.models.file import File
+from app.core.encryption import encrypt_convergent
+from app.utils.minio_utils import upload_bytes_to_minio, remove_object_from_minio
+# other
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Object name of a blob in MinIO; the two-character prefix spreads blobs over many "directories"
+def blob_object_name(
+    content_hash: str
+) -> str:
+    return f"blobs/{content_hash[:2]}/{content_hash}"
+
+# Gets a blob by its content hash
+async def get_blob(
+    db: AsyncSession,
+    content_hash: str
+) -> Optional[Blob]:
+    result = await db.execute(select(Blob).where(Blob.hash == content_hash))
+    return result.scalar_one_or_none()
+
+# Adds a reference to an existing blob. Returns False if there is no such blob.
+# The UPDATE takes the row lock, so it waits for a concurrent purge of the same blob to finish.
+async def acquire_blob(
+    db: AsyncSession,
+    content_hash: str
+) -> bool:
+    result = await db.execute(
+        update(Blob)
+        .where(Blob.hash == content_hash)
+        .values(refcount=Blob.refcount + 1)
+    )
+    return result.rowcount == 1
+
+# Stores content as a blob and adds a reference to it; returns the object name in MinIO.
+# If the blob already exists, nothing is encrypted or uploaded.
+# The caller commits the transaction together with the File row.
+async def store_blob(
+    db: AsyncSession,
+    content: bytes,
+    content_hash: str
+) -> str:
+    path = blob_object_name(content_hash)
+    if await acquire_blob(db, content_hash):
+        return path
+    # Convergent ciphertext is deterministic, so a concurrent upload of the same content writes identical bytes
+    await upload_bytes_to_minio(path, encrypt_convergent(content, content_hash), "application/octet-stream")
+    await insert_blob(db, content_hash, len(content))
+    return path
+
+# Registers an uploaded blob with the given number of references (or adds them if the blob was registered concurrently)
+async def insert_blob(
+    db: AsyncSession,
+    content_hash: str,
+    size: int,
+    references: int = 1
+) -> None:
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    await db.execute(
+        insert(Blob)
+        .values(hash=content_hash, path=blob_object_name(content_hash), size=size, refcount=references)
+        .on_conflict_do_update(index_elements=[Blob.hash], set_={"refcount": Blob.refcount + references})
+    )
+
+# Releases the blob references of files matching the criteria (call before hard-deleting them).
+# Blobs left without references are removed by purge_unreferenced_blobs.
+async def release_blobs(
+    db: AsyncSession,
+    *criteria
+) -> None:
+    result = await db.execute(
+        select(File.blob_hash, func.count(File.id))
+        .where(File.blob_hash.isnot(None), *criteria)
+        .group_by(File.blob_hash)
+    )
+    for content_hash, references in result.all():
+        await release_blob(db, content_hash, references)
+
+# Releases references to one blob taken with acquire_blob
+async def release_blob(
+    db: AsyncSession,
+    content_hash: str,
+    references: int = 1
+) -> None:
+    await db.execute(
+        update(Blob)
+        .where(Blob.hash == content_hash)
+        .values(refcount=Blob.refcount - references)
+    )
+
+# Removes blobs that have no references from the database and MinIO. Returns the number of removed blobs.
+# Each blob is deleted in its own transaction: the row stays locked until the object is gone,
+# so a concurrent upload either re-acquires the blob before the purge or uploads it again after it.
+async def purge_unreferenced_blobs(
+    db: AsyncSession,
+    limit: int = 1000
+) -> int:
+    result = await db.execute(
+        select(Blob.hash)
+        .where(Blob.refcount <= 0, ~exists().where(File.blob_hash == Blob.hash))
+        .limit(limit)
+    )
+    purged = 0
+    for content_hash in result.scalars().all():
+        deleted = await db.execute(
+            delete(Blob)
+            .where(Blob.hash == content_hash, Blob.refcount <= 0)
+            .returning(Blob.path)
+        )
+        path = deleted.scalar_one_or_none()
+        if path is None:
+            await db.rollback()
+            continue
+        try:
+            await remove_object_from_minio(path)
+        except Exception as e:
+            logger.error(f"Failed to remove blob {content_hash} from MinIO: {e}")
+            await db.rollback()
+            continue
+        await db.commit()
+        purged += 1
+    return purged
@@ -1,17 +1,29 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import update, func
-from app.models.file import File
+from app.models.file import File, ScanStatus, EncryptionMode
 from app.models.file_encryption import FileEncryption
-from uuid import UUID
-from typing import Optional, List
-from app.utils.minio_utils import get_presigned_url as minio_get_presigned_url, get_bytes_from_minio
-from app.utils.minio_multipart import initiate_multipart_upload, upload_part, complete_multipart_upload, stat_object
-from datetime import datetime, timezone
+from uuid import UUID, uuid4
+from typing import Callable, Optional, List, BinaryIO
+import os
+import asyncio
+import logging
+from app.utils.minio_utils import get_bytes_from_minio, remove_object_from_minio
+from app.utils.presign import get_presigned_get_url
+from app.utils.content_cache import content_cache, content_version
+from app.utils.ranged_response import RangedContentResponse
+from app.utils.previews import preview_kind, preview_object_name, PREVIEW_MEDIA_TYPE, PREVIEW_VERSION
+from app.utils.http_cache import etag_matches, is_not_modified, file_content_etag, http_date, mark_user_changed, REVALIDATE_CACHE_CONTROL
+from app.utils.minio_multipart import initiate_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload, stat_object, get_presigned_part_urls, list_parts
+from datetime import datetime, timezone, timedelta
+from fastapi import HTTPException
 from fastapi.responses import Response
-from app.core.encryption import decrypt_file
+from app.core.encryption import FileDecryptor, CTRDecryptor, PassthroughDecryptor, generate_key, convergent_params, ctr_key, ctr_cipher_at, ctr_transform_at, decrypt_derivative
+from app.repositories import blob_repo
+from app.utils.redis_client import store_upload_info, get_upload_info, store_upload_part, delete_upload_info, reserve_storage, release_storage, get_reserved_storage
+from app.schemas.file import MAX_PART_COUNT
 
-UPLOADS = {}
+logger = logging.getLogger(__name__)
 
 # Creates a record about the file in the database
 async def create_file(
@@ -21,21 +33,49 @@ async def create_file(
     size: int,
     content_type: str,
     path: str,
-    folder_id: Optional[UUID] = None
+    folder_id: Optional[UUID] = None,
+    scan_status: str = ScanStatus.clean.value,
+    blob_hash: Optional[str] = None,
+    encryption_mode: str = EncryptionMode.cbc.value,
+    encryption_salt: Optional[bytes] = None,
+    encryption_iv: Optional[bytes] = None
 ):
+    now = datetime.now(timezone.utc)
     db_file = File(
         filename=filename,
         user_id=user_id,
         size=size,
         content_type=content_type,
         path=path,
-        folder_id=folder_id
+        folder_id=folder_id,
+        scan_status=scan_status,
+        uploaded_at=now,
+        # A file scanned inline is scanned when it is uploaded; get_scan_stats leaves it out of the latency
+        scanned_at=now if scan_status != ScanStatus.pending_scan.value else None,
+        blob_hash=blob_hash,
+        encryption_mode=encryption_mode
     )
     db.add(db_file)
+    # Per-file encryption params are written in the same transaction as the file
+    if encryption_salt is not None:
+        await db.flush()
+        db.add(FileEncryption(file_id=db_file.id, encryption_salt=encryption_salt, encryption_iv=encryption_iv))
     await db.commit()
     await db.refresh(db_file)
+    await mark_user_changed(user_id)
     return db_file
 
+# Raises HTTPException if the file content must not be handed out (pending scan, infected or not scannable)
+def ensure_file_available(
+    file: File
+) -> None:
+    if file.is_infected or file.scan_status == ScanStatus.infected.value:
+        raise HTTPException(status_code=403, detail="File is infected with a virus")
+    if file.scan_status == ScanStatus.pending_scan.value:
+        raise HTTPException(status_code=409, detail="File is pending antivirus scan")
+    if file.scan_status == ScanStatus.scan_failed.value:
+        raise HTTPException(status_code=409, detail="File could not be scanned for viruses")
+
 # Gets a file by its ID
 async def get_file(
     db: AsyncSession,
@@ -83,20 +123,27 @@ async def delete_file(
     file.is_deleted = True
     file.deleted_at = datetime.now(timezone.utc)
     await db.commit()
+    content_cache.invalidate(file.id)
+    await mark_user_changed(file.user_id)
     return file
 
-# Moves a file to another folder
+# Moves a file to another folder, returns the owner's id (None if the file does not exist)
 async def move_file(
     db: AsyncSession, 
     file_id: UUID, 
     new_folder_id: Optional[UUID]
 ):
-    await db.execute(
+    result = await db.execute(
         update(File)
         .where(File.id == file_id)
         .values(folder_id=new_folder_id)
+        .returning(File.user_id)
     )
+    user_id = result.scalar_one_or_none()
     await db.commit()
+    if user_id:
+        await mark_user_changed(user_id)
+    return user_id
 
 # Gets the total amount of space occupied by the user
 async def get_user_storage_usage(
@@ -108,6 +155,34 @@ async def get_user_storage_usage(
     )
     return result.scalar_one()
 
+# Gets how many more bytes the user can store: the limit minus used space and quota reserved by uploads in progress.
+# Raises HTTPException if the settings are missing.
+async def get_available_storage(
+    db: AsyncSession,
+    user_id: UUID
+) -> int:
+    from app.repositories.user_settings_repo import get_cached_settings_by_user
+    settings = await get_cached_settings_by_user(db, user_id)
+    if not settings:
+        raise HTTPException(status_code=400, detail="User settings not found")
+    used_size = await get_user_storage_usage(db, user_id)
+    try:
+        reserved_size = await get_reserved_storage(str(user_id))
+    except Exception:
+        # Without Redis there are no multipart uploads in progress to account for
+        reserved_size = 0
+    return settings.storage_limit - used_size - reserved_size
+
+# Checks that the user can store size more bytes: used space plus quota reserved by uploads in progress.
+# Raises HTTPException if the settings are missing or the limit would be exceeded.
+async def ensure_storage_available(
+    db: AsyncSession,
+    user_id: UUID,
+    size: int
+) -> None:
+    if size > await get_available_storage(db, user_id):
+        raise HTTPException(status_code=400, detail="Storage limit exceeded")
+
 # Restores a file from the Recycle Bin if there is enough space
 async def restore_file(
     db: AsyncSession, 
@@ -121,8 +196,8 @@ async def restore_file(
     if not file.is_deleted:
         return file  # Already restored
     # Check storage limit
-    from app.repositories.user_settings_repo import get_settings_by_user
-    settings = await get_settings_by_user(db, file.user_id)
+    from app.repositories.user_settings_repo import get_cached_settings_by_user
+    settings = await get_cached_settings_by_user(db, file.user_id)
     if not settings:
         raise Exception("User settings not found")
     used_size = await get_user_storage_usage(db, file.user_id)
@@ -132,8 +207,106 @@ async def restore_file(
     file.deleted_at = None
     await db.commit()
     await db.refresh(file)
+    await mark_user_changed(file.user_id)
     return file
 
+# Per-id result of a bulk operation: ids changed by the statement get success_status,
+# the rest get the reason they were skipped
+def _bulk_result(
+    file_ids: List[UUID],
+    changed: set,
+    success_status: str,
+    skipped: Optional[dict] = None
+) -> dict:
+    skipped = skipped or {}
+    results = [
+        {"id": file_id, "status": success_status if file_id in changed else skipped.get(file_id, "not_found")}
+        for file_id in dict.fromkeys(file_ids)
+    ]
+    return {"results": results, "succeeded": len(changed), "failed": len(results) - len(changed)}
+
+# Moves many files of the user to another folder with one UPDATE
+async def bulk_move_files(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID],
+    new_folder_id: Optional[UUID]
+) -> dict:
+    if new_folder_id is not None:
+        from app.repositories.folder_repo import get_folder
+        folder = await get_folder(db, new_folder_id)
+        if not folder or folder.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Folder not found")
+    result = await db.execute(
+        update(File)
+        .where(File.id.in_(file_ids), File.user_id == user_id, File.is_deleted == False)
+        .values(folder_id=new_folder_id)
+        .returning(File.id)
+    )
+    changed = set(result.scalars().all())
+    await db.commit()
+    if changed:
+        await mark_user_changed(user_id)
+    return _bulk_result(file_ids, changed, "moved")
+
+# Moves many files of the user to the Recycle Bin with one UPDATE
+async def bulk_delete_files(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID]
+) -> dict:
+    result = await db.execute(
+        update(File)
+        .where(File.id.in_(file_ids), File.user_id == user_id, File.is_deleted == False)
+        .values(is_deleted=True, deleted_at=datetime.now(timezone.utc))
+        .returning(File.id)
+    )
+    changed = set(result.scalars().all())
+    await db.commit()
+    for file_id in changed:
+        content_cache.invalidate(file_id)
+    if changed:
+        await mark_user_changed(user_id)
+    return _bulk_result(file_ids, changed, "deleted")
+
+# Restores many files of the user from the Recycle Bin with one UPDATE.
+# The quota is checked in one pass: files are taken in the requested order while they fit
+# into the available space, the rest are reported as storage_limit_exceeded.
+async def bulk_restore_files(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID]
+) -> dict:
+    result = await db.execute(
+        select(File.id, File.size)
+        .where(File.id.in_(file_ids), File.user_id == user_id, File.is_deleted == True)
+    )
+    sizes = dict(result.all())
+    available = await get_available_storage(db, user_id)
+    accepted = []
+    skipped = {}
+    for file_id in dict.fromkeys(file_ids):
+        if file_id not in sizes:
+            continue
+        if sizes[file_id] > available:
+            skipped[file_id] = "storage_limit_exceeded"
+            continue
+        available -= sizes[file_id]
+        accepted.append(file_id)
+    changed = set()
+    if accepted:
+        result = await db.execute(
+            update(File)
+            .where(File.id.in_(accepted), File.user_id == user_id, File.is_deleted == True)
+            .values(is_deleted=False, deleted_at=None)
+            .returning(File.id)
+        )
+        changed = set(result.scalars().all())
+    await db.commit()
+    if changed:
+        await mark_user_changed(user_id)
+    return _bulk_result(file_ids, changed, "restored", skipped)
+
 # Gets user statistics: number of files, total size, top 10 files by size
 async def get_file_stats(
     db: AsyncSession, 
@@ -163,18 +336,86 @@ async def get_file_stats(
     }
 get_file_stats_by_user = get_file_stats
 
-# Gets a presigned URL to download a file from MinIO
+# Gets a presigned URL to download a file of the user from MinIO.
+# URLs are signed locally and reused from the cache while enough of their lifetime remains.
 async def get_presigned_url(
     db: AsyncSession, 
     file_id: UUID, 
-    expires_in: int = 3600
+    expires_in: int = 3600,
+    user_id: Optional[UUID] = None
 ):
-    result = await db.execute(select(File).where(File.id == file_id, File.is_deleted == False))
+    query = select(File).where(File.id == file_id, File.is_deleted == False)
+    if user_id is not None:
+        query = query.where(File.user_id == user_id)
+    result = await db.execute(query)
     file = result.scalar_one_or_none()
     if not file:
         raise Exception("File not found or is deleted")
-    url = await minio_get_presigned_url(file.path, expires_in)
-    return {"url": url}
+    ensure_file_available(file)
+    return {"url": get_presigned_get_url(file.path, expires_in)}
+
+# Gets files of the user by ids with one query; deleted files are not returned
+async def get_files_by_ids(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID]
+) -> dict:
+    result = await db.execute(
+        select(File).where(File.id.in_(file_ids), File.user_id == user_id, File.is_deleted == False)
+    )
+    return {file.id: file for file in result.scalars().all()}
+
+# Signs URLs for loaded files in one pass. Returns the URLs by file id and the reasons
+# files were skipped (pending scan or infected).
+def _presign_files(
+    files: List[File],
+    expires_in: int
+) -> tuple:
+    urls = {}
+    errors = {}
+    for file in files:
+        try:
+            ensure_file_available(file)
+        except HTTPException as e:
+            errors[file.id] = e.detail
+            continue
+        urls[file.id] = get_presigned_get_url(file.path, expires_in)
+    return urls, errors
+
+# Gets presigned URLs for many files of the user with one query.
+# Returns the URLs by file id and the reasons files were skipped (missing, deleted, pending scan or infected).
+async def get_presigned_urls(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID],
+    expires_in: int = 3600
+) -> dict:
+    files = await get_files_by_ids(db, user_id, file_ids)
+    urls, errors = _presign_files(list(files.values()), expires_in)
+    for file_id in file_ids:
+        if file_id not in files:
+            errors[file_id] = "File not found or is deleted"
+    return {"urls": urls, "errors": errors}
+
+# Gets metadata of many files of the user with one query, optionally with presigned URLs.
+# Files are returned in the order of the ids; ids of missing or deleted files are listed separately.
+async def get_files_batch(
+    db: AsyncSession,
+    user_id: UUID,
+    file_ids: List[UUID],
+    include_urls: bool = False,
+    expires_in: int = 3600
+) -> dict:
+    files = await get_files_by_ids(db, user_id, file_ids)
+    ordered = [files[file_id] for file_id in dict.fromkeys(file_ids) if file_id in files]
+    urls, errors = _presign_files(ordered, expires_in) if include_urls else ({}, {})
+    return {
+        "files": [
+            {"file": file, "url": urls.get(file.id), "url_error": errors.get(file.id)}
+            for file in ordered
+        ],
+        "missing": [file_id for file_id in dict.fromkeys(file_ids) if file_id not in files]
+    }
 
 # Gets a list of the user's files in the trash
 async def get_trash_files(
@@ -204,18 +445,112 @@ async def search_files(
     result = await db.execute(query)
     return result.scalars().all()
 
-# Initiates a multipart file download (MinIO)
+# Number of parts of a multipart upload with the given declared size and part size
+def get_part_count(
+    size: int,
+    part_size: int
+) -> int:
+    return max(1, -(-size // part_size))
+
+# Lifetime of presigned UploadPart URLs for direct uploads
+DIRECT_UPLOAD_URL_EXPIRES = 60 * 60 * 6 # 6 hours
+
+# Initiates a multipart file download (MinIO).
+# The session is kept in Redis, so chunks can be sent to any worker or pod. The declared size is
+# reserved from the storage quota until the upload is completed or aborted.
+# Proxy uploads are encrypted part by part with AES-CTR on the way to MinIO.
+# In "direct" mode the response contains presigned UploadPart URLs and the object is encrypted by MinIO (SSE).
 async def initiate_upload(
     db,
     user_id, 
     request_data
 ):
-    object_name = f"{user_id}/uploads/{request_data.filename}"
-    upload_id = await initiate_multipart_upload(object_name)
-    UPLOADS[upload_id] = object_name
-    return {"upload_id": upload_id, "object_name": object_name}
+    part_count = get_part_count(request_data.size, request_data.part_size)
+    if part_count > MAX_PART_COUNT:
+        raise HTTPException(status_code=400, detail=f"Too many parts ({part_count}), increase part_size")
+    existing_file = await get_file_by_name_and_folder(db, request_data.filename, user_id, request_data.folder_id)
+    if existing_file:
+        raise HTTPException(status_code=409, detail="File with this name already exists in the folder")
+    await ensure_storage_available(db, user_id, request_data.size)
+    direct = request_data.mode == "direct"
+    # A unique object per upload: uploads of files with the same name never overwrite each other
+    object_name = f"{user_id}/uploads/{uuid4()}"
+    upload_id = await initiate_multipart_upload(object_name, server_side_encryption=direct)
+    await reserve_storage(str(user_id), upload_id, request_data.size)
+    await store_upload_info(
+        upload_id,
+        object_name,
+        str(user_id),
+        size=request_data.size,
+        filename=request_data.filename,
+        content_type=request_data.content_type,
+        folder_id=str(request_data.folder_id) if request_data.folder_id else None,
+        part_size=request_data.part_size,
+        mode=request_data.mode,
+        encryption_salt=None if direct else os.urandom(16).hex(),
+        encryption_iv=None if direct else os.urandom(16).hex()
+    )
+    response = {"upload_id": upload_id, "object_name": object_name, "part_size": request_data.part_size, "part_count": part_count}
+    if direct:
+        response["part_urls"] = await get_presigned_part_urls(object_name, upload_id, part_count, DIRECT_UPLOAD_URL_EXPIRES)
+    return response
+
+# Gets the parts received for an upload session: tracked in Redis, or listed in MinIO for direct uploads
+async def get_received_parts(
+    upload_id: str,
+    info: dict
+) -> dict:
+    if info.get("mode") == "direct":
+        return await list_parts(info["object_name"], upload_id)
+    return info["parts"]
+
+# Gets the multipart upload session of the user, raises HTTPException if there is none
+async def get_upload_session(
+    user_id,
+    upload_id: str
+) -> dict:
+    info = await get_upload_info(upload_id)
+    if not info:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if info["user_id"] != str(user_id):
+        raise HTTPException(status_code=403, detail="Upload session belongs to another user")
+    return info
+
+# Gets the state of a multipart upload: received parts and parts still missing, so the client can resume
+async def get_upload_status(
+    user_id,
+    upload_id: str
+) -> dict:
+    info = await get_upload_session(user_id, upload_id)
+    parts = await get_received_parts(upload_id, info)
+    part_count = get_part_count(info["size"], info["part_size"]) if info.get("part_size") else None
+    return {
+        "upload_id": upload_id,
+        "object_name": info["object_name"],
+        "size": info.get("size"),
+        "part_size": info.get("part_size"),
+        "part_count": part_count,
+        "received_bytes": sum(part["size"] for part in parts.values()),
+        "received_parts": [
+            {"part_number": number, "etag": part["etag"], "size": part["size"]}
+            for number, part in sorted(parts.items())
+        ],
+        "missing_parts": [number for number in range(1, part_count + 1) if number not in parts] if part_count else []
+    }
+
+# Encrypts a part at its byte offset in the file (AES-CTR is seekable, so parts are independent)
+def _encrypt_part(
+    info: dict,
+    offset: int,
+    data: bytes
+) -> bytes:
+    salt = bytes.fromhex(info["encryption_salt"])
+    iv = bytes.fromhex(info["encryption_iv"])
+    return ctr_transform_at(ctr_key(salt), iv, offset, data)
 
-# Uploads a portion of a file as part of a multipart upload
+# Uploads a portion of a file as part of a multipart upload.
+# Chunks of arbitrary size must be sent in order, because the offset of a chunk in the file
+# (needed for encryption) is the total size of the previous ones.
 async def upload_chunk(
     db,
     user_id, 
@@ -223,61 +558,306 @@ async def upload_chunk(
     part_number, 
     file_chunk
 ):
-    object_name = UPLOADS.get(upload_id)
-    if not object_name:
-        raise Exception("Upload session not found")
+    info = await get_upload_session(user_id, upload_id)
+    if info.get("mode") == "direct":
+        raise HTTPException(status_code=400, detail="Parts of a direct upload are sent to the presigned URLs")
+    parts = info["parts"]
+    if any(number not in parts for number in range(1, part_number)):
+        raise HTTPException(status_code=400, detail="Chunks must be sent in order, use PUT /files/uploads/{upload_id}/parts/{part_number} for parallel uploads")
     data = await file_chunk.read()
-    etag = await upload_part(object_name, upload_id, part_number, data)
+    if any(number > part_number for number in parts) and parts.get(part_number, {}).get("size") != len(data):
+        raise HTTPException(status_code=400, detail="A re-sent chunk must keep its size")
+    # Parts may be re-sent, so the re-sent part replaces the previous one in the total
+    received = sum(part["size"] for number, part in parts.items() if number != part_number)
+    if info.get("size") is not None and received + len(data) > info["size"]:
+        raise HTTPException(status_code=413, detail="Upload exceeds the declared file size")
+    offset = sum(parts[number]["size"] for number in range(1, part_number))
+    etag = await upload_part(info["object_name"], upload_id, part_number, _encrypt_part(info, offset, data))
+    await store_upload_part(upload_id, part_number, etag, len(data), offset)
     return {"etag": etag}
 
-# Completes the multipart download and creates a file entry
+# Uploads one part of a multipart upload from the raw request body.
+# Parts may arrive in any order and in parallel; each one must have exactly its expected length
+# (part_size, or the remainder for the last part), so a resumed upload always produces the same layout.
+# The body is encrypted chunk by chunk into one preallocated buffer of the part size (at most MAX_PART_SIZE):
+# S3 signs the payload of UploadPart, so the part has to be complete before it is sent to MinIO.
+async def upload_part_stream(
+    user_id,
+    upload_id: str,
+    part_number: int,
+    body,
+    content_length: Optional[int] = None
+) -> dict:
+    info = await get_upload_session(user_id, upload_id)
+    if info.get("mode") == "direct":
+        raise HTTPException(status_code=400, detail="Parts of a direct upload are sent to the presigned URLs")
+    if not info.get("part_size"):
+        raise HTTPException(status_code=400, detail="Upload session was created without part_size")
+    part_count = get_part_count(info["size"], info["part_size"])
+    if not 1 <= part_number <= part_count:
+        raise HTTPException(status_code=400, detail=f"Part number must be between 1 and {part_count}")
+    expected = info["part_size"] if part_number < part_count else info["size"] - info["part_size"] * (part_count - 1)
+    if content_length is not None and content_length != expected:
+        raise HTTPException(status_code=400, detail=f"Part {part_number} must be {expected} bytes")
+    offset = info["part_size"] * (part_number - 1)
+    encryptor = ctr_cipher_at(ctr_key(bytes.fromhex(info["encryption_salt"])), bytes.fromhex(info["encryption_iv"]), offset)
+    buffer = bytearray(expected)
+    received = 0
+    async for chunk in body:
+        if received + len(chunk) > expected:
+            raise HTTPException(status_code=413, detail=f"Part {part_number} must be {expected} bytes")
+        buffer[received:received + len(chunk)] = encryptor.update(chunk)
+        received += len(chunk)
+    if received != expected:
+        raise HTTPException(status_code=400, detail=f"Part {part_number} must be {expected} bytes")
+    etag = await upload_part(info["object_name"], upload_id, part_number, buffer)
+    await store_upload_part(upload_id, part_number, etag, expected, offset)
+    return {"part_number": part_number, "etag": etag, "size": expected}
+
+# Completes the multipart download and creates a file entry.
+# Parts are taken from the server-side session (or listed in MinIO for direct uploads);
+# parts sent by the client must match it. The file is registered in the folder given at initiation
+# as pending_scan: the background scan streams it from MinIO before it becomes available.
 async def complete_upload(
     db, 
     user_id, 
     completion_data
 ):
+    info = await get_upload_session(user_id, completion_data.upload_id)
+    if completion_data.object_name != info["object_name"]:
+        raise HTTPException(status_code=400, detail="Object name does not match the upload session")
+    direct = info.get("mode") == "direct"
+    parts = await get_received_parts(completion_data.upload_id, info)
+    if completion_data.parts:
+        for part in completion_data.parts:
+            if parts.get(part.part_number, {}).get("etag") != part.etag:
+                raise HTTPException(status_code=400, detail=f"Part {part.part_number} was not received")
+        parts = {part.part_number: parts[part.part_number] for part in completion_data.parts}
+    if info.get("part_size"):
+        missing = [number for number in range(1, get_part_count(info["size"], info["part_size"]) + 1) if number not in parts]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing parts: {missing}")
+    if not parts:
+        raise HTTPException(status_code=400, detail="No parts received")
+    if sum(part["size"] for part in parts.values()) != info["size"]:
+        raise HTTPException(status_code=400, detail="Uploaded parts do not match the declared file size")
+    # Encrypted parts must be contiguous, otherwise the file can not be decrypted as one stream
+    offset = 0
+    for number, part in sorted(parts.items()):
+        if not direct and part.get("offset") != offset:
+            raise HTTPException(status_code=400, detail=f"Part {number} does not follow the previous parts")
+        offset += part["size"]
+    folder_id = UUID(info["folder_id"]) if info.get("folder_id") else None
+    filename = info.get("filename") or info["object_name"].split("/")[-1]
+    existing_file = await get_file_by_name_and_folder(db, filename, user_id, folder_id)
+    if existing_file:
+        raise HTTPException(status_code=409, detail="File with this name already exists in the folder")
     await complete_multipart_upload(
-        completion_data.object_name,
+        info["object_name"],
         completion_data.upload_id,
-        [part.model_dump() for part in completion_data.parts]
+        [{"part_number": number, "etag": part["etag"]} for number, part in sorted(parts.items())]
+    )
+    # The session and the reserved quota are only dropped once the file is registered
+    try:
+        stat = await stat_object(info["object_name"])
+        db_file = await create_file(
+            db,
+            filename=filename,
+            user_id=user_id,
+            size=stat.get("ContentLength", info["size"]),
+            content_type=info.get("content_type") or "application/octet-stream",
+            path=info["object_name"],
+            folder_id=folder_id,
+            scan_status=ScanStatus.pending_scan.value,
+            # Direct uploads are encrypted by MinIO, proxied ones part by part with AES-CTR
+            encryption_mode=EncryptionMode.sse.value if direct else EncryptionMode.ctr.value,
+            encryption_salt=None if direct else bytes.fromhex(info["encryption_salt"]),
+            encryption_iv=None if direct else bytes.fromhex(info["encryption_iv"])
+        )
+    except BaseException:
+        # A completed multipart upload can not be completed again: the object is removed
+        # so no unregistered content stays in storage, and the upload ends like an abort
+        try:
+            await remove_object_from_minio(info["object_name"])
+        except Exception as e:
+            logger.warning(f"Failed to remove object {info['object_name']} of failed upload: {e}")
+        await delete_upload_info(completion_data.upload_id)
+        await release_storage(str(user_id), completion_data.upload_id)
+        raise
+    await delete_upload_info(completion_data.upload_id)
+    await release_storage(str(user_id), completion_data.upload_id)
+    return db_file
+
+# Aborts a multipart upload of the user: removes the received parts from MinIO,
+# the session from Redis and releases the reserved storage quota
+async def abort_upload(
+    user_id,
+    upload_id: str
+) -> None:
+    info = await get_upload_session(user_id, upload_id)
+    await abort_multipart_upload(info["object_name"], upload_id)
+    await delete_upload_info(upload_id)
+    await release_storage(str(user_id), upload_id)
+
+# Creates a decryptor for the file content according to its encryption mode
+async def get_file_decryptor(
+    db: AsyncSession,
+    file: File
+) -> FileDecryptor:
+    file_enc = None
+    if file.encryption_mode not in (EncryptionMode.convergent.value, EncryptionMode.sse.value):
+        # Per-file encryption: salt and iv are stored in file_encryption
+        result_enc = await db.execute(select(FileEncryption).where(FileEncryption.file_id == file.id))
+        file_enc = result_enc.scalar_one_or_none()
+    return build_file_decryptor(file, file_enc)
+
+# Creates a decryptor for the file content from already loaded encryption params
+# (file_enc is only needed for per-file encryption modes)
+def build_file_decryptor(
+    file: File,
+    file_enc: Optional[FileEncryption]
+) -> FileDecryptor:
+    if file.encryption_mode == EncryptionMode.convergent.value:
+        return FileDecryptor(*convergent_params(file.blob_hash))
+    if file.encryption_mode == EncryptionMode.sse.value:
+        return PassthroughDecryptor()
+    if not file_enc:
+        raise Exception("Encryption params not found")
+    if file.encryption_mode == EncryptionMode.ctr.value:
+        return CTRDecryptor(ctr_key(file_enc.encryption_salt), file_enc.encryption_iv)
+    return FileDecryptor(generate_key(str(file.user_id), file_enc.encryption_salt), file_enc.encryption_iv)
+
+# Loads the per-file encryption params of many files with one query: {file_id: FileEncryption}
+async def get_encryption_params(
+    db: AsyncSession,
+    file_ids: List[UUID]
+) -> dict:
+    if not file_ids:
+        return {}
+    result = await db.execute(select(FileEncryption).where(FileEncryption.file_id.in_(file_ids)))
+    return {file_enc.file_id: file_enc for file_enc in result.scalars().all()}
+
+# Registers a file by content hash without uploading bytes.
+# Only content the user already stores (in a clean file) can be claimed, otherwise knowing
+# a hash would be enough to read another user's file. Returns None if the content is unknown.
+async def create_file_from_hash(
+    db: AsyncSession,
+    user_id: UUID,
+    content_hash: str,
+    size: int,
+    filename: str,
+    content_type: str,
+    folder_id: Optional[UUID] = None
+) -> Optional[File]:
+    result = await db.execute(
+        select(File).where(
+            File.user_id == user_id,
+            File.blob_hash == content_hash,
+            File.size == size,
+            File.scan_status == ScanStatus.clean.value
+        ).limit(1)
     )
-    filename = getattr(completion_data, "file_name", None) or completion_data.object_name.split("/")[-1]
-    content_type = getattr(completion_data, "content_type", "application/octet-stream")
-    stat = await stat_object(completion_data.object_name)
-    size = stat["ContentLength"] if "ContentLength" in stat else 0
+    source = result.scalar_one_or_none()
+    if not source or not await blob_repo.acquire_blob(db, content_hash):
+        return None
     return await create_file(
         db,
         filename=filename,
         user_id=user_id,
-        size=size,
+        size=source.size,
         content_type=content_type,
-        path=completion_data.object_name,
-        folder_id=None
+        path=source.path,
+        folder_id=folder_id,
+        blob_hash=content_hash,
+        encryption_mode=EncryptionMode.convergent.value
     )
 
-# Downloads and decrypts the file, returns as an HTTP response
-async def download_file(db: AsyncSession, file_id: UUID):
+# Gets decrypted content of a small file from the hot-object cache: bytes, an open file of the disk tier
+# or None on a miss and for large files
+async def _get_cached_content(
+    file: File
+) -> Optional[bytes | BinaryIO]:
+    if content_cache.directory:
+        # A disk hit opens a file, keep it off the event loop
+        return await asyncio.to_thread(content_cache.lookup, file.id, content_version(file), file.size)
+    return content_cache.lookup(file.id, content_version(file), file.size)
+
+async def _cache_content(
+    file: File,
+    data: bytes
+) -> None:
+    if not content_cache.accepts(len(data)):
+        return
+    if content_cache.directory:
+        await asyncio.to_thread(content_cache.put, file.id, content_version(file), data)
+    else:
+        content_cache.put(file.id, content_version(file), data)
+
+# Downloads and decrypts the file (small files are served from the hot-object cache), returns as an HTTP response
+# Conditional requests (If-None-Match / If-Modified-Since) are answered with 304 before MinIO is touched.
+# Byte ranges are supported; disk cache entries are sent from the file without copying through Python.
+async def download_file(db: AsyncSession, file_id: UUID, request_headers: Optional[dict] = None):
     result = await db.execute(select(File).where(File.id == file_id, File.is_deleted == False))
     file = result.scalar_one_or_none()
     if not file:
         raise Exception("File not found")
-    data = await get_bytes_from_minio(file.path)
-    # Получаем salt и iv из file_encryption
-    result_enc = await db.execute(select(FileEncryption).where(FileEncryption.file_id == file.id))
-    file_enc = result_enc.scalar_one_or_none()
-    if not file_enc:
-        raise Exception("Encryption params not found")
-    salt = file_enc.encryption_salt
-    iv = file_enc.encryption_iv
-    decrypted = decrypt_file(data, str(file.user_id), salt=salt, iv=iv)
-    return Response(
-        content=decrypted,
+    ensure_file_available(file)
+    cache_headers = {"ETag": file_content_etag(file), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if file.uploaded_at:
+        cache_headers["Last-Modified"] = http_date(file.uploaded_at)
+    request_headers = request_headers or {}
+    if is_not_modified(request_headers, cache_headers["ETag"], file.uploaded_at):
+        return Response(status_code=304, headers=cache_headers)
+    content = await _get_cached_content(file)
+    if content is None:
+        decryptor = await get_file_decryptor(db, file)
+        data = await get_bytes_from_minio(file.path)
+        content = decryptor.update(data) + decryptor.finalize()
+        await _cache_content(file, content)
+    return RangedContentResponse(
+        content,
+        len(content) if isinstance(content, bytes) else os.fstat(content.fileno()).st_size,
         media_type=file.content_type,
         headers={
-            "Content-Disposition": f"attachment; filename={file.filename}"
-        }
+            "Content-Disposition": f"attachment; filename={file.filename}",
+            **cache_headers
+        },
+        range_header=request_headers.get("range"),
+        if_range=request_headers.get("if-range")
     )
 
+# Previews are private to the user and never change for a file id
+PREVIEW_CACHE_CONTROL = "private, max-age=86400"
+
+# Gets the preview of a file of the user from its stored derivative: one object GET,
+# the original is neither fetched nor decrypted. Returns 304 if the client already has the preview.
+# If the derivative is missing (e.g. the file was uploaded before previews existed), on_missing is called
+# with the file so the caller can enqueue its generation.
+async def preview_file(
+    db: AsyncSession,
+    file_id: UUID,
+    user_id: UUID,
+    if_none_match: Optional[str] = None,
+    on_missing: Optional[Callable[[File], None]] = None
+) -> Optional[Response]:
+    result = await db.execute(select(File).where(File.id == file_id, File.user_id == user_id, File.is_deleted == False))
+    file = result.scalar_one_or_none()
+    if not file:
+        return None
+    ensure_file_available(file)
+    if not preview_kind(file.content_type):
+        raise HTTPException(status_code=404, detail="Preview is not available for this file type")
+    headers = {"ETag": f'"{file.id.hex}-p{PREVIEW_VERSION}"', "Cache-Control": PREVIEW_CACHE_CONTROL}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await get_bytes_from_minio(preview_object_name(file.id))
+    except HTTPException:
+        if on_missing:
+            on_missing(file)
+        raise HTTPException(status_code=404, detail="Preview is not ready yet")
+    return Response(content=decrypt_derivative(data, file.id.bytes), media_type=PREVIEW_MEDIA_TYPE, headers=headers)
+
 # Gets a file by name and folder
 async def get_file_by_name_and_folder(db, filename, user_id, folder_id):
     from app.models.file import File
@@ -288,4 +868,50 @@ async def get_file_by_name_and_folder(db, filename, user_id, folder_id):
         File.is_deleted == False
     )
     result = await db.execute(stmt)
-    return result.scalars().first()
\ No newline at end of file
+    return result.scalars().first()
+
+# Gets antivirus scan metrics: backlog of pending files, files that could not be scanned and scan-to-available latency
+# for files scanned in the background within the last window_minutes
+async def get_scan_stats(
+    db: AsyncSession,
+    window_minutes: int = 60
+):
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(func.count(File.id), func.min(File.uploaded_at))
+        .where(File.scan_status == ScanStatus.pending_scan.value)
+    )
+    pending, oldest_pending = result.one()
+    result = await db.execute(
+        select(func.count(File.id))
+        .where(File.scan_status == ScanStatus.scan_failed.value)
+    )
+    failed = result.scalar_one()
+    result = await db.execute(
+        select(File.uploaded_at, File.scanned_at)
+        .where(
+            File.scanned_at >= now - timedelta(minutes=window_minutes),
+            File.scanned_at > File.uploaded_at
+        )
+        .limit(10000)
+    )
+    latencies = sorted(
+        (_as_utc(row.scanned_at) - _as_utc(row.uploaded_at)).total_seconds()
+        for row in result.fetchall()
+    )
+    return {
+        "pending": pending,
+        "oldest_pending_age_seconds": (now - _as_utc(oldest_pending)).total_seconds() if oldest_pending else 0,
+        "failed": failed,
+        "scanned_in_window": len(latencies),
+        "window_minutes": window_minutes,
+        "latency_avg_seconds": sum(latencies) / len(latencies) if latencies else 0,
+        "latency_p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else 0,
+        "latency_max_seconds": latencies[-1] if latencies else 0
+    }
+
+# SQLite returns naive datetimes for timezone-aware columns, treat them as UTC
+def _as_utc(
+    value: datetime
+) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -6,9 +6,12 @@ from sqlalchemy import delete, update
 from app.models.folder import Folder
 from app.schemas.folder import FolderCreate
 from app.models.file import File
+from app.repositories.blob_repo import release_blobs
+from app.utils.http_cache import mark_user_changed
+from app.utils.content_cache import content_cache
 # other
-from uuid import UUID
-from typing import Optional
+from uuid import UUID, uuid4
+from typing import Optional, Iterable, Tuple
 
 # Creates a new folder for the user
 async def create_folder(
@@ -24,8 +27,38 @@ async def create_folder(
     db.add(db_folder)
     await db.commit()
     await db.refresh(db_folder)
+    await mark_user_changed(user_id)
     return db_folder
 
+# Creates a folder hierarchy under parent_id in bulk, reusing folders that already exist.
+# paths are tuples of folder names relative to parent_id; returns {path: folder_id} for every path
+# and its ancestors. Existing folders are loaded with one query and new ones are added in one flush
+# (the caller commits).
+async def create_folder_tree(
+    db: AsyncSession,
+    user_id: UUID,
+    parent_id: Optional[UUID],
+    paths: Iterable[Tuple[str, ...]]
+) -> dict:
+    result = await db.execute(select(Folder.id, Folder.parent_id, Folder.name).where(Folder.user_id == user_id))
+    existing = {(row.parent_id, row.name): row.id for row in result.all()}
+    folder_ids = {(): parent_id}
+    new_folders = []
+    for path in sorted(set(paths), key=len):
+        for depth in range(1, len(path) + 1):
+            prefix = path[:depth]
+            if prefix in folder_ids:
+                continue
+            key = (folder_ids[prefix[:-1]], prefix[-1])
+            if key not in existing:
+                folder = Folder(id=uuid4(), name=prefix[-1], parent_id=key[0], user_id=user_id)
+                new_folders.append(folder)
+                existing[key] = folder.id
+            folder_ids[prefix] = existing[key]
+    db.add_all(new_folders)
+    await db.flush()
+    return folder_ids
+
 # Gets a folder by its ID
 async def get_folder(
     db: AsyncSession, 
@@ -58,8 +91,11 @@ async def delete_folder(
     db: AsyncSession, 
     folder_id: UUID
 ):
-    await db.execute(delete(Folder).where(Folder.id == folder_id))
+    result = await db.execute(delete(Folder).where(Folder.id == folder_id).returning(Folder.user_id))
+    user_id = result.scalar_one_or_none()
     await db.commit()
+    if user_id:
+        await mark_user_changed(user_id)
 
 # Recursively deletes a folder, all subfolders and files
 async def delete_folder_recursive(
@@ -70,11 +106,17 @@ async def delete_folder_recursive(
     subfolders = await db.execute(select(Folder).where(Folder.parent_id == folder_id))
     for subfolder in subfolders.scalars().all():
         await delete_folder_recursive(db, subfolder.id)
-    # Delete all files in the folder
-    await db.execute(delete(File).where(File.folder_id == folder_id))
+    # Delete all files in the folder (their blobs are purged by the cleanup task once unreferenced)
+    await release_blobs(db, File.folder_id == folder_id)
+    result = await db.execute(delete(File).where(File.folder_id == folder_id).returning(File.id))
+    for file_id in result.scalars().all():
+        content_cache.invalidate(file_id)
     # Delete the folder itself
-    await db.execute(delete(Folder).where(Folder.id == folder_id))
+    result = await db.execute(delete(Folder).where(Folder.id == folder_id).returning(Folder.user_id))
+    user_id = result.scalar_one_or_none()
     await db.commit()
+    if user_id:
+        await mark_user_changed(user_id)
 
 # Moves a folder to another parent folder
 async def move_folder(
@@ -82,12 +124,16 @@ async def move_folder(
     folder_id: UUID, 
     new_parent_id: UUID
 ):
-    await db.execute(
+    result = await db.execute(
         update(Folder)
         .where(Folder.id == folder_id)
         .values(parent_id=new_parent_id)
+        .returning(Folder.user_id)
     )
+    user_id = result.scalar_one_or_none()
     await db.commit()
+    if user_id:
+        await mark_user_changed(user_id)
 
 # Renames the folder
 async def rename_folder(
@@ -95,9 +141,13 @@ async def rename_folder(
     folder_id: UUID, 
     new_name: str
 ):
-    await db.execute(
+    result = await db.execute(
         update(Folder)
         .where(Folder.id == folder_id)
         .values(name=new_name)
+        .returning(Folder.user_id)
     )
-    await db.commit()
\ No newline at end of file
+    user_id = result.scalar_one_or_none()
+    await db.commit()
+    if user_id:
+        await mark_user_changed(user_id)
\ No newline at end of file
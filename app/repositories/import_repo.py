@@ -0,0 +1,449 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import or_
+from app.db.database import AsyncSessionLocal
+from app.models.file import File, ScanStatus, EncryptionMode
+from app.models.file_encryption import FileEncryption
+from app.repositories import blob_repo
+from app.repositories.file_repo import ensure_storage_available, get_available_storage
+from app.repositories.folder_repo import get_folder, create_folder_tree
+from app.core.encryption import encrypt_convergent, ctr_key, ctr_transform_at
+from app.utils.minio_utils import upload_bytes_to_minio, remove_object_from_minio
+from app.utils.minio_multipart import initiate_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload
+from app.utils.http_cache import mark_user_changed
+from app.utils.redis_client import create_import_job, update_import_job, get_import_job, reserve_storage, release_storage
+from fastapi import HTTPException
+from uuid import UUID, uuid4
+from typing import Callable, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tarfile
+import tempfile
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# How many entries (or parts of a large entry) are uploaded to MinIO at the same time
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", 8))
+# File rows are inserted and committed in batches of this size
+IMPORT_BATCH_SIZE = 500
+# Entries up to this size are stored as deduplicated blobs, larger ones are streamed as multipart uploads
+IMPORT_BLOB_MAX_SIZE = 64 * 1024 * 1024
+IMPORT_PART_SIZE = 8 * 1024 * 1024
+IMPORT_MAX_ENTRIES = int(os.getenv("IMPORT_MAX_ENTRIES", 100000))
+# Largest archive accepted; the upload is also stopped once it exceeds the user's free space
+IMPORT_MAX_ARCHIVE_BYTES = int(os.getenv("IMPORT_MAX_ARCHIVE_BYTES", 10 * 1024 * 1024 * 1024))
+# Only the first errors are kept in the job status
+MAX_IMPORT_ERRORS = 100
+
+# Splits an entry name into path components; returns None for names escaping the target folder
+def _entry_path(
+    name: str
+) -> Optional[Tuple[str, ...]]:
+    parts = [part.strip() for part in name.replace("\\", "/").split("/")]
+    parts = [part for part in parts if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return tuple(parts)
+
+# Lists the archive (blocking, run in a thread): the folder paths to create, the number of files
+# and their total uncompressed size. Raises HTTPException if the file is not a ZIP or TAR archive.
+def _list_archive(
+    archive_path: str
+) -> Tuple[set, int, int]:
+    folders = set()
+    files = 0
+    total_size = 0
+    def add(name, is_dir, size):
+        nonlocal files, total_size
+        path = _entry_path(name)
+        if not path:
+            return
+        if is_dir:
+            folders.add(path)
+            return
+        folders.add(path[:-1])
+        files += 1
+        total_size += size
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                add(info.filename, info.is_dir(), info.file_size)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path, "r:*") as archive:
+            for member in archive:
+                if member.isdir() or member.isfile():
+                    add(member.name, member.isdir(), member.size)
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported archive format, ZIP or TAR expected")
+    folders.discard(())
+    return folders, files, total_size
+
+# Iterates over the file entries of the archive in storage order (blocking, advance it in a thread):
+# yields (name, size, stream)
+def _open_entries(
+    archive_path: str
+):
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as stream:
+                        yield info.filename, info.file_size, stream
+    else:
+        with tarfile.open(archive_path, "r:*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, archive.extractfile(member)
+
+# Saves the request body to a temporary file: ZIP keeps its directory at the end,
+# so the archive can only be read once it is complete. Raises 413 and removes the file
+# as soon as more than max_bytes arrive.
+async def _spool_body(
+    body,
+    max_bytes: int
+) -> str:
+    fd, archive_path = tempfile.mkstemp(prefix="import-", suffix=".archive")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            received = 0
+            async for chunk in body:
+                received += len(chunk)
+                # Stops before writing, so an oversized upload never fills the temp disk
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail="Archive exceeds the size limit or the available storage")
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        os.remove(archive_path)
+        raise
+    return archive_path
+
+# Receives an archive and registers an import job. The archive is listed once to check
+# the quota for all its files together; the checked size stays reserved until the job ends.
+# Returns the job status and the arguments for run_import.
+async def start_import(
+    db: AsyncSession,
+    user_id: UUID,
+    body,
+    folder_id: Optional[UUID] = None
+) -> Tuple[dict, dict]:
+    if folder_id is not None:
+        folder = await get_folder(db, folder_id)
+        if not folder or folder.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Folder not found")
+    max_bytes = min(IMPORT_MAX_ARCHIVE_BYTES, await get_available_storage(db, user_id))
+    archive_path = await _spool_body(body, max_bytes)
+    try:
+        folders, files, total_size = await asyncio.to_thread(_list_archive, archive_path)
+        if files > IMPORT_MAX_ENTRIES:
+            raise HTTPException(status_code=400, detail=f"Archive contains more than {IMPORT_MAX_ENTRIES} files")
+        await ensure_storage_available(db, user_id, total_size)
+        job_id = str(uuid4())
+        await reserve_storage(str(user_id), job_id, total_size)
+        status = {
+            "job_id": job_id,
+            "status": "queued",
+            "total_files": files,
+            "total_bytes": total_size,
+            "processed_files": 0,
+            "processed_bytes": 0,
+            "failed_files": 0,
+            "errors": [],
+            "error": None
+        }
+        await create_import_job(job_id, str(user_id), **status)
+    except BaseException:
+        os.remove(archive_path)
+        raise
+    return status, {"job_id": job_id, "user_id": user_id, "archive_path": archive_path, "folder_id": folder_id, "folders": folders}
+
+# Gets the status of an import job of the user
+async def get_import_status(
+    user_id: UUID,
+    job_id: str
+) -> dict:
+    job = await get_import_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.pop("user_id") != str(user_id):
+        raise HTTPException(status_code=403, detail="Import job belongs to another user")
+    return job
+
+# Encrypts and uploads the content of a new blob; the semaphore slot is taken by the caller
+async def _upload_blob(
+    content: bytes,
+    content_hash: str,
+    semaphore: asyncio.Semaphore
+) -> None:
+    try:
+        encrypted = await asyncio.to_thread(encrypt_convergent, content, content_hash)
+        await upload_bytes_to_minio(blob_repo.blob_object_name(content_hash), encrypted, "application/octet-stream")
+    finally:
+        semaphore.release()
+
+# Uploads one encrypted part of a large entry; the semaphore slot is taken by the caller
+async def _upload_part(
+    object_name: str,
+    upload_id: str,
+    part_number: int,
+    data: bytes,
+    semaphore: asyncio.Semaphore
+) -> dict:
+    try:
+        return {"part_number": part_number, "etag": await upload_part(object_name, upload_id, part_number, data)}
+    finally:
+        semaphore.release()
+
+# Streams a large entry to MinIO as a multipart upload encrypted with AES-CTR, like multipart uploads
+# through the API. Returns the encryption salt and iv and the number of bytes stored.
+async def _store_large_entry(
+    stream,
+    object_name: str,
+    semaphore: asyncio.Semaphore
+) -> Tuple[bytes, bytes, int]:
+    salt, iv = os.urandom(16), os.urandom(16)
+    key = ctr_key(salt)
+    upload_id = await initiate_multipart_upload(object_name)
+    tasks = []
+    offset = 0
+    try:
+        while True:
+            await semaphore.acquire()
+            data = await asyncio.to_thread(stream.read, IMPORT_PART_SIZE)
+            if not data:
+                semaphore.release()
+                break
+            encrypted = ctr_transform_at(key, iv, offset, data)
+            tasks.append(asyncio.create_task(_upload_part(object_name, upload_id, len(tasks) + 1, encrypted, semaphore)))
+            offset += len(data)
+        parts = await asyncio.gather(*tasks)
+        await complete_multipart_upload(object_name, upload_id, parts)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        try:
+            await abort_multipart_upload(object_name, upload_id)
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload {upload_id}: {e}")
+        raise
+    return salt, iv, offset
+
+# State of a running import: the current batch and the progress reported to the job status
+class _ImportBatch:
+    def __init__(
+        self,
+        on_file_created: Optional[Callable[[File], None]] = None
+    ):
+        # Called with every committed file, e.g. to enqueue its scan
+        self.on_file_created = on_file_created
+        self.files = []
+        self.encryption = []
+        # New blobs of the batch: hash -> {"size", "references", "task"}
+        self.blobs = {}
+        # References to existing blobs, committed when taken: hash -> count (released if the batch fails)
+        self.acquired = {}
+        # Objects of large entries, removed if the batch fails
+        self.objects = []
+        self.processed_files = 0
+        self.processed_bytes = 0
+        self.failed_files = 0
+        self.errors = []
+
+    def fail(
+        self,
+        name: str,
+        reason: str,
+        count: int = 1
+    ) -> None:
+        self.failed_files += count
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(f"{name}: {reason}")
+
+# Reads a small entry and adds a reference to its blob; a new blob is uploaded in the background.
+# A reference to an existing blob is committed right away, so its row is not locked for the whole batch
+# and uploads of the same content do not wait for the import.
+# The semaphore slot is held until the upload ends, so at most IMPORT_CONCURRENCY entries are in memory.
+# Returns the content hash and size.
+async def _store_small_entry(
+    db: AsyncSession,
+    batch: _ImportBatch,
+    stream,
+    semaphore: asyncio.Semaphore
+) -> Tuple[str, int]:
+    await semaphore.acquire()
+    try:
+        content = await asyncio.to_thread(stream.read)
+        content_hash = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+        if content_hash in batch.blobs:
+            batch.blobs[content_hash]["references"] += 1
+        else:
+            acquired = await blob_repo.acquire_blob(db, content_hash)
+            await db.commit()
+            if acquired:
+                batch.acquired[content_hash] = batch.acquired.get(content_hash, 0) + 1
+            else:
+                batch.blobs[content_hash] = {
+                    "size": len(content),
+                    "references": 1,
+                    # The upload task releases the slot
+                    "task": asyncio.create_task(_upload_blob(content, content_hash, semaphore))
+                }
+                return content_hash, len(content)
+    except BaseException:
+        semaphore.release()
+        raise
+    semaphore.release()
+    return content_hash, len(content)
+
+# Drops a batch that can not be committed: releases the blob references it took and removes
+# the objects of its large entries. New blobs uploaded for the batch have no row yet; their objects
+# are named by the content hash and may be shared with a concurrent upload, so they are kept.
+async def _discard_batch(
+    db: AsyncSession,
+    batch: _ImportBatch,
+    reason: str
+) -> None:
+    await db.rollback()
+    batch.fail(f"{len(batch.files)} files", reason, len(batch.files))
+    try:
+        for content_hash, references in batch.acquired.items():
+            await blob_repo.release_blob(db, content_hash, references)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to release blob references of a failed import batch: {e}")
+    for object_name in batch.objects:
+        try:
+            await remove_object_from_minio(object_name)
+        except Exception as e:
+            logger.error(f"Failed to remove object {object_name} of a failed import batch: {e}")
+
+# Waits for the uploads of the batch, then inserts its blobs and file rows in one transaction
+async def _flush_batch(
+    db: AsyncSession,
+    job_id: str,
+    batch: _ImportBatch
+) -> None:
+    if batch.files:
+        results = await asyncio.gather(*(blob["task"] for blob in batch.blobs.values()), return_exceptions=True)
+        failed = next((result for result in results if isinstance(result, Exception)), None)
+        if failed:
+            await _discard_batch(db, batch, f"upload failed: {failed}")
+        else:
+            try:
+                for content_hash, blob in batch.blobs.items():
+                    await blob_repo.insert_blob(db, content_hash, blob["size"], blob["references"])
+                db.add_all(batch.files)
+                await db.flush()
+                db.add_all(batch.encryption)
+                await db.commit()
+            except Exception as e:
+                logger.error(f"Import {job_id}: failed to save {len(batch.files)} files: {e}")
+                await _discard_batch(db, batch, f"saving failed: {e}")
+            else:
+                await mark_user_changed(batch.files[0].user_id)
+                batch.processed_files += len(batch.files)
+                batch.processed_bytes += sum(file.size for file in batch.files)
+                if batch.on_file_created:
+                    for file in batch.files:
+                        batch.on_file_created(file)
+    batch.files, batch.encryption, batch.blobs, batch.acquired, batch.objects = [], [], {}, {}, []
+    await update_import_job(
+        job_id,
+        processed_files=batch.processed_files,
+        processed_bytes=batch.processed_bytes,
+        failed_files=batch.failed_files,
+        errors=batch.errors
+    )
+
+# Expands the archive into the folder: folders are created in bulk, entries are uploaded with
+# bounded parallelism and their rows are inserted in batches. on_file_created gets each file once its batch is committed.
+async def _import_archive(
+    db: AsyncSession,
+    job_id: str,
+    user_id: UUID,
+    archive_path: str,
+    folder_id: Optional[UUID],
+    folders: set,
+    on_file_created: Optional[Callable[[File], None]] = None
+) -> _ImportBatch:
+    folder_ids = await create_folder_tree(db, user_id, folder_id, folders)
+    await db.commit()
+    await mark_user_changed(user_id)
+    target_ids = set(folder_ids.values())
+    in_targets = [File.folder_id.in_([target for target in target_ids if target is not None])]
+    if None in target_ids:
+        in_targets.append(File.folder_id.is_(None))
+    result = await db.execute(
+        select(File.folder_id, File.filename)
+        .where(File.user_id == user_id, File.is_deleted == False, or_(*in_targets))
+    )
+    taken = {(row.folder_id, row.filename) for row in result.all()}
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+    batch = _ImportBatch(on_file_created)
+    entries = _open_entries(archive_path)
+    while (entry := await asyncio.to_thread(next, entries, None)) is not None:
+        name, size, stream = entry
+        path = _entry_path(name)
+        if not path:
+            batch.fail(name, "invalid path")
+            continue
+        target = folder_ids[path[:-1]]
+        if (target, path[-1]) in taken:
+            batch.fail(name, "file with this name already exists in the folder")
+            continue
+        taken.add((target, path[-1]))
+        file = File(
+            id=uuid4(),
+            filename=path[-1],
+            user_id=user_id,
+            folder_id=target,
+            content_type=mimetypes.guess_type(path[-1])[0] or "application/octet-stream",
+            scan_status=ScanStatus.pending_scan.value
+        )
+        try:
+            if size <= IMPORT_BLOB_MAX_SIZE:
+                content_hash, file.size = await _store_small_entry(db, batch, stream, semaphore)
+                file.path = blob_repo.blob_object_name(content_hash)
+                file.blob_hash = content_hash
+                file.encryption_mode = EncryptionMode.convergent.value
+            else:
+                file.path = f"{user_id}/uploads/{uuid4()}"
+                salt, iv, file.size = await _store_large_entry(stream, file.path, semaphore)
+                batch.objects.append(file.path)
+                file.encryption_mode = EncryptionMode.ctr.value
+                batch.encryption.append(FileEncryption(file_id=file.id, encryption_salt=salt, encryption_iv=iv))
+        except Exception as e:
+            logger.error(f"Import {job_id}: failed to store {name}: {e}")
+            batch.fail(name, str(e))
+            continue
+        batch.files.append(file)
+        if len(batch.files) >= IMPORT_BATCH_SIZE:
+            await _flush_batch(db, job_id, batch)
+    await _flush_batch(db, job_id, batch)
+    return batch
+
+# Runs an import job created by start_import (in the background, after the response is sent)
+async def run_import(
+    job_id: str,
+    user_id: UUID,
+    archive_path: str,
+    folder_id: Optional[UUID],
+    folders: set,
+    on_file_created: Optional[Callable[[File], None]] = None
+) -> None:
+    try:
+        await update_import_job(job_id, status="running")
+        async with AsyncSessionLocal() as db:
+            batch = await _import_archive(db, job_id, user_id, archive_path, folder_id, folders, on_file_created)
+        await update_import_job(job_id, status="completed" if not batch.failed_files else "completed_with_errors")
+        logger.info(f"Import {job_id}: {batch.processed_files} files ({batch.processed_bytes} bytes) imported, {batch.failed_files} failed")
+    except Exception as e:
+        logger.exception(f"Import {job_id} failed: {e}")
+        await update_import_job(job_id, status="failed", error=str(e))
+    finally:
+        os.remove(archive_path)
+        await release_storage(str(user_id), job_id)
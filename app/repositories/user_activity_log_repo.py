@@ -1,8 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models.user_activity_log import UserActivityLog
+from sqlalchemy import insert, delete, text, or_, and_
+from app.models.user_activity_log import UserActivityLog, partition_name, add_months, partition_ddl
+from app.models.user import User
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, date, timezone
+from typing import Optional, List
+import re
+
+PARTITION_NAME_RE = re.compile(r"user_activity_logs_y(\d{4})m(\d{2})")
 
 # Creates a new user activity log entry
 async def create_log(
@@ -23,6 +29,21 @@ async def create_log(
     await session.refresh(log)
     return log
 
+# Inserts many log entries with one multi-row INSERT and commits (used by the batched audit writer).
+# Entries of users deleted in the meantime are skipped, so one of them does not fail the whole batch.
+# Returns the number of inserted entries.
+async def insert_logs(
+    session: AsyncSession,
+    rows: list
+) -> int:
+    result = await session.execute(select(User.id).where(User.id.in_({row["user_id"] for row in rows})))
+    existing = set(result.scalars().all())
+    rows = [row for row in rows if row["user_id"] in existing]
+    if rows:
+        await session.execute(insert(UserActivityLog), rows)
+        await session.commit()
+    return len(rows)
+
 # Gets all user activity logs by user ID
 async def get_logs_by_user(
     session: AsyncSession,
@@ -33,13 +54,114 @@ async def get_logs_by_user(
     )
     return result.scalars().all()
 
-# Gets user activity logs for the specified date range
+# Gets a page of the user's activity logs in [start, end), newest first. The bounds on action_time let
+# PostgreSQL scan only the monthly partitions of the range. Pages are keyset-paginated: pass the
+# action_time and id of the last log of the previous page as before / before_id.
 async def get_logs_by_date_range(
-    session: AsyncSession, 
-    start: datetime, 
-    end: datetime
+    session: AsyncSession,
+    user_id: UUID,
+    start: datetime,
+    end: datetime,
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    before_id: Optional[UUID] = None
 ):
+    query = select(UserActivityLog).where(
+        UserActivityLog.user_id == user_id,
+        UserActivityLog.action_time >= start,
+        UserActivityLog.action_time < end
+    )
+    if before is not None:
+        if before_id is not None:
+            query = query.where(or_(
+                UserActivityLog.action_time < before,
+                and_(UserActivityLog.action_time == before, UserActivityLog.id < before_id)
+            ))
+        else:
+            query = query.where(UserActivityLog.action_time < before)
     result = await session.execute(
-        select(UserActivityLog).where(UserActivityLog.action_time.between(start, end))
+        query.order_by(UserActivityLog.action_time.desc(), UserActivityLog.id.desc()).limit(limit)
+    )
+    return result.scalars().all()
+
+# Month of a partition from its name (None for the default partition and foreign tables)
+def partition_month(
+    name: str
+) -> Optional[date]:
+    match = PARTITION_NAME_RE.fullmatch(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+# Creates the monthly partitions from first to last month (inclusive) that do not exist yet (PostgreSQL).
+# PostgreSQL refuses a new range partition while the default partition holds rows of that range, so such rows
+# are moved: the default partition is detached, the month created, its rows moved over and the default reattached.
+async def create_partitions(
+    session: AsyncSession,
+    first: date,
+    last: date
+) -> List[str]:
+    existing = set(await list_partitions(session))
+    created = []
+    month = first
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            upper = add_months(month, 1)
+            bounds = {
+                "lower": datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+                "upper": datetime(upper.year, upper.month, 1, tzinfo=timezone.utc)
+            }
+            in_range = "action_time >= :lower AND action_time < :upper"
+            misplaced = "user_activity_logs_default" in existing and (await session.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM user_activity_logs_default WHERE {in_range})"), bounds
+            )).scalar()
+            if misplaced:
+                await session.execute(text("ALTER TABLE user_activity_logs DETACH PARTITION user_activity_logs_default"))
+            await session.execute(text(partition_ddl(month)))
+            if misplaced:
+                await session.execute(text(f"INSERT INTO {name} SELECT * FROM user_activity_logs_default WHERE {in_range}"), bounds)
+                await session.execute(text(f"DELETE FROM user_activity_logs_default WHERE {in_range}"), bounds)
+                await session.execute(text("ALTER TABLE user_activity_logs ATTACH PARTITION user_activity_logs_default DEFAULT"))
+            created.append(name)
+        month = add_months(month, 1)
+    await session.commit()
+    return created
+
+# Names of the partitions of user_activity_logs (PostgreSQL)
+async def list_partitions(
+    session: AsyncSession
+) -> List[str]:
+    result = await session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'user_activity_logs'"
+    ))
+    return list(result.scalars().all())
+
+# Removes logs older than the cutoff month. On PostgreSQL whole monthly partitions are dropped
+# (no row-by-row DELETE, no vacuum afterwards); other databases delete the rows.
+async def drop_logs_before(
+    session: AsyncSession,
+    cutoff: date
+) -> List[str]:
+    if session.bind.dialect.name != "postgresql":
+        await session.execute(
+            delete(UserActivityLog)
+            .where(UserActivityLog.action_time < datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return []
+    dropped = []
+    for name in sorted(await list_partitions(session)):
+        month = partition_month(name)
+        if month is not None and month < cutoff:
+            await session.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    # Rows that fell into the default partition (normally empty) are deleted
+    await session.execute(
+        text("DELETE FROM user_activity_logs_default WHERE action_time < :cutoff"),
+        {"cutoff": datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)}
     )
-    return result.scalars().all()
\ No newline at end of file
+    await session.commit()
+    return dropped
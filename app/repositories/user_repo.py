@@ -1,30 +1,81 @@
+from fastapi import HTTPException
 from sqlalchemy.future import select
-from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.user import User
-from app.core.password_utils import hash_password, verify_password
-from uuid import UUID
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.user import User, UserRole
+from app.models.user_settings import UserSettings
+from app.models.file import File
+from app.schemas.user_settings import UserSettingsCreate
+from app.repositories.blob_repo import release_blobs
+from app.core.password_utils import hash_password_async, verify_and_update_password
+from app.utils.redis_client import record_login_failure, get_login_failures, clear_login_failures
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+from typing import List, Optional
+import logging
+import os
 
-# Creates a new user with the specified username, email and password
-async def create_user(
+logger = logging.getLogger(__name__)
+
+# A username is locked for LOGIN_LOCKOUT_SECONDS after LOGIN_MAX_ATTEMPTS failed logins within LOGIN_ATTEMPT_WINDOW_SECONDS
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", 5))
+LOGIN_ATTEMPT_WINDOW_SECONDS = int(os.getenv("LOGIN_ATTEMPT_WINDOW_SECONDS", 15 * 60))
+LOGIN_LOCKOUT_SECONDS = int(os.getenv("LOGIN_LOCKOUT_SECONDS", 15 * 60))
+
+# Creates users together with their default settings in one transaction: one multi-row INSERT of the users
+# that skips taken usernames and emails and returns the created rows, one INSERT of their settings, one commit.
+# Each item holds username, email and password_hash, optionally role, is_verified and settings (UserSettings columns).
+# Returns the created users by username; items whose username or email already exists are not in the result.
+async def provision_users(
     session: AsyncSession,
-    username: str, 
-    email: str, 
-    password: str
-):
-    user = User(
-        username=username,
-        email=email,
-        password_hash=hash_password(password),   
+    items: List[dict]
+) -> dict:
+    if not items:
+        return {}
+    now = datetime.now(timezone.utc)
+    rows = [{
+        "id": uuid4(),
+        "username": item["username"],
+        "email": item["email"],
+        "password_hash": item["password_hash"],
+        "created_at": now,
+        "last_login": None,
+        "is_active": True,
+        "is_verified": item.get("is_verified", False),
+        "role": UserRole(item.get("role", UserRole.user)),
+        "login_attempts": 0,
+        "locked_until": None
+    } for item in items]
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    result = await session.execute(
+        insert(User.__table__).on_conflict_do_nothing().returning(User.__table__.c.id),
+        rows
     )
-    session.add(user)
-    try:
-        await session.commit()
-        await session.refresh(user)
-        return user
-    except IntegrityError:
-        await session.rollback()
-        return None
+    created_ids = set(result.scalars().all())
+    created = {}
+    settings_rows = []
+    for row, item in zip(rows, items):
+        if row["id"] not in created_ids:
+            continue
+        created[row["username"]] = User(**row)
+        settings = UserSettingsCreate(**(item.get("settings") or {})).model_dump(exclude_none=True)
+        settings_rows.append({"id": uuid4(), "user_id": row["id"], **UserSettingsCreate().model_dump(), **settings})
+    if settings_rows:
+        await session.execute(UserSettings.__table__.insert(), settings_rows)
+    await session.commit()
+    return created
+
+# Registers a new user with default settings. The password is hashed in the hashing pool.
+# Returns None if the username or email is already taken.
+async def register_user(
+    session: AsyncSession,
+    username: str,
+    email: str,
+    password: str
+) -> Optional[User]:
+    password_hash = await hash_password_async(password)
+    created = await provision_users(session, [{"username": username, "email": email, "password_hash": password_hash}])
+    return created.get(username)
 
 # Gets user by username
 async def get_user_by_username(
@@ -50,16 +101,70 @@ async def get_user_by_id(
     print(f"[get_user_by_id] Found: {user}")
     return user
 
-# Authenticates the user by username and password
+def _locked_out(
+    retry_after: int
+) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many failed login attempts, try again later",
+        headers={"Retry-After": str(max(1, retry_after))}
+    )
+
+# Authenticates the user by username and password.
+# Locked usernames are rejected with 429 before the database or bcrypt is touched: the failure counter
+# is kept in Redis, so a password-guessing burst costs one Redis read per attempt once the limit is reached.
+# The lock is also stored in User.locked_until, which is checked if Redis is unavailable.
+# Hashing runs in the hashing pool; a hash with an outdated cost is replaced on a successful login.
 async def authenticate_user(
     session: AsyncSession, 
     username: str, 
     password: str
 ):
+    key = username[:50]
+    try:
+        failures, ttl = await get_login_failures(key)
+    except Exception as e:
+        logger.warning(f"Login lockout counter unavailable: {e}")
+        failures, ttl = None, 0
+    if failures is not None and failures >= LOGIN_MAX_ATTEMPTS:
+        raise _locked_out(ttl)
     user = await get_user_by_username(session, username)
-    if user and verify_password(password, user.password_hash):
-        return user
-    return None
+    now = datetime.now(timezone.utc)
+    if user and user.locked_until:
+        locked_until = user.locked_until if user.locked_until.tzinfo else user.locked_until.replace(tzinfo=timezone.utc)
+        if locked_until > now:
+            raise _locked_out(int((locked_until - now).total_seconds()))
+        # The lock is over: failures start from zero again
+        user.login_attempts = 0
+    if user:
+        matches, new_hash = await verify_and_update_password(password, user.password_hash)
+    else:
+        matches, new_hash = False, None
+    if not matches:
+        try:
+            failures = await record_login_failure(key, LOGIN_ATTEMPT_WINDOW_SECONDS, LOGIN_MAX_ATTEMPTS, LOGIN_LOCKOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Login lockout counter unavailable: {e}")
+            failures = None
+        if user and (failures is None or failures >= LOGIN_MAX_ATTEMPTS):
+            # Without Redis the database counts the failures
+            user.login_attempts = failures if failures is not None else (user.login_attempts or 0) + 1
+            if user.login_attempts >= LOGIN_MAX_ATTEMPTS:
+                user.locked_until = now + timedelta(seconds=LOGIN_LOCKOUT_SECONDS)
+            await session.commit()
+        return None
+    if failures:
+        try:
+            await clear_login_failures(key)
+        except Exception as e:
+            logger.warning(f"Login lockout counter unavailable: {e}")
+    if new_hash:
+        user.password_hash = new_hash
+    user.login_attempts = 0
+    user.locked_until = None
+    user.last_login = now
+    await session.commit()
+    return user
 
 # Deletes user by username
 async def delete_user(
@@ -68,6 +173,8 @@ async def delete_user(
 ):
     user = await get_user_by_username(session, username)
     if user:
+        # Files are removed by the database cascade, release their deduplicated blobs first
+        await release_blobs(session, File.user_id == user.id)
         await session.delete(user)
         await session.commit()
         return True
@@ -1,22 +1,89 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models.user_settings import UserSettings
+from app.utils.redis_client import get_cached_settings, store_cached_settings, delete_cached_settings
+from collections import OrderedDict
 from uuid import UUID
+from typing import Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Settings are also kept in process for this many seconds. Other workers are not notified of changes,
+# so this is how long a worker may use settings changed elsewhere.
+SETTINGS_LOCAL_TTL = float(os.getenv("SETTINGS_LOCAL_TTL", 5))
+SETTINGS_LOCAL_CACHE_SIZE = int(os.getenv("SETTINGS_LOCAL_CACHE_SIZE", 10000))
+
+SETTINGS_FIELDS = ("id", "user_id", "storage_limit", "theme", "language", "notifications_enabled")
+
+# In-process LRU of settings: user_id -> (expires_at, columns)
+_local_settings = OrderedDict()
+_local_lock = threading.Lock()
+
+def _to_dict(
+    settings: UserSettings
+) -> dict:
+    data = {field: getattr(settings, field) for field in SETTINGS_FIELDS}
+    data["id"], data["user_id"] = str(data["id"]), str(data["user_id"])
+    return data
+
+def _from_dict(
+    data: dict
+) -> UserSettings:
+    return UserSettings(**{**data, "id": UUID(data["id"]), "user_id": UUID(data["user_id"])})
+
+def _get_local(
+    user_id: UUID
+) -> Optional[dict]:
+    with _local_lock:
+        item = _local_settings.get(user_id)
+        if not item:
+            return None
+        if item[0] < time.monotonic():
+            del _local_settings[user_id]
+            return None
+        _local_settings.move_to_end(user_id)
+        return item[1]
+
+def _store_local(
+    user_id: UUID,
+    data: dict
+) -> None:
+    with _local_lock:
+        _local_settings[user_id] = (time.monotonic() + SETTINGS_LOCAL_TTL, data)
+        _local_settings.move_to_end(user_id)
+        while len(_local_settings) > SETTINGS_LOCAL_CACHE_SIZE:
+            _local_settings.popitem(last=False)
+
+# Drops the cached settings of the user in this process and in Redis
+async def invalidate_settings_cache(
+    user_id: UUID
+) -> None:
+    with _local_lock:
+        _local_settings.pop(user_id, None)
+    try:
+        await delete_cached_settings(str(user_id))
+    except Exception as e:
+        logger.warning(f"Failed to invalidate cached settings of user {user_id}: {e}")
 
 # Creates new user settings
 async def create_settings(
-    session: AsyncSession, 
+    session: AsyncSession,
     settings_data: dict
 ):
     settings = UserSettings(**settings_data)
     session.add(settings)
     await session.commit()
     await session.refresh(settings)
+    await invalidate_settings_cache(settings.user_id)
     return settings
 
 # Gets user settings by user ID
 async def get_settings_by_user(
-    session: AsyncSession, 
+    session: AsyncSession,
     user_id: UUID
 ):
     result = await session.execute(
@@ -24,10 +91,38 @@ async def get_settings_by_user(
     )
     return result.scalar_one_or_none()
 
+# Gets user settings for reading (quota checks, the settings page) through a read-through cache:
+# in process, then Redis, then the database. The returned object is not attached to the session,
+# use get_settings_by_user to change settings.
+async def get_cached_settings_by_user(
+    session: AsyncSession,
+    user_id: UUID
+) -> Optional[UserSettings]:
+    data = _get_local(user_id)
+    if data is None:
+        try:
+            data, version = await get_cached_settings(str(user_id))
+        except Exception as e:
+            logger.warning(f"Settings cache unavailable: {e}")
+            return await get_settings_by_user(session, user_id)
+        if data is None:
+            settings = await get_settings_by_user(session, user_id)
+            if not settings:
+                return None
+            data = _to_dict(settings)
+            try:
+                # Refused if the settings changed while they were read: the result is used once but not cached
+                if not await store_cached_settings(str(user_id), data, version):
+                    return _from_dict(data)
+            except Exception as e:
+                logger.warning(f"Failed to cache settings of user {user_id}: {e}")
+        _store_local(user_id, data)
+    return _from_dict(data)
+
 # Updates user settings by user ID
 async def update_settings(
-    session: AsyncSession, 
-    user_id: UUID, 
+    session: AsyncSession,
+    user_id: UUID,
     update_data: dict
 ):
     settings = await get_settings_by_user(session, user_id)
@@ -37,17 +132,21 @@ async def update_settings(
         setattr(settings, key, value)
     await session.commit()
     await session.refresh(settings)
+    await invalidate_settings_cache(user_id)
     return settings
 
-# Deletes user settings by user ID
+# Deletes user settings by user ID. Returns False if the user has no settings.
 async def delete_settings_by_user(
-    session: AsyncSession, 
+    session: AsyncSession,
     user_id: UUID
-):
+) -> bool:
     result = await session.execute(
         select(UserSettings).where(UserSettings.user_id == user_id)
     )
     settings = result.scalar_one_or_none()
-    if settings:
-        await session.delete(settings)
-        await session.commit()
\ No newline at end of file
+    if not settings:
+        return False
+    await session.delete(settings)
+    await session.commit()
+    await invalidate_settings_cache(user_id)
+    return True
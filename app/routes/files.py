@@ -1,25 +1,29 @@
 # fastapi
 from fastapi.responses import Response
-from fastapi import APIRouter, UploadFile, File as FastAPIFile, Depends, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File as FastAPIFile, Depends, HTTPException, Query, Request, BackgroundTasks
 # sqlalchemy
 from sqlalchemy.ext.asyncio import AsyncSession
 # app
 from app.db.database import get_db
 from app.schemas.file import FileOut
-from app.repositories import file_repo
-from app.repositories.user_settings_repo import get_settings_by_user
+from app.repositories import file_repo, blob_repo, archive_repo, import_repo
 from app.schemas import file as file_schema
 from app.core.security import get_current_user
+from app.core.audit import audit, record_event
+from app.core.concurrency import limit_concurrency, upload_limiter, chunk_limiter, download_limiter, archive_limiter
 from app.models.user import User
 from app.utils.antivirus import scan_bytes_for_viruses
-from app.core.encryption import encrypt_file
-from app.utils.minio_utils import upload_bytes_to_minio
-from app.models.file_encryption import FileEncryption
+from app.models.file import ScanStatus, EncryptionMode
+from app.config import settings as app_settings
 # tasks
 from tasks.cleanup import cleanup_trash
+from tasks.scan import enqueue_scan
+from tasks.previews import enqueue_preview
+from app.utils.http_cache import conditional_listing, is_not_modified, representation_etag, REVALIDATE_CACHE_CONTROL
 # other
 from uuid import UUID
 from typing import List, Optional
+import hashlib
 import logging
 
 router = APIRouter(
@@ -29,7 +33,7 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
-@router.post("/", response_model=FileOut, description="Upload a file, checks storage limit and viruses.")
+@router.post("/", response_model=FileOut, description="Upload a file, checks storage limit and viruses.", dependencies=[audit("file_upload"), limit_concurrency(upload_limiter)])
 async def upload_file(
     file: UploadFile = FastAPIFile(...),
     folder_id: Optional[UUID] = None,
@@ -37,33 +41,27 @@ async def upload_file(
     current_user: User = Depends(get_current_user)
 ):
     user_id = current_user.id
-    settings = await get_settings_by_user(db, user_id)
-    if not settings:
-        raise HTTPException(status_code=400, detail="User settings not found")
-    storage_limit = settings.storage_limit
-    used_size = await file_repo.get_user_storage_usage(db, user_id)
     content = await file.read()
-    if used_size + len(content) > storage_limit:
-        raise HTTPException(status_code=400, detail="Storage limit exceeded")
+    # Quota check also counts space reserved by multipart uploads in progress
+    await file_repo.ensure_storage_available(db, user_id, len(content))
 
     # Check: a file with this name already exists in this folder (and has not been deleted)
     existing_file = await file_repo.get_file_by_name_and_folder(db, file.filename, user_id, folder_id)
     if existing_file:
         raise HTTPException(status_code=409, detail="File with this name already exists in the folder")
 
-    # 1. Virus check
-    await scan_bytes_for_viruses(content)
+    content_hash = hashlib.sha256(content).hexdigest()
 
-    # 2. Encrypting a file (using user_id as password)
-    encrypted_data, salt, iv = encrypt_file(content, str(user_id))
+    # 1. Virus check. In async mode the file is saved as pending_scan and checked by scan_file_task
+    scan_async = app_settings.SCAN_MODE == "async"
+    if not scan_async:
+        await scan_bytes_for_viruses(content, content_hash)
 
-    # 3. Generating a path for MinIO
-    minio_path = f"{user_id}/{folder_id or 'root'}/{file.filename}"
+    # 2. Storing the content as a content-addressed blob (convergent encryption).
+    # Identical content is encrypted and uploaded to MinIO only once.
+    minio_path = await blob_repo.store_blob(db, content, content_hash)
 
-    # 4. Loading into MinIO
-    await upload_bytes_to_minio(minio_path, encrypted_data, file.content_type)
-
-    # 5. Saving a file record to the database
+    # 3. Saving a file record to the database (commits the blob reference too)
     db_file = await file_repo.create_file(
         db,
         filename=file.filename,
@@ -71,50 +69,88 @@ async def upload_file(
         size=len(content),
         content_type=file.content_type,
         path=minio_path,
-        folder_id=folder_id
+        folder_id=folder_id,
+        scan_status=ScanStatus.pending_scan.value if scan_async else ScanStatus.clean.value,
+        blob_hash=content_hash,
+        encryption_mode=EncryptionMode.convergent.value
     )
-    # 6. Save salt and iv to file
-    db.add(FileEncryption(
-        file_id=db_file.id,
-        encryption_salt=salt,
-        encryption_iv=iv
-    ))
-    await db.commit()
-    await db.refresh(db_file)
+    # 4. Enqueue the background scan (async mode) or, for clean files, the preview generation
+    enqueue_scan(db_file)
+    enqueue_preview(db_file)
     return db_file
 
+@router.post("/check_hash", response_model=file_schema.CheckHashResponse, description="Create a file from content the user already stores, identified by its SHA-256, without uploading the bytes again.", dependencies=[audit("file_upload_dedup")])
+async def check_hash(
+    request_data: file_schema.CheckHashRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    user_id = current_user.id
+    await file_repo.ensure_storage_available(db, user_id, request_data.size)
+    existing_file = await file_repo.get_file_by_name_and_folder(db, request_data.filename, user_id, request_data.folder_id)
+    if existing_file:
+        raise HTTPException(status_code=409, detail="File with this name already exists in the folder")
+    db_file = await file_repo.create_file_from_hash(
+        db,
+        user_id=user_id,
+        content_hash=request_data.sha256.lower(),
+        size=request_data.size,
+        filename=request_data.filename,
+        content_type=request_data.content_type,
+        folder_id=request_data.folder_id
+    )
+    if db_file:
+        enqueue_preview(db_file)
+    return {"exists": db_file is not None, "file": db_file}
+
 @router.get("/", response_model=List[FileOut], description="List all files for the current user.")
 async def list_files(
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    not_modified = await conditional_listing(current_user.id, request, response)
+    if not_modified:
+        return not_modified
     return await file_repo.get_files_by_user(db, current_user.id)
 
 @router.put("/{file_id}/move", response_model=dict, description="Move file to another folder.")
 async def move_file_route(
     file_id: UUID,
+    request: Request,
     new_folder_id: Optional[UUID] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    await file_repo.move_file(db, file_id, new_folder_id)
+    user_id = await file_repo.move_file(db, file_id, new_folder_id)
+    if user_id:
+        record_event(request, user_id, "file_move")
     return {"detail": "File moved"}
 
 @router.get("/{file_id}", response_model=FileOut, description="Get information about a file by its ID. Not available for files in the Recycle Bin.")
 async def get_file_info(
     file_id: UUID,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
     file = await file_repo.get_file_info(db, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
+    # The ETag covers every field of the metadata, so renames, moves and scan results change it
+    headers = {"ETag": representation_etag(FileOut.model_validate(file).model_dump_json()), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if is_not_modified(request.headers, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return file
 
-@router.get("/download/{file_id}", description="Download file by ID. Not available for files from the basket.")
+@router.get("/download/{file_id}", description="Download file by ID. Not available for files from the basket.", dependencies=[limit_concurrency(download_limiter, per_client=True)])
 async def download_file(
     file_id: UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    file = await file_repo.download_file(db, file_id)
+    file = await file_repo.download_file(db, file_id, request.headers)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     return file
@@ -133,48 +169,141 @@ def options_download_file(
 @router.delete("/{file_id}", response_model=dict, description="Delete file (move to trash). The file will be stored in the trash for 24 hours before being permanently deleted.")
 async def delete_file(
     file_id: UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     result = await file_repo.delete_file(db, file_id)
     if not result:
         raise HTTPException(status_code=404, detail="File not found")
+    record_event(request, result.user_id, "file_delete")
     return {"detail": "File moved to trash for 24h"}
 
 @router.post("/restore/{file_id}", response_model=FileOut, description="Restore file from Recycle Bin. If storage limit is exceeded, recovery is impossible.")
 async def restore_file(
     file_id: UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     file = await file_repo.restore_file(db, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
+    record_event(request, file.user_id, "file_restore")
     return file
 
-@router.get("/presigned/{file_id}", response_model=dict, description="Get a temporary (presigned) link to download a file from MinIO. Not available for files from the Recycle Bin.")
+@router.get("/presigned/{file_id}", response_model=dict, description="Get a temporary (presigned) link to download a file from MinIO. Not available for files from the Recycle Bin.", dependencies=[audit("file_share")])
 async def get_presigned_url(
     file_id: UUID,
-    expires_in: int = 3600,
-    db: AsyncSession = Depends(get_db)
+    expires_in: int = Query(3600, ge=1, le=60 * 60 * 24 * 7),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
 ):
     try:
-        return await file_repo.get_presigned_url(db, file_id, expires_in)
+        return await file_repo.get_presigned_url(db, file_id, expires_in, user_id=current_user.id)
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=404, detail="File not found or is deleted")
 
+@router.post("/presigned", response_model=file_schema.PresignedUrlBatchResponse, description="Get presigned download links for many files in one request (e.g. for gallery views).", dependencies=[audit("file_share")])
+async def get_presigned_urls(
+    request_data: file_schema.PresignedUrlBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.get_presigned_urls(db, current_user.id, request_data.file_ids, request_data.expires_in)
+
+@router.post("/batch", response_model=file_schema.FileBatchResponse, description="Get metadata (and optionally presigned download links) of many files in one request.")
+async def get_files_batch(
+    request_data: file_schema.FileBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.get_files_batch(
+        db,
+        current_user.id,
+        request_data.file_ids,
+        include_urls=request_data.include_urls,
+        expires_in=request_data.expires_in
+    )
+
+@router.post("/archive", description="Download selected files as a ZIP archive (streamed). Files pending antivirus scan or infected are skipped.", dependencies=[audit("file_archive"), limit_concurrency(archive_limiter)])
+async def archive_files(
+    request_data: file_schema.BulkFilesRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    entries = await archive_repo.get_files_archive_entries(db, current_user.id, request_data.file_ids)
+    if not entries:
+        raise HTTPException(status_code=404, detail="No files to archive")
+    return await archive_repo.stream_archive(db, entries, "files")
+
+@router.post("/import", status_code=202, response_model=file_schema.ImportJobStatus, description="Import a ZIP or TAR archive sent as the raw request body into a folder. The folder hierarchy is recreated and the files are stored in the background; poll GET /files/import/{job_id} for progress.", dependencies=[audit("file_import"), limit_concurrency(upload_limiter)])
+async def import_archive(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    folder_id: Optional[UUID] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    status, job = await import_repo.start_import(db, current_user.id, request.stream(), folder_id)
+    background_tasks.add_task(import_repo.run_import, **job, on_file_created=enqueue_scan)
+    return status
+
+@router.get("/import/{job_id}", response_model=file_schema.ImportJobStatus, description="Get the progress of an archive import.")
+async def get_import_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    return await import_repo.get_import_status(current_user.id, job_id)
+
+@router.post("/bulk/move", response_model=file_schema.BulkOperationResponse, description="Move many files to another folder in one request.", dependencies=[audit("file_bulk_move")])
+async def bulk_move_files(
+    request_data: file_schema.BulkMoveRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.bulk_move_files(db, current_user.id, request_data.file_ids, request_data.folder_id)
+
+@router.post("/bulk/delete", response_model=file_schema.BulkOperationResponse, description="Move many files to the Recycle Bin in one request.", dependencies=[audit("file_bulk_delete")])
+async def bulk_delete_files(
+    request_data: file_schema.BulkFilesRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.bulk_delete_files(db, current_user.id, request_data.file_ids)
+
+@router.post("/bulk/restore", response_model=file_schema.BulkOperationResponse, description="Restore many files from the Recycle Bin in one request. Files that do not fit into the storage limit are not restored.", dependencies=[audit("file_bulk_restore")])
+async def bulk_restore_files(
+    request_data: file_schema.BulkFilesRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.bulk_restore_files(db, current_user.id, request_data.file_ids)
+
 @router.get("/search/", response_model=List[FileOut], description="Search files by name for the current user.")
 async def search_files(
+    request: Request,
+    response: Response,
     filename: Optional[str] = None,
     content_type: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    not_modified = await conditional_listing(current_user.id, request, response)
+    if not_modified:
+        return not_modified
     return await file_repo.search_files(db, current_user.id, filename=filename, content_type=content_type)
 
 @router.get("/trash/", response_model=List[FileOut], description="Get all files in trash for the current user.")
 async def get_trash_files(
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    not_modified = await conditional_listing(current_user.id, request, response)
+    if not_modified:
+        return not_modified
     return await file_repo.get_trash_files(db, current_user.id)
 
 @router.get("/stats/", response_model=dict, description="Get file statistics for the current user.")
@@ -184,17 +313,19 @@ async def get_file_stats(
 ):
     return await file_repo.get_file_stats_by_user(db, current_user.id)
 
-@router.get("/{file_id}/preview", description="Get a preview of the file by its ID.")
+@router.get("/{file_id}/preview", description="Get a preview (JPEG thumbnail) of an image, the first page of a PDF or the beginning of a text file. Supports If-None-Match.")
 async def preview_file(
     file_id: UUID,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
 ):
-    file = await file_repo.preview_file(db, file_id)
+    file = await file_repo.preview_file(db, file_id, current_user.id, request.headers.get("if-none-match"), on_missing=enqueue_preview)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     return file
 
-@router.post("/initiate_upload", response_model=file_schema.InitiateUploadResponse, description="Initiate a multipart upload.")
+@router.post("/initiate_upload", response_model=file_schema.InitiateUploadResponse, description="Initiate a multipart upload. The declared size is reserved from the storage quota until the upload is completed or aborted.", dependencies=[audit("upload_initiate")])
 async def initiate_upload(
     request_data: file_schema.InitiateUploadRequest,
     db: AsyncSession = Depends(get_db),
@@ -202,7 +333,7 @@ async def initiate_upload(
 ):
     return await file_repo.initiate_upload(db, current_user.id, request_data)
 
-@router.post("/upload_chunk", description="Upload a chunk for multipart upload.")
+@router.post("/upload_chunk", description="Upload a chunk for multipart upload.", dependencies=[limit_concurrency(chunk_limiter)])
 async def upload_chunk(
     upload_id: str = Query(...),
     part_number: int = Query(...),
@@ -212,15 +343,40 @@ async def upload_chunk(
 ):
     return await file_repo.upload_chunk(db, current_user.id, upload_id, part_number, file_chunk)
 
-@router.post("/complete_upload", response_model=file_schema.FileOut, description="Complete a multipart upload.")
+@router.get("/uploads/{upload_id}", response_model=file_schema.UploadStatus, description="Get the state of a multipart upload: received and missing parts. Used to resume an interrupted upload.")
+async def get_upload_status(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    return await file_repo.get_upload_status(current_user.id, upload_id)
+
+@router.put("/uploads/{upload_id}/parts/{part_number}", response_model=file_schema.UploadPartStatus, description="Upload one part of a multipart upload as the raw request body. Parts can be sent in parallel and in any order.", dependencies=[limit_concurrency(chunk_limiter)])
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    content_length = request.headers.get("content-length")
+    return await file_repo.upload_part_stream(
+        current_user.id,
+        upload_id,
+        part_number,
+        request.stream(),
+        int(content_length) if content_length and content_length.isdigit() else None
+    )
+
+@router.post("/complete_upload", response_model=file_schema.FileOut, description="Complete a multipart upload. The file is created in the folder given at initiation and scanned in the background.", dependencies=[audit("file_upload"), limit_concurrency(upload_limiter)])
 async def complete_upload(
     completion_data: file_schema.CompleteUploadRequest,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    return await file_repo.complete_upload(db, current_user.id, completion_data)
+    db_file = await file_repo.complete_upload(db, current_user.id, completion_data)
+    enqueue_scan(db_file)
+    return db_file
 
-@router.delete("/abort_upload/{upload_id}", status_code=204, description="Abort a multipart upload.")
+@router.delete("/abort_upload/{upload_id}", status_code=204, description="Abort a multipart upload.", dependencies=[audit("upload_abort")])
 async def abort_upload(
     upload_id: str,
     current_user: User = Depends(get_current_user)
@@ -228,7 +384,7 @@ async def abort_upload(
     await file_repo.abort_upload(current_user.id, upload_id)
     return Response(status_code=204)
 
-@router.post("/cleanup_trash", status_code=202)
+@router.post("/cleanup_trash", status_code=202, dependencies=[audit("trash_cleanup")])
 async def cleanup_user_trash(current_user: User = Depends(get_current_user)):
     # Run celery task only for current user
     cleanup_trash.delay(str(current_user.id))
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.schemas.folder import FolderCreate, FolderOut
 from app.repositories.folder_repo import create_folder, get_folder, get_folders_by_user, get_folders_by_parent, delete_folder, delete_folder_recursive, rename_folder, move_folder
+from app.repositories import archive_repo
 from app.core.security import get_current_user
+from app.core.audit import audit
+from app.core.concurrency import limit_concurrency, archive_limiter
+from app.utils.http_cache import conditional_listing
 from uuid import UUID
 from typing import List, Optional
 
@@ -12,7 +16,7 @@ router = APIRouter(
     tags=["folders"]
 )
 
-@router.post("/", response_model=FolderOut, description="Create folder")
+@router.post("/", response_model=FolderOut, description="Create folder", dependencies=[audit("folder_create")])
 async def create(
     folder: FolderCreate,
     db: AsyncSession = Depends(get_db),
@@ -35,20 +39,30 @@ async def get(
 
 @router.get("/", response_model=List[FolderOut], description="List all folders for the current user.")
 async def list_folders(
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    not_modified = await conditional_listing(current_user.id, request, response)
+    if not_modified:
+        return not_modified
     return await get_folders_by_user(db, current_user.id)
 
 @router.get("/by_parent/", response_model=List[FolderOut], description="List folders by parent folder for the current user.")
 async def list_by_parent(
+    request: Request,
+    response: Response,
     parent_id: Optional[UUID] = None,
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
+    not_modified = await conditional_listing(current_user.id, request, response)
+    if not_modified:
+        return not_modified
     return await get_folders_by_parent(db, current_user.id, parent_id)
 
-@router.delete("/{folder_id}", description="Delete folder by id")
+@router.delete("/{folder_id}", description="Delete folder by id", dependencies=[audit("folder_delete")])
 async def delete(
     folder_id: UUID,
     db: AsyncSession = Depends(get_db),
@@ -62,7 +76,7 @@ async def delete(
     await delete_folder(db, folder_id)
     return {"detail": "Folder deleted"}
 
-@router.delete("/{folder_id}/recursive", description="Recursively delete folder and all contents")
+@router.delete("/{folder_id}/recursive", description="Recursively delete folder and all contents", dependencies=[audit("folder_delete_recursive")])
 async def delete_recursive(
     folder_id: UUID,
     db: AsyncSession = Depends(get_db),
@@ -76,7 +90,7 @@ async def delete_recursive(
     await delete_folder_recursive(db, folder_id)
     return {"detail": "Folder and all contents deleted"}
 
-@router.put("/{folder_id}/rename", description="Rename folder")
+@router.put("/{folder_id}/rename", description="Rename folder", dependencies=[audit("folder_rename")])
 async def rename(
     folder_id: UUID,
     data: dict,
@@ -91,7 +105,7 @@ async def rename(
     await rename_folder(db, folder_id, data["new_name"])
     return {"detail": "Folder renamed"}
 
-@router.put("/{folder_id}/move", description="Move folder to another parent")
+@router.put("/{folder_id}/move", description="Move folder to another parent", dependencies=[audit("folder_move")])
 async def move(
     folder_id: UUID,
     data: dict,
@@ -104,4 +118,18 @@ async def move(
     if folder.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
     await move_folder(db, folder_id, data["new_parent_id"])
-    return {"detail": "Folder moved"}
\ No newline at end of file
+    return {"detail": "Folder moved"}
+
+@router.get("/{folder_id}/archive", description="Download a folder with all its contents as a ZIP archive (streamed). Files pending antivirus scan or infected are skipped.", dependencies=[audit("folder_archive"), limit_concurrency(archive_limiter)])
+async def archive(
+    folder_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    folder = await get_folder(db, folder_id)
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    if folder.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    root_name, entries = await archive_repo.get_folder_archive_entries(db, current_user.id, folder_id)
+    return await archive_repo.stream_archive(db, entries, root_name)
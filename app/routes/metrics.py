@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_db
+from app.core.security import get_current_admin
+from app.models.user import User
+from app.repositories.file_repo import get_scan_stats
+from app.utils.content_cache import content_cache
+from app.utils.presign import presigned_url_cache
+from app.core.audit import audit_writer
+from app.core.concurrency import concurrency_limiters
+from app.core.rate_limit import rate_limiter
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+@router.get("/scan", response_model=dict, description="Antivirus scan metrics (administrators only): number of files pending scan, age of the oldest one, failed scans and scan-to-available latency of background scans.")
+async def scan_metrics(
+    window_minutes: int = 60,
+    db: AsyncSession = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    return await get_scan_stats(db, window_minutes)
+
+@router.get("/cache", response_model=dict, description="Hit ratios of the in-process caches of this worker: decrypted content (memory and disk tiers) and presigned URLs.")
+async def cache_metrics():
+    return {
+        "content": content_cache.stats(),
+        "presigned_urls": {"hits": presigned_url_cache.hits, "misses": presigned_url_cache.misses}
+    }
+
+@router.get("/audit", response_model=dict, description="Batched audit log writer of this worker: queued, written, dropped (queue full) and failed events.")
+async def audit_metrics():
+    return audit_writer.stats()
+
+
+@router.get("/concurrency", response_model=dict, description="Concurrency limiters of this worker (uploads, upload parts, downloads, archives): active and queued requests and rejections.")
+async def concurrency_metrics():
+    return {limiter.name: limiter.stats() for limiter in concurrency_limiters}
+
+@router.get("/rate_limit", response_model=dict, description="Rate limiter of this worker: requests decided locally and by Redis, tracked keys and synchronisation batches.")
+async def rate_limit_metrics():
+    return rate_limiter.stats()
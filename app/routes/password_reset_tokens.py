@@ -4,14 +4,14 @@ from app.db.database import get_db
 from app.schemas.password_reset_token import PasswordResetTokenCreate, PasswordResetTokenOut
 from app.repositories.password_reset_token_repo import create_reset_token, get_by_token, mark_token_used, get_valid_token
 from datetime import datetime, timezone
-from fastapi_limiter.depends import RateLimiter
+from app.core.rate_limit import rate_limit
 
 router = APIRouter(
     prefix="/reset_tokens",
     tags=["reset_tokens"]
 )
 
-@router.post("/", response_model=PasswordResetTokenOut, description="Generate a new password reset token. Accepts the user's email and returns the generated token.", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+@router.post("/", response_model=PasswordResetTokenOut, description="Generate a new password reset token. Accepts the user's email and returns the generated token.", dependencies=[rate_limit(times=5, seconds=60)])
 async def create_token(
     data: PasswordResetTokenCreate,
     db: AsyncSession = Depends(get_db)
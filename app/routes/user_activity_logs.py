@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.schemas.user_activity_log import UserActivityLogCreate, UserActivityLogOut
 from app.repositories.user_activity_log_repo import create_log, get_logs_by_user, get_logs_by_date_range
 from app.core.security import get_current_user
 from datetime import datetime
+from uuid import UUID
+from typing import Optional
 
 router = APIRouter(
     prefix="/activity_logs",
@@ -28,10 +30,16 @@ async def logs_by_user(
 ):
     return await get_logs_by_user(db, current_user.id)
 
-@router.get("/date_range/", response_model=list[UserActivityLogOut], description="Get a list of activity logs for the specified date range.")
+@router.get("/date_range/", response_model=list[UserActivityLogOut], description="Get a page of the current user's activity logs in [start, end), newest first. For the next page pass the action_time and id of the last log as before and before_id.")
 async def logs_by_date_range(
     start: datetime, 
     end: datetime, 
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[datetime] = None,
+    before_id: Optional[UUID] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user)
 ):
-    return await get_logs_by_date_range(db, start, end)
\ No newline at end of file
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return await get_logs_by_date_range(db, current_user.id, start, end, limit, before, before_id)
\ No newline at end of file
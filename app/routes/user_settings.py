@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.schemas.user_settings import UserSettingsCreate, UserSettingsOut
-from app.repositories.user_settings_repo import create_settings, get_settings_by_user, update_settings, delete_settings_by_user
+from app.repositories.user_settings_repo import create_settings, get_cached_settings_by_user, update_settings, delete_settings_by_user
 from app.core.security import get_current_user
 from uuid import UUID
 
@@ -28,7 +28,7 @@ async def get_user_settings(
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    settings = await get_settings_by_user(db, current_user.id)
+    settings = await get_cached_settings_by_user(db, current_user.id)
     if not settings:
         raise HTTPException(status_code=404, detail="Settings not found")
     return settings
@@ -49,11 +49,8 @@ async def delete_user_settings(
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    settings = await get_settings_by_user(db, current_user.id)
-    if not settings:
+    if not await delete_settings_by_user(db, current_user.id):
         return {"detail": "Settings not found"}
-    await db.delete(settings)
-    await db.commit()
     return {"detail": "Settings deleted"}
 
 @router.delete("/user/{user_id}", description="Delete settings of a specific user")
@@ -1,14 +1,15 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from app.db.database import get_db
-from app.schemas.user import UserCreate, UserOut, UserDelete
-from app.repositories.user_repo import create_user, authenticate_user, delete_user, get_user_by_username
-from app.repositories.user_settings_repo import create_settings
-from app.schemas.user_settings import UserSettingsCreate
-from app.core.security import create_access_token, get_current_user
+from app.schemas.user import UserCreate, UserOut, UserDelete, UserProvisionRequest, UserProvisionResponse, UserProvisionResult
+from app.repositories.user_repo import register_user, provision_users, authenticate_user, delete_user, get_user_by_username
+from app.models.user import User
+from app.core.security import create_access_token, get_current_user, get_current_admin
+from app.core.password_utils import hash_passwords_bulk
+from app.core.audit import audit, record_event
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_limiter.depends import RateLimiter
+from app.core.rate_limit import rate_limit
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 TESTING = os.getenv("TESTING") == "1"
@@ -18,52 +19,69 @@ router = APIRouter(
     tags=["users"]
 )
 
-@router.post("/", response_model=UserOut, description="Register a new user. Accepts username, email and password. Returns the created user's details.", dependencies=[Depends(RateLimiter(times=5, seconds=60))] if not TESTING else [])
+# Registers a user with default settings and records the registration
+async def _register(
+    user: UserCreate,
+    request: Request,
+    db: AsyncSession
+) -> UserOut:
+    db_user = await register_user(db, user.username, user.email, user.password)
+    if not db_user:
+        raise HTTPException(status_code=400, detail="A user with that name or email already exists.")
+    record_event(request, db_user.id, "register")
+    return UserOut.model_validate(db_user)
+
+@router.post("/", response_model=UserOut, description="Register a new user. Accepts username, email and password. Returns the created user's details.", dependencies=[rate_limit(times=5, seconds=60)] if not TESTING else [])
 async def register(
     user: UserCreate, 
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    db_user = await create_user(db, user.username, user.email, user.password)
-    if not db_user:
-        raise HTTPException(status_code=400, detail="A user with that name or email already exists.")
-    
-    # Create default user settings
-    settings_data = UserSettingsCreate(
-        storage_limit=1024*1024*1024,  # 1GB
-        theme="system",
-        language="en",
-        notifications_enabled=True
-    ).model_dump()
-    settings_data["user_id"] = db_user.id
-    await create_settings(db, settings_data) 
-
-    # Explicitly validate and return UserOut schema
-    user_out = UserOut.model_validate(db_user)
-    return user_out
+    return await _register(user, request, db)
 
 # Additional route for registration with the same functionality
-@router.post("/register", response_model=UserOut, description="Alternative registration endpoint for frontend compatibility.", dependencies=[Depends(RateLimiter(times=5, seconds=60))] if not TESTING else [])
+@router.post("/register", response_model=UserOut, description="Alternative registration endpoint for frontend compatibility.", dependencies=[rate_limit(times=5, seconds=60)] if not TESTING else [])
 async def register_alt(
     user: UserCreate, 
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    db_user = await create_user(db, user.username, user.email, user.password)
-    if not db_user:
-        raise HTTPException(status_code=400, detail="A user with that name or email already exists.")
-    
-    # Create default user settings
-    settings_data = UserSettingsCreate(
-        storage_limit=1024*1024*1024,  # 1GB
-        theme="system",
-        language="en",
-        notifications_enabled=True
-    ).model_dump()
-    settings_data["user_id"] = db_user.id
-    await create_settings(db, settings_data) 
+    return await _register(user, request, db)
 
-    # Explicitly validate and return UserOut schema
-    user_out = UserOut.model_validate(db_user)
-    return user_out
+@router.post("/bulk", response_model=UserProvisionResponse, description="Create many users with default settings in one request (administrators only). Each user has a password or an existing bcrypt password_hash; users whose username or email is taken are skipped.", dependencies=[audit("user_provision")])
+async def provision_users_route(
+    request_data: UserProvisionRequest,
+    db: AsyncSession = Depends(get_db),
+    current_admin: User = Depends(get_current_admin)
+):
+    items = []
+    seen = set()
+    duplicates = set()
+    for index, user in enumerate(request_data.users):
+        if user.username in seen:
+            duplicates.add(index)
+            continue
+        seen.add(user.username)
+        items.append(user)
+    # The few plain passwords allowed are hashed outside the pool used by logins
+    hashes = iter(await hash_passwords_bulk([user.password for user in items if user.password_hash is None]))
+    created = await provision_users(db, [{
+        "username": user.username,
+        "email": user.email,
+        "password_hash": user.password_hash or next(hashes),
+        "role": user.role.value,
+        "is_verified": user.is_verified,
+        "settings": {"storage_limit": user.storage_limit}
+    } for user in items])
+    results = []
+    for index, user in enumerate(request_data.users):
+        if index in duplicates:
+            results.append(UserProvisionResult(username=user.username, status="duplicate"))
+        elif user.username in created:
+            results.append(UserProvisionResult(username=user.username, status="created", id=created[user.username].id))
+        else:
+            results.append(UserProvisionResult(username=user.username, status="exists"))
+    return UserProvisionResponse(created=len(created), results=results)
 
 @router.get("/me", response_model=UserOut)
 async def get_me(current_user=Depends(get_current_user)):
@@ -84,14 +102,16 @@ async def get_user(
     user_out = UserOut.model_validate(db_user)
     return user_out
 
-@router.post("/login", description="User login by username and password. Returns access token, user ID, and username upon successful authentication.", dependencies=[Depends(RateLimiter(times=5, seconds=60))] if not TESTING else [])
+@router.post("/login", description="User login by username and password. Returns access token, user ID, and username upon successful authentication.", dependencies=[rate_limit(times=5, seconds=60)] if not TESTING else [])
 async def login_user(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
 ):
     user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    record_event(request, user.id, "login")
     access_token = create_access_token({"sub": str(user.id)})
     return {"access_token": access_token, "token_type": "bearer", "user_id": str(user.id)}
 
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Literal, Dict
 from uuid import UUID
 from datetime import datetime
 
@@ -20,17 +20,121 @@ class FileOut(FileBase):
     is_deleted: bool
     deleted_at: Optional[datetime]
     is_infected: bool
+    scan_status: str = "clean"
+    scanned_at: Optional[datetime] = None
+    blob_hash: Optional[str] = None
     model_config = ConfigDict(from_attributes=True)
 
+class CheckHashRequest(BaseModel):
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
+    size: int
+    filename: str
+    content_type: str
+    folder_id: Optional[UUID] = None
+
+class CheckHashResponse(BaseModel):
+    exists: bool
+    file: Optional[FileOut] = None
+
+# Maximum number of files in one batch request
+MAX_BATCH_FILES = 500
+# Maximum number of files in one bulk move/delete/restore request
+MAX_BULK_FILES = 10000
+
+class PresignedUrlBatchRequest(BaseModel):
+    file_ids: List[UUID] = Field(min_length=1, max_length=MAX_BATCH_FILES)
+    expires_in: int = Field(default=3600, ge=1, le=60 * 60 * 24 * 7)
+
+class PresignedUrlBatchResponse(BaseModel):
+    urls: Dict[UUID, str]
+    # Files without a URL and the reason (not found, deleted, pending scan or infected)
+    errors: Dict[UUID, str]
+
+class FileBatchRequest(BaseModel):
+    file_ids: List[UUID] = Field(min_length=1, max_length=MAX_BATCH_FILES)
+    include_urls: bool = False
+    expires_in: int = Field(default=3600, ge=1, le=60 * 60 * 24 * 7)
+
+class FileBatchItem(BaseModel):
+    file: FileOut
+    url: Optional[str] = None
+    # Why no URL was issued for the file (pending scan or infected)
+    url_error: Optional[str] = None
+
+class FileBatchResponse(BaseModel):
+    files: List[FileBatchItem]
+    missing: List[UUID]
+
+class BulkFilesRequest(BaseModel):
+    file_ids: List[UUID] = Field(min_length=1, max_length=MAX_BULK_FILES)
+
+class BulkMoveRequest(BulkFilesRequest):
+    # None moves the files to the root
+    folder_id: Optional[UUID] = None
+
+class BulkFileResult(BaseModel):
+    id: UUID
+    # moved / deleted / restored on success, otherwise not_found or storage_limit_exceeded
+    status: str
+
+class BulkOperationResponse(BaseModel):
+    results: List[BulkFileResult]
+    succeeded: int
+    failed: int
+
+class ImportJobStatus(BaseModel):
+    job_id: str
+    # queued / running / completed / completed_with_errors / failed
+    status: str
+    total_files: int
+    total_bytes: int
+    processed_files: int
+    processed_bytes: int
+    failed_files: int
+    errors: List[str] = []
+    error: Optional[str] = None
+
+# S3/MinIO: minimum size of a part (except the last one) is 5 MB, maximum number of parts is 10000.
+# Parts sent through the API are held in memory until they are sent to MinIO, so their size is capped well below
+# the S3 maximum of 5 GB (10000 parts of 64 MB still allow files of 640 GB).
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+MAX_PART_COUNT = 10000
+
 class InitiateUploadRequest(BaseModel):
     filename: str
-    size: int
+    size: int = Field(ge=0)
     folder_id: Optional[UUID] = None
     content_type: str
+    part_size: int = Field(default=8 * 1024 * 1024, ge=MIN_PART_SIZE, le=MAX_PART_SIZE)
+    # "proxy" - parts are sent through the API, "direct" - parts are PUT to presigned MinIO URLs
+    mode: Literal["proxy", "direct"] = "proxy"
+
+class PresignedPartUrl(BaseModel):
+    part_number: int
+    url: str
 
 class InitiateUploadResponse(BaseModel):
     upload_id: str
     object_name: str
+    part_size: Optional[int] = None
+    part_count: Optional[int] = None
+    part_urls: Optional[List[PresignedPartUrl]] = None
+
+class UploadPartStatus(BaseModel):
+    part_number: int
+    etag: str
+    size: int
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    object_name: str
+    size: Optional[int] = None
+    part_size: Optional[int] = None
+    part_count: Optional[int] = None
+    received_bytes: int
+    received_parts: List[UploadPartStatus]
+    missing_parts: List[int]
 
 class UploadChunkRequest(BaseModel):
     upload_id: str
@@ -45,7 +149,8 @@ class CompleteUploadPart(BaseModel):
 class CompleteUploadRequest(BaseModel):
     upload_id: str
     object_name: str
-    parts: List[CompleteUploadPart]
+    # Parts tracked by the server are used if the client does not send them
+    parts: Optional[List[CompleteUploadPart]] = None
 
 class FileStats(BaseModel):
     total_files: int
@@ -1,7 +1,7 @@
-from pydantic import BaseModel, EmailStr, field_validator, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator, ConfigDict
 from enum import Enum
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 from app.models.user import UserRole
 
@@ -13,22 +13,76 @@ class UserBase(BaseModel):
     username: str
     email: EmailStr
 
+# Maximum number of users created by one bulk provisioning request
+USER_PROVISION_MAX = 5000
+# Plain passwords are hashed on the server (about 0.3 s each); larger requests must send bcrypt password hashes
+USER_PROVISION_MAX_PLAIN_PASSWORDS = 20
+
+def check_password_strength(v):
+    if len(v) < 8:
+        raise ValueError("Password must be at least 8 characters long")
+    if not any(c.isalpha() for c in v):
+        raise ValueError("Password must contain at least one letter")
+    if not any(c.isdigit() for c in v):
+        raise ValueError("Password must contain at least one digit")
+    if not any(c in "!@#$%^&*()-_=+[]{};:,.<>/?\\|" for c in v):
+        raise ValueError("The password must contain at least one special character.")
+    return v
+
 class UserCreate(UserBase):
     password: str
 
     @field_validator("password")
     @classmethod
     def password_length(cls, v):
-        if len(v) < 8:
-            raise ValueError("Password must be at least 8 characters long")
-        if not any(c.isalpha() for c in v):
-            raise ValueError("Password must contain at least one letter")
-        if not any(c.isdigit() for c in v):
-            raise ValueError("Password must contain at least one digit")
-        if not any(c in "!@#$%^&*()-_=+[]{};:,.<>/?\\|" for c in v):
-            raise ValueError("The password must contain at least one special character.")
+        return check_password_strength(v)
+
+# A user created by an administrator: either a password or an existing bcrypt hash (e.g. migrated
+# from another system, which avoids hashing thousands of passwords in one request)
+class UserProvision(UserBase):
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+    role: UserRole = UserRole.user
+    is_verified: bool = False
+    storage_limit: Optional[int] = None
+
+    @field_validator("password")
+    @classmethod
+    def password_length(cls, v):
+        return check_password_strength(v) if v is not None else v
+
+    @field_validator("password_hash")
+    @classmethod
+    def bcrypt_hash(cls, v):
+        if v is not None and not (v.startswith(("$2a$", "$2b$", "$2y$")) and len(v) == 60):
+            raise ValueError("password_hash must be a bcrypt hash")
         return v
 
+    @model_validator(mode="after")
+    def one_password(self):
+        if (self.password is None) == (self.password_hash is None):
+            raise ValueError("Either password or password_hash is required")
+        return self
+
+class UserProvisionRequest(BaseModel):
+    users: List[UserProvision] = Field(..., min_length=1, max_length=USER_PROVISION_MAX)
+
+    @model_validator(mode="after")
+    def plain_password_limit(self):
+        if sum(user.password is not None for user in self.users) > USER_PROVISION_MAX_PLAIN_PASSWORDS:
+            raise ValueError(f"At most {USER_PROVISION_MAX_PLAIN_PASSWORDS} users may have a plain password, send password_hash for the others")
+        return self
+
+class UserProvisionResult(BaseModel):
+    username: str
+    # "created", "exists" (username or email taken) or "duplicate" (repeated in the request)
+    status: str
+    id: Optional[UUID] = None
+
+class UserProvisionResponse(BaseModel):
+    created: int
+    results: List[UserProvisionResult]
+
 class UserOut(UserBase):
     id: UUID
     created_at: datetime
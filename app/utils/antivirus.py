@@ -1,27 +1,112 @@
 import pyclamd
 import os
+import time
+import hashlib
+import logging
 from fastapi import HTTPException
+from app.utils.redis_client import get_scan_verdict, store_scan_verdict
+
+logger = logging.getLogger(__name__)
+
+VERDICT_CLEAN = "clean"
+VERDICT_INFECTED = "infected"
+
+# How long the ClamAV signature database version is trusted before asking clamd again
+SIGNATURE_VERSION_TTL_SECONDS = int(os.getenv("CLAMAV_SIGNATURE_VERSION_TTL", 60))
+
+# Last known signature database version of clamd (shared by all requests of the process)
+_signature_version = {"value": None, "checked_at": 0.0}
+
+# Gets the ClamAV signature database version, e.g. "26890" from "ClamAV 1.0.1/26890/Mon Apr 17 07:25:40 2023".
+# The value is cached in the process for SIGNATURE_VERSION_TTL_SECONDS.
+def get_signature_version(
+    cd
+) -> str | None:
+    now = time.monotonic()
+    if _signature_version["value"] and now - _signature_version["checked_at"] < SIGNATURE_VERSION_TTL_SECONDS:
+        return _signature_version["value"]
+    try:
+        version = cd.version()
+    except Exception as e:
+        logger.warning(f"Failed to get ClamAV signature version: {e}")
+        return _signature_version["value"]
+    parts = version.split("/")
+    _signature_version["value"] = parts[1].strip() if len(parts) > 1 else version.strip()
+    _signature_version["checked_at"] = now
+    return _signature_version["value"]
+
+# Reads a cached verdict; cache errors are not fatal, the content is simply scanned again
+async def _lookup_verdict(
+    signature_version: str | None,
+    content_sha256: str
+) -> str | None:
+    if not signature_version:
+        return None
+    try:
+        return await get_scan_verdict(signature_version, content_sha256)
+    except Exception as e:
+        logger.warning(f"Scan verdict cache lookup failed: {e}")
+        return None
+
+# Saves a verdict to the cache; cache errors are not fatal
+async def _remember_verdict(
+    signature_version: str | None,
+    content_sha256: str,
+    verdict: str
+) -> None:
+    if not signature_version:
+        return
+    try:
+        await store_scan_verdict(signature_version, content_sha256, verdict)
+    except Exception as e:
+        logger.warning(f"Scan verdict cache store failed: {e}")
+
+# Raises HTTPException if the verdict says the content is infected
+def _raise_for_verdict(
+    verdict: str
+) -> None:
+    if verdict == VERDICT_INFECTED:
+        raise HTTPException(status_code=400, detail="File is infected with a virus")
+
+# Decides what to do when clamd is unreachable: trust a verdict made with the last known
+# signature database, otherwise report the service as unavailable
+async def _verdict_without_clamd(
+    content: bytes,
+    content_sha256: str
+) -> None:
+    verdict = await _lookup_verdict(_signature_version["value"], content_sha256)
+    if verdict:
+        _raise_for_verdict(verdict)
+        return
+    if b"EICAR" in content:
+        raise HTTPException(status_code=400, detail="File is infected with a virus")
+    raise HTTPException(status_code=503, detail="Antivirus service unavailable")
 
 # Checks file bytes for viruses using ClamAV.
+# Verdicts are cached by content SHA-256 and signature database version, so identical content
+# is sent to clamd only once per signature update.
 # Throws HTTPException if a virus is found or the service is unavailable.
 async def scan_bytes_for_viruses(
-    content: bytes
+    content: bytes,
+    content_sha256: str | None = None
 ) -> None:
     clamav_host = os.getenv("CLAMAV_HOST", "localhost")
     clamav_port = int(os.getenv("CLAMAV_PORT", 3310))
+    content_sha256 = content_sha256 or hashlib.sha256(content).hexdigest()
     try:
         cd = pyclamd.ClamdNetworkSocket(host=clamav_host, port=clamav_port)
         if not cd.ping():
-            if b"EICAR" in content:
-                raise HTTPException(status_code=400, detail="File is infected with a virus")
-            raise HTTPException(status_code=503, detail="Antivirus service unavailable")
-        scan_result = cd.scan_stream(content)
-        if scan_result is not None:
-            raise HTTPException(status_code=400, detail="File is infected with a virus")
+            await _verdict_without_clamd(content, content_sha256)
+            return
+        signature_version = get_signature_version(cd)
+        verdict = await _lookup_verdict(signature_version, content_sha256)
+        if verdict is None:
+            scan_result = cd.scan_stream(content)
+            verdict = VERDICT_INFECTED if scan_result is not None else VERDICT_CLEAN
+            await _remember_verdict(signature_version, content_sha256, verdict)
+        _raise_for_verdict(verdict)
     except pyclamd.ConnectionError:
-        if b"EICAR" in content:
-            raise HTTPException(status_code=400, detail="File is infected with a virus")
-        raise HTTPException(status_code=503, detail="Antivirus service unavailable")
+        await _verdict_without_clamd(content, content_sha256)
     except HTTPException:
         raise
     except Exception as e:
@@ -1,9 +1,14 @@
 import pyclamd
 import os
+import struct
+import asyncio
 from fastapi import HTTPException
+from typing import AsyncIterator
 
 CLAMAV_HOST = os.getenv("CLAMAV_HOST", "clamav")
 CLAMAV_PORT = int(os.getenv("CLAMAV_PORT", 3310))
+# Maximum size of one INSTREAM chunk sent to clamd
+INSTREAM_CHUNK_SIZE = 64 * 1024
 
 # Performs antivirus scanning of transferred bytes using ClamAV
 async def scan_bytes(
@@ -14,4 +19,30 @@ async def scan_bytes(
         result = cd.scan_stream(data)
         return result is None
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ClamAV error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"ClamAV error: {e}")
+
+# Scans a stream of byte chunks with the clamd INSTREAM command without holding the whole file in memory.
+# Returns the virus name if one is found, otherwise None.
+# Raises OSError if clamd is unreachable and RuntimeError if clamd reports an error (e.g. size limit).
+async def scan_chunks(
+    chunks: AsyncIterator[bytes]
+) -> str | None:
+    reader, writer = await asyncio.open_connection(CLAMAV_HOST, CLAMAV_PORT)
+    try:
+        writer.write(b"zINSTREAM\0")
+        async for chunk in chunks:
+            for start in range(0, len(chunk), INSTREAM_CHUNK_SIZE):
+                piece = chunk[start:start + INSTREAM_CHUNK_SIZE]
+                writer.write(struct.pack("!L", len(piece)) + piece)
+                await writer.drain()
+        writer.write(struct.pack("!L", 0))
+        await writer.drain()
+        reply = (await reader.readuntil(b"\0")).rstrip(b"\0").decode(errors="replace").strip()
+    finally:
+        writer.close()
+    # Replies look like "stream: OK", "stream: Eicar-Signature FOUND" or "... ERROR"
+    if reply.endswith("OK"):
+        return None
+    if reply.endswith("FOUND"):
+        return reply[len("stream:"):-len("FOUND")].strip()
+    raise RuntimeError(f"ClamAV error: {reply}")
@@ -0,0 +1,262 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+# Decrypted content of small files is kept in memory, up to this many bytes per worker (0 disables the tier)
+CONTENT_CACHE_MEMORY_BYTES = int(os.getenv("CONTENT_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+# Files larger than this are not kept in memory
+CONTENT_CACHE_MAX_FILE_SIZE = int(os.getenv("CONTENT_CACHE_MAX_FILE_SIZE", 1024 * 1024))
+# Optional local disk tier (unset disables it). It holds plaintext, so it must be a private local directory.
+CONTENT_CACHE_DIR = os.getenv("CONTENT_CACHE_DIR", "")
+CONTENT_CACHE_DISK_BYTES = int(os.getenv("CONTENT_CACHE_DISK_BYTES", 1024 * 1024 * 1024))
+# Files larger than this are not kept on disk either, they always bypass the cache
+CONTENT_CACHE_DISK_MAX_FILE_SIZE = int(os.getenv("CONTENT_CACHE_DISK_MAX_FILE_SIZE", 32 * 1024 * 1024))
+
+# Version of the content of a file: a deduplicated blob is identified by its hash, other files by their object
+def content_version(
+    file
+) -> str:
+    return file.blob_hash or file.path
+
+# Two-tier cache of decrypted file content: an LRU in memory bounded by bytes for small files and an optional
+# LRU directory on local disk bounded by its own budget for larger ones (sent straight from the file).
+# Entries are keyed by file id and content version, so a replaced content is never served;
+# invalidate() drops all versions of a file.
+# The cache is only consulted after the file row was checked, so it never decides access by itself.
+class ContentCache:
+    def __init__(
+        self,
+        memory_bytes: int = CONTENT_CACHE_MEMORY_BYTES,
+        max_file_size: int = CONTENT_CACHE_MAX_FILE_SIZE,
+        directory: str = CONTENT_CACHE_DIR,
+        disk_bytes: int = CONTENT_CACHE_DISK_BYTES,
+        disk_max_file_size: int = CONTENT_CACHE_DISK_MAX_FILE_SIZE
+    ):
+        self.memory_bytes = memory_bytes
+        self.max_file_size = max_file_size if memory_bytes > 0 else 0
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.disk_max_file_size = disk_max_file_size if directory else 0
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        if directory:
+            self._load_disk_index()
+
+    # Picks up entries left on disk by a previous run (oldest first), so the budget holds across restarts
+    def _load_disk_index(self) -> None:
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith("."):
+                    # Temporary file of an interrupted write
+                    os.unlink(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError as e:
+            logger.error(f"Content cache directory {self.directory} is unusable, disk tier disabled: {e}")
+            self.disk_max_file_size = 0
+            return
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_used += size
+        self._evict_disk()
+
+    # Whether content of this size may be cached at all
+    def accepts(
+        self,
+        size: int
+    ) -> bool:
+        return size <= max(self.max_file_size, self.disk_max_file_size)
+
+    @staticmethod
+    def _name(
+        file_id,
+        version: str
+    ) -> str:
+        return f"{file_id}-{hashlib.sha256(version.encode()).hexdigest()[:16]}"
+
+    def _path(
+        self,
+        name: str
+    ) -> str:
+        return os.path.join(self.directory, name)
+
+    # Returns the cached content: bytes from the memory tier, an open file of the disk tier entry
+    # (to be sent without copying, the caller closes it) or None. Blocking on a disk hit:
+    # call it in a thread if the disk tier is enabled.
+    def lookup(
+        self,
+        file_id,
+        version: str,
+        size: int
+    ) -> bytes | BinaryIO | None:
+        if not self.accepts(size):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        name = self._name(file_id, version)
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                self.memory_hits += 1
+                return data
+        # The directory may be shared by the workers of the host, so an entry unknown to this worker is looked up too
+        if size > self.max_file_size and size <= self.disk_max_file_size:
+            try:
+                # Once open, the content stays readable even if the entry is evicted meanwhile
+                f = open(self._path(name), "rb")
+            except OSError:
+                self._forget_disk(name)
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    if name in self._disk:
+                        self._disk.move_to_end(name)
+                    else:
+                        self._disk[name] = size
+                        self._disk_used += size
+                return f
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # Stores decrypted content (a no-op for sizes the cache does not accept). Blocking if it goes to disk.
+    def put(
+        self,
+        file_id,
+        version: str,
+        data: bytes
+    ) -> None:
+        name = self._name(file_id, version)
+        if len(data) <= self.max_file_size:
+            self._put_memory(name, data)
+        elif len(data) <= self.disk_max_file_size:
+            self._put_disk(name, data)
+
+    def _put_memory(
+        self,
+        name: str,
+        data: bytes
+    ) -> None:
+        with self._lock:
+            previous = self._memory.pop(name, None)
+            if previous is not None:
+                self._memory_used -= len(previous)
+            self._memory[name] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+                self.evictions += 1
+
+    def _put_disk(
+        self,
+        name: str,
+        data: bytes
+    ) -> None:
+        try:
+            # Written under a temporary name and renamed, so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except OSError as e:
+            logger.warning(f"Failed to write content cache entry {name}: {e}")
+            return
+        with self._lock:
+            self._disk_used += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while True:
+            with self._lock:
+                if self._disk_used <= self.disk_bytes or not self._disk:
+                    return
+                name, size = self._disk.popitem(last=False)
+                self._disk_used -= size
+                self.evictions += 1
+            self._unlink(name)
+
+    def _forget_disk(
+        self,
+        name: str
+    ) -> None:
+        with self._lock:
+            self._disk_used -= self._disk.pop(name, 0)
+
+    def _unlink(
+        self,
+        name: str
+    ) -> None:
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove content cache entry {name}: {e}")
+
+    # Drops every cached version of a file (on delete, move to trash or replaced content)
+    def invalidate(
+        self,
+        file_id
+    ) -> None:
+        prefix = f"{file_id}-"
+        with self._lock:
+            for name in [name for name in self._memory if name.startswith(prefix)]:
+                self._memory_used -= len(self._memory.pop(name))
+        if not self.directory:
+            return
+        # The directory is scanned too: the entry may have been written by another worker
+        try:
+            names = [entry.name for entry in os.scandir(self.directory) if entry.name.startswith(prefix)]
+        except OSError:
+            names = []
+        for name in names:
+            self._forget_disk(name)
+            self._unlink(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_used
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            names = list(self._disk)
+            self._disk.clear()
+            self._disk_used = 0
+        for name in names:
+            self._unlink(name)
+
+content_cache = ContentCache()
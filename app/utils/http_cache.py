@@ -0,0 +1,109 @@
+from fastapi import Response
+from app.utils.redis_client import bump_change_counter, get_change_counter
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clients may keep responses but must revalidate them (cheap with ETags)
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+# Checks an If-None-Match header against the current ETag of a resource (weak comparison, as for GET)
+def etag_matches(
+    if_none_match: str | None,
+    etag: str
+) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+# Decides whether the client copy is still valid: If-None-Match has priority, If-Modified-Since
+# is only used without it (RFC 9110)
+def is_not_modified(
+    headers,
+    etag: str,
+    last_modified: datetime | None = None
+) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have a one-second resolution
+    return _as_utc(last_modified).replace(microsecond=0) <= since
+
+def _as_utc(
+    value: datetime
+) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+# Formats a datetime for the Last-Modified header
+def http_date(
+    value: datetime
+) -> str:
+    return format_datetime(_as_utc(value).astimezone(timezone.utc), usegmt=True)
+
+# Strong ETag of file content: the content of a file id never changes, the hash or size
+# only guards against reused ids
+def file_content_etag(
+    file
+) -> str:
+    return f'"{file.id.hex}-{file.blob_hash or file.size}"'
+
+# ETag of a representation (e.g. file metadata) computed from its serialized form
+def representation_etag(
+    data: str
+) -> str:
+    return f'"{hashlib.sha256(data.encode()).hexdigest()[:32]}"'
+
+# Weak ETag of a listing of the user: changes with every change of the user's files or folders.
+# Returns None if the change counter is unavailable, then the listing is sent without an ETag.
+async def listing_etag(
+    user_id,
+    request
+) -> str | None:
+    try:
+        counter = await get_change_counter(str(user_id))
+    except Exception as e:
+        logger.warning(f"Change counter unavailable for user {user_id}: {e}")
+        return None
+    query = hashlib.sha256(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+    return f'W/"{counter}-{query}"'
+
+# Records that the user's files or folders changed, so cached listings are revalidated.
+# Call after the change is committed.
+async def mark_user_changed(
+    user_id
+) -> None:
+    try:
+        await bump_change_counter(str(user_id))
+    except Exception as e:
+        logger.warning(f"Failed to bump change counter for user {user_id}: {e}")
+
+# Handles a conditional listing request: returns a 304 response if the client copy is current,
+# otherwise sets the listing ETag on the response being built and returns None
+async def conditional_listing(
+    user_id,
+    request,
+    response
+):
+    etag = await listing_etag(user_id, request)
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
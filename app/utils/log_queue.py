@@ -0,0 +1,104 @@
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+import copy
+import json
+import logging
+import os
+import queue
+
+# Records waiting for the writer thread per queued logger; when the queue is full new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# "text" (default) or "json": one JSON object per line with the structured fields of the record
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+# Attributes every LogRecord has; everything else was passed with extra= and is structured data
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+# Formats records as JSON lines including the fields passed with extra=
+class JsonFormatter(logging.Formatter):
+    def format(
+        self,
+        record: logging.LogRecord
+    ) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+# Queue handler that never blocks the caller: a record that does not fit into the queue is dropped and counted
+class DroppingQueueHandler(QueueHandler):
+    def __init__(
+        self,
+        log_queue: queue.Queue
+    ):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    # QueueHandler merges the arguments into the message and clears record.args, but formatters of the
+    # listener may need them (uvicorn's AccessFormatter unpacks the arguments of access records).
+    # The listener runs in this process, so the record is passed on unformatted; only the traceback is
+    # rendered here, so the record does not keep the frames alive.
+    def prepare(
+        self,
+        record: logging.LogRecord
+    ) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(
+        self,
+        record: logging.LogRecord
+    ) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listeners = []
+
+# Moves the handlers of the loggers behind queues: the request path only puts records into a queue,
+# writing to the console or files happens in a listener thread per logger. Each logger keeps its own
+# handlers and formats (e.g. the ones uvicorn configured for its loggers).
+def setup_queue_logging(
+    logger_names=("", "uvicorn", "uvicorn.access", "uvicorn.error"),
+    level: int = logging.INFO
+) -> None:
+    logging.basicConfig(level=level, format=LOG_TEXT_FORMAT)
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        if any(queued is logger for queued, _, _ in _listeners):
+            continue
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers:
+            continue
+        if LOG_FORMAT == "json":
+            for handler in handlers:
+                handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        logger.handlers = [DroppingQueueHandler(log_queue)]
+        listener.start()
+        _listeners.append((logger, handlers, listener))
+
+# Writes out the queued records and gives the handlers back to their loggers
+def stop_queue_logging() -> None:
+    while _listeners:
+        logger, handlers, listener = _listeners.pop()
+        listener.stop()
+        logger.handlers = handlers
+
+# Number of records dropped because a queue was full
+def dropped_log_records() -> int:
+    return sum(handler.dropped for logger, _, _ in _listeners for handler in logger.handlers if isinstance(handler, DroppingQueueHandler))
@@ -8,9 +8,11 @@ MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET", "files")
 
-# Initiates a multipart upload of an object to MinIO and returns the upload_id
+# Initiates a multipart upload of an object to MinIO and returns the upload_id.
+# With server_side_encryption the storage encrypts the object (SSE-S3, requires KMS configured in MinIO).
 async def initiate_multipart_upload(
-    object_name: str
+    object_name: str,
+    server_side_encryption: bool = False
 ) -> str:
     session = get_session()
     async with session.create_client(
@@ -21,7 +23,8 @@ async def initiate_multipart_upload(
         region_name='us-east-1',
     ) as client:
         try:
-            response = await client.create_multipart_upload(Bucket=MINIO_BUCKET, Key=object_name)
+            params = {"ServerSideEncryption": "AES256"} if server_side_encryption else {}
+            response = await client.create_multipart_upload(Bucket=MINIO_BUCKET, Key=object_name, **params)
             return response['UploadId']
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to initiate multipart upload: {e}")
@@ -112,3 +115,82 @@ async def stat_object(
             return await client.head_object(Bucket=MINIO_BUCKET, Key=object_name)
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Object not found: {e}")
+
+# Generates presigned UploadPart URLs for parts 1..part_count, so the client can PUT parts directly to MinIO
+async def get_presigned_part_urls(
+    object_name: str,
+    upload_id: str,
+    part_count: int,
+    expires_in: int = 3600
+) -> List[dict]:
+    session = get_session()
+    async with session.create_client(
+        's3',
+        endpoint_url=f"http://{MINIO_ENDPOINT}",
+        aws_secret_access_key=MINIO_SECRET_KEY,
+        aws_access_key_id=MINIO_ACCESS_KEY,
+        region_name='us-east-1',
+    ) as client:
+        try:
+            return [
+                {
+                    "part_number": part_number,
+                    "url": await client.generate_presigned_url(
+                        'upload_part',
+                        Params={'Bucket': MINIO_BUCKET, 'Key': object_name, 'UploadId': upload_id, 'PartNumber': part_number},
+                        ExpiresIn=expires_in
+                    )
+                }
+                for part_number in range(1, part_count + 1)
+            ]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to presign upload parts: {e}")
+
+# Lists the parts MinIO has received for a multipart upload: {part_number: {"etag", "size"}}
+async def list_parts(
+    object_name: str,
+    upload_id: str
+) -> dict:
+    session = get_session()
+    async with session.create_client(
+        's3',
+        endpoint_url=f"http://{MINIO_ENDPOINT}",
+        aws_secret_access_key=MINIO_SECRET_KEY,
+        aws_access_key_id=MINIO_ACCESS_KEY,
+        region_name='us-east-1',
+    ) as client:
+        try:
+            parts = {}
+            paginator = client.get_paginator('list_parts')
+            async for page in paginator.paginate(Bucket=MINIO_BUCKET, Key=object_name, UploadId=upload_id):
+                for part in page.get('Parts', []):
+                    parts[part['PartNumber']] = {"etag": part['ETag'], "size": part['Size']}
+            return parts
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"Multipart upload not found: {e}")
+
+# Lists multipart uploads in progress in the bucket: [{"object_name", "upload_id", "initiated"}]
+async def list_multipart_uploads(
+    prefix: str = ""
+) -> List[dict]:
+    session = get_session()
+    async with session.create_client(
+        's3',
+        endpoint_url=f"http://{MINIO_ENDPOINT}",
+        aws_secret_access_key=MINIO_SECRET_KEY,
+        aws_access_key_id=MINIO_ACCESS_KEY,
+        region_name='us-east-1',
+    ) as client:
+        try:
+            uploads = []
+            paginator = client.get_paginator('list_multipart_uploads')
+            async for page in paginator.paginate(Bucket=MINIO_BUCKET, Prefix=prefix):
+                for upload in page.get('Uploads', []):
+                    uploads.append({
+                        "object_name": upload['Key'],
+                        "upload_id": upload['UploadId'],
+                        "initiated": upload['Initiated']
+                    })
+            return uploads
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to list multipart uploads: {e}")
@@ -62,10 +62,10 @@ async def remove_object_from_minio(
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"MinIO remove error: {e}")
 
-# Generates a presigned URL to download an object from MinIO
-async def get_presigned_url(
-    minio_path, 
-    expires_in=3600
+# Streams object bytes from MinIO in chunks of up to chunk_size bytes
+async def iter_object_chunks(
+    object_name: str,
+    chunk_size: int = 1024 * 1024
 ):
     session = get_session()
     async with session.create_client(
@@ -76,11 +76,12 @@ async def get_presigned_url(
         region_name='us-east-1',
     ) as client:
         try:
-            url = await client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET, 'Key': minio_path},
-                ExpiresIn=expires_in
-            )
-            return url
+            response = await client.get_object(Bucket=BUCKET, Key=object_name)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"MinIO presigned url error: {e}")
+            raise HTTPException(status_code=404, detail=f"File not found in storage: {e}")
+        async with response['Body'] as stream:
+            while True:
+                chunk = await stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
@@ -0,0 +1,93 @@
+from botocore.auth import S3SigV4QueryAuth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from collections import OrderedDict
+from urllib.parse import quote
+from app.utils.minio_utils import MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, BUCKET
+import os
+import threading
+import time
+
+MINIO_REGION = "us-east-1"
+# SigV4 presigned URLs can not live longer than 7 days
+MAX_PRESIGN_EXPIRES = 60 * 60 * 24 * 7
+# Requested lifetimes are rounded down to a multiple of this, so close requests share one cached URL
+PRESIGN_EXPIRY_BUCKET_SECONDS = int(os.getenv("PRESIGN_EXPIRY_BUCKET", 300))
+# A cached URL is reused while more than this share of its lifetime remains
+PRESIGN_REUSE_THRESHOLD = float(os.getenv("PRESIGN_REUSE_THRESHOLD", 0.5))
+# Maximum number of cached URLs per process
+PRESIGN_CACHE_SIZE = int(os.getenv("PRESIGN_CACHE_SIZE", 10000))
+
+# Credentials are created once per process; signing is pure computation, no client or connection is needed
+_credentials = Credentials(MINIO_ACCESS_KEY, MINIO_SECRET_KEY)
+
+# Rounds the requested lifetime down to its expiry bucket, so a URL never outlives the request.
+# Lifetimes shorter than one bucket are kept as requested.
+def expiry_bucket(
+    expires_in: int
+) -> int:
+    expires_in = max(1, expires_in)
+    bucket = expires_in // PRESIGN_EXPIRY_BUCKET_SECONDS * PRESIGN_EXPIRY_BUCKET_SECONDS
+    return min(bucket or expires_in, MAX_PRESIGN_EXPIRES)
+
+# Signs a GET URL for an object locally (SigV4 query string, path-style URL as MinIO expects)
+def sign_get_url(
+    object_name: str,
+    expires_in: int
+) -> str:
+    url = f"http://{MINIO_ENDPOINT}/{BUCKET}/{quote(object_name, safe='/~')}"
+    request = AWSRequest(method="GET", url=url)
+    S3SigV4QueryAuth(_credentials, "s3", MINIO_REGION, expires=expires_in).add_auth(request)
+    return request.url
+
+# LRU cache of issued URLs: (object_name, expiry bucket) -> (url, issued_at, expires_at)
+class PresignedUrlCache:
+    def __init__(
+        self,
+        max_size: int = PRESIGN_CACHE_SIZE,
+        reuse_threshold: float = PRESIGN_REUSE_THRESHOLD
+    ):
+        self.max_size = max_size
+        self.reuse_threshold = reuse_threshold
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns a cached URL for the object, or signs and caches a new one.
+    # A URL of the bucket lives at most as long as requested, so a cached one always expires within the request.
+    def get_url(
+        self,
+        object_name: str,
+        expires_in: int = 3600
+    ) -> str:
+        bucket = expiry_bucket(expires_in)
+        key = (object_name, bucket)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item and item[2] - now > (item[2] - item[1]) * self.reuse_threshold:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+        url = sign_get_url(object_name, bucket)
+        with self._lock:
+            self.misses += 1
+            self._items[key] = (url, now, now + bucket)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return url
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+presigned_url_cache = PresignedUrlCache()
+
+# Gets a presigned GET URL for an object, reusing a cached one while enough of its lifetime remains
+def get_presigned_get_url(
+    object_name: str,
+    expires_in: int = 3600
+) -> str:
+    return presigned_url_cache.get_url(object_name, expires_in)
@@ -0,0 +1,107 @@
+import io
+import logging
+
+# Rendering libraries are optional: without them previews are simply not generated
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:
+    Image = None
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (320, 320)
+PREVIEW_MEDIA_TYPE = "image/jpeg"
+# Bump to regenerate previews after changing the rendering
+PREVIEW_VERSION = 1
+# Originals larger than this are not previewed (the task reads the whole file)
+PREVIEW_MAX_SOURCE_SIZE = 50 * 1024 * 1024
+# How much of a text file is rendered
+TEXT_PREVIEW_LINES = 24
+TEXT_PREVIEW_COLUMNS = 60
+
+TEXT_CONTENT_TYPES = {"application/json", "application/xml", "application/javascript", "application/x-yaml"}
+
+# Object name of the preview of a file in MinIO
+def preview_object_name(
+    file_id
+) -> str:
+    return f"derivatives/{file_id}/preview-v{PREVIEW_VERSION}.jpg"
+
+# Kind of preview for a content type: "image", "pdf", "text" or None if previews are not supported
+def preview_kind(
+    content_type: str | None
+) -> str | None:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type.startswith("image/") and content_type != "image/svg+xml":
+        return "image" if Image else None
+    if content_type == "application/pdf":
+        return "pdf" if Image and pypdfium2 else None
+    if content_type.startswith("text/") or content_type in TEXT_CONTENT_TYPES:
+        return "text" if Image else None
+    return None
+
+def _to_jpeg(
+    image
+) -> bytes:
+    image.thumbnail(PREVIEW_SIZE)
+    if image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+def _render_image(
+    data: bytes
+) -> bytes:
+    image = Image.open(io.BytesIO(data))
+    # JPEG can be decoded at a reduced scale, which is much faster for large photos
+    image.draft("RGB", PREVIEW_SIZE)
+    return _to_jpeg(ImageOps.exif_transpose(image))
+
+def _render_pdf(
+    data: bytes
+) -> bytes:
+    document = pypdfium2.PdfDocument(data)
+    try:
+        page = document[0]
+        width, height = page.get_size()
+        scale = max(PREVIEW_SIZE) / max(width, height, 1)
+        return _to_jpeg(page.render(scale=scale).to_pil())
+    finally:
+        document.close()
+
+def _render_text(
+    data: bytes
+) -> bytes:
+    text = data[:TEXT_PREVIEW_LINES * (TEXT_PREVIEW_COLUMNS + 1) * 4].decode("utf-8", errors="replace")
+    lines = [line[:TEXT_PREVIEW_COLUMNS] for line in text.splitlines()[:TEXT_PREVIEW_LINES]]
+    image = Image.new("RGB", PREVIEW_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    for number, line in enumerate(lines):
+        draw.text((8, 8 + number * 12), line, fill="black", font=font)
+    return _to_jpeg(image)
+
+# Renders the preview of file content as JPEG: a thumbnail of an image, the first page of a PDF
+# or the first lines of a text file. Returns None if the content can not be previewed.
+def render_preview(
+    data: bytes,
+    content_type: str | None
+) -> bytes | None:
+    kind = preview_kind(content_type)
+    try:
+        if kind == "image":
+            return _render_image(data)
+        if kind == "pdf":
+            return _render_pdf(data)
+        if kind == "text":
+            return _render_text(data)
+    except Exception as e:
+        logger.warning(f"Failed to render {kind} preview: {e}")
+    return None
@@ -0,0 +1,121 @@
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from typing import BinaryIO, Mapping, Optional, Tuple
+import anyio
+import os
+
+# ASGI extension of servers that can send a file descriptor with sendfile()
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+# Chunk size of the fallback path for servers without the extension
+RANGED_RESPONSE_CHUNK_SIZE = 1024 * 1024
+
+# Parses a Range header against the content size. Returns (start, end) inclusive, None to send the
+# whole content (no header, other units or several ranges), or raises ValueError if the range is unsatisfiable.
+def parse_range(
+    header: Optional[str],
+    size: int
+) -> Optional[Tuple[int, int]]:
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multipart ranges are not supported: the full content is a valid answer
+        return None
+    first, dash, last = (part.strip() for part in spec.partition("-"))
+    if not dash or not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit():
+        # A malformed range is ignored
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(int(last) if last else size - 1, size - 1)
+
+# Response of downloaded content with byte range support. The content is either bytes (served from memory)
+# or an open file (a local cache entry): a file is sent with sendfile() by servers offering the
+# zero-copy ASGI extension, otherwise it is read in chunks at the requested offsets. The file is closed
+# after sending, so it may already be unlinked (e.g. evicted from the cache) when the response is built.
+class RangedContentResponse(Response):
+    def __init__(
+        self,
+        content: bytes | BinaryIO,
+        size: int,
+        media_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        range_header: Optional[str] = None,
+        if_range: Optional[str] = None
+    ):
+        self.content = content
+        self.media_type = media_type
+        self.background = None
+        headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+        byte_range = None
+        # A range of a stale copy is only served if the client's validator still matches (strong comparison)
+        if range_header and (not if_range or if_range.strip() == headers.get("ETag")):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.offset, self.length = 0, 0
+                headers["Content-Range"] = f"bytes */{size}"
+                headers["Content-Length"] = "0"
+                self.init_headers(headers)
+                return
+        if byte_range:
+            self.status_code = 206
+            self.offset, self.length = byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+        else:
+            self.status_code = 200
+            self.offset, self.length = 0, size
+        headers["Content-Length"] = str(self.length)
+        self.init_headers(headers)
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send
+    ) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if isinstance(self.content, (bytes, bytearray, memoryview)):
+                body = self.content
+                if self.length != len(body):
+                    body = bytes(memoryview(body)[self.offset:self.offset + self.length])
+                await send({"type": "http.response.body", "body": body})
+            elif ZEROCOPY_EXTENSION in scope.get("extensions", {}) and self.length:
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": self.content,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False
+                })
+            else:
+                await self._send_chunks(send)
+        finally:
+            if not isinstance(self.content, (bytes, bytearray, memoryview)):
+                self.content.close()
+
+    async def _send_chunks(
+        self,
+        send: Send
+    ) -> None:
+        fd = self.content.fileno()
+        offset, remaining = self.offset, self.length
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(RANGED_RESPONSE_CHUNK_SIZE, remaining), offset)
+            if not chunk:
+                raise OSError("Cached file is shorter than expected")
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
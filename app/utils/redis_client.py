@@ -1,30 +1,86 @@
 import redis.asyncio as redis
 import json
+import os
 from app.config import settings
 
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+redis_client = redis.from_url(settings.redis_url, decode_responses=True)
 
 UPLOAD_EXPIRATION_SECONDS = 60 * 60 * 24 # 24 hours
+SCAN_VERDICT_EXPIRATION_SECONDS = 60 * 60 * 24 * 30 # 30 days
+IMPORT_JOB_EXPIRATION_SECONDS = 60 * 60 * 24 # 24 hours
+SETTINGS_CACHE_EXPIRATION_SECONDS = int(os.getenv("SETTINGS_CACHE_TTL", 60 * 60)) # 1 hour
 
-# Stores information about the multipart load in Redis
+# Stores information about the multipart load in Redis.
+# The session is a hash: "info" holds the upload metadata, "part:<n>" fields hold received parts,
+# so parts uploaded in parallel by different workers never overwrite each other.
 async def store_upload_info(
     upload_id: str, 
     object_name: str,
-    user_id: str
+    user_id: str,
+    size: int | None = None,
+    filename: str | None = None,
+    content_type: str | None = None,
+    folder_id: str | None = None,
+    part_size: int | None = None,
+    mode: str = "proxy",
+    encryption_salt: str | None = None,
+    encryption_iv: str | None = None
 ):
     key = f"upload:{upload_id}"
-    data = json.dumps({"object_name": object_name, "user_id": user_id})
-    await redis_client.setex(key, UPLOAD_EXPIRATION_SECONDS, data)
+    data = json.dumps({
+        "object_name": object_name,
+        "user_id": user_id,
+        "size": size,
+        "part_size": part_size,
+        "mode": mode,
+        "encryption_salt": encryption_salt,
+        "encryption_iv": encryption_iv,
+        "filename": filename,
+        "content_type": content_type,
+        "folder_id": folder_id
+    })
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, "info", data)
+        pipe.expire(key, UPLOAD_EXPIRATION_SECONDS)
+        await pipe.execute()
 
-# Gets information about a multipart load from Redis
+# Gets information about a multipart load from Redis, with received parts under "parts" ({part_number: {"etag", "size"}})
 async def get_upload_info(
     upload_id: str
 ) -> dict | None:
     key = f"upload:{upload_id}"
-    data = await redis_client.get(key)
-    if data:
-        return json.loads(data)
-    return None
+    data = await redis_client.hgetall(key)
+    if not data or "info" not in data:
+        return None
+    info = json.loads(data["info"])
+    info["parts"] = {
+        int(field.split(":", 1)[1]): json.loads(value)
+        for field, value in data.items()
+        if field.startswith("part:")
+    }
+    return info
+
+# Records a received part of a multipart load (its byte offset in the file is needed for decryption)
+# and extends the session lifetime
+async def store_upload_part(
+    upload_id: str,
+    part_number: int,
+    etag: str,
+    size: int,
+    offset: int | None = None
+):
+    key = f"upload:{upload_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, f"part:{part_number}", json.dumps({"etag": etag, "size": size, "offset": offset}))
+        pipe.expire(key, UPLOAD_EXPIRATION_SECONDS)
+        await pipe.execute()
+
+# Checks whether a multipart load session is still alive in Redis
+async def upload_session_exists(
+    upload_id: str
+) -> bool:
+    key = f"upload:{upload_id}"
+    return bool(await redis_client.exists(key))
 
 # Removes multipart load information from Redis
 async def delete_upload_info(
@@ -32,3 +88,302 @@ async def delete_upload_info(
 ):
     key = f"upload:{upload_id}"
     await redis_client.delete(key)
+
+# Reserves storage quota for an upload in progress, so parallel uploads can not exceed the limit together
+async def reserve_storage(
+    user_id: str,
+    upload_id: str,
+    size: int
+):
+    key = f"quota:reserved:{user_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, upload_id, size)
+        pipe.expire(key, UPLOAD_EXPIRATION_SECONDS)
+        await pipe.execute()
+
+# Releases the storage quota reserved for an upload
+async def release_storage(
+    user_id: str,
+    upload_id: str
+):
+    await redis_client.hdel(f"quota:reserved:{user_id}", upload_id)
+
+# Gets the total storage reserved by the user's uploads in progress
+async def get_reserved_storage(
+    user_id: str
+) -> int:
+    values = await redis_client.hvals(f"quota:reserved:{user_id}")
+    return sum(int(value) for value in values)
+
+# Creates the status of an archive import job
+async def create_import_job(
+    job_id: str,
+    user_id: str,
+    **fields
+):
+    key = f"import:{job_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={"user_id": user_id, **{name: json.dumps(value) for name, value in fields.items()}})
+        pipe.expire(key, IMPORT_JOB_EXPIRATION_SECONDS)
+        await pipe.execute()
+
+# Updates fields of an archive import job status
+async def update_import_job(
+    job_id: str,
+    **fields
+):
+    key = f"import:{job_id}"
+    await redis_client.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+
+# Gets the status of an archive import job
+async def get_import_job(
+    job_id: str
+) -> dict | None:
+    data = await redis_client.hgetall(f"import:{job_id}")
+    if not data:
+        return None
+    user_id = data.pop("user_id")
+    return {"user_id": user_id, **{name: json.loads(value) for name, value in data.items()}}
+
+# Increments the change counter of the user's files and folders (used for listing ETags)
+async def bump_change_counter(
+    user_id: str
+):
+    key = f"changes:{user_id}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hsetnx(key, "epoch", os.urandom(4).hex())
+        pipe.hincrby(key, "counter", 1)
+        await pipe.execute()
+
+# Gets the change counter of the user as "<epoch>-<counter>". The random epoch is set when
+# the counter is created, so a counter lost with Redis data never repeats an old value.
+async def get_change_counter(
+    user_id: str
+) -> str:
+    key = f"changes:{user_id}"
+    data = await redis_client.hgetall(key)
+    if "epoch" not in data:
+        await redis_client.hsetnx(key, "epoch", os.urandom(4).hex())
+        data = await redis_client.hgetall(key)
+    return f"{data['epoch']}-{data.get('counter', 0)}"
+
+# Gets the cached antivirus verdict for content with the given SHA-256.
+# Keys are namespaced by the ClamAV signature database version, so a signature
+# update makes all previous verdicts unreachable (they expire by TTL).
+async def get_scan_verdict(
+    signature_version: str,
+    content_sha256: str
+) -> str | None:
+    key = f"scan:{signature_version}:{content_sha256}"
+    return await redis_client.get(key)
+
+# Stores the antivirus verdict ("clean" or "infected") for content with the given SHA-256
+async def store_scan_verdict(
+    signature_version: str,
+    content_sha256: str,
+    verdict: str
+):
+    key = f"scan:{signature_version}:{content_sha256}"
+    await redis_client.setex(key, SCAN_VERDICT_EXPIRATION_SECONDS, verdict)
+
+
+# Gets the cached settings of the user (a dict of the columns) or None, and the version of the settings.
+# The version is passed back to store_cached_settings when the settings were missing.
+async def get_cached_settings(
+    user_id: str
+) -> tuple:
+    data, version = await redis_client.mget(f"settings:{user_id}", f"settings:ver:{user_id}")
+    return (json.loads(data) if data else None), version or "0"
+
+# Caches the settings only if they were not invalidated since the version was read,
+# so settings read from the database before a change can not be written back over it
+_STORE_SETTINGS_SCRIPT = redis_client.register_script("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+""")
+
+# Caches the settings of the user read at the version. Returns False if they changed in the meantime.
+async def store_cached_settings(
+    user_id: str,
+    data: dict,
+    version: str
+) -> bool:
+    stored = await _STORE_SETTINGS_SCRIPT(
+        keys=[f"settings:{user_id}", f"settings:ver:{user_id}"],
+        args=[version, json.dumps(data), SETTINGS_CACHE_EXPIRATION_SECONDS]
+    )
+    return bool(stored)
+
+# Removes the cached settings of the user (after they are created, changed or deleted) and bumps their version.
+# The version outlives the cached entry, so a fill started before the change is always refused.
+async def delete_cached_settings(
+    user_id: str
+):
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(f"settings:{user_id}")
+        pipe.incr(f"settings:ver:{user_id}")
+        pipe.expire(f"settings:ver:{user_id}", SETTINGS_CACHE_EXPIRATION_SECONDS * 2)
+        await pipe.execute()
+
+# Takes a slot in the global and the per-user lease sets of a concurrency limiter in one step.
+# A lease is a sorted set member scored by its expiry, so slots of crashed workers free themselves.
+# Returns 0 if the slot was taken, 1 if the user has no free slot, 2 if no slot is free at all.
+_ACQUIRE_LEASE_SCRIPT = redis_client.register_script("""
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if tonumber(ARGV[5]) > 0 and redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then
+    return 1
+end
+if tonumber(ARGV[4]) > 0 and redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 2
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return 0
+""")
+
+async def acquire_concurrency_lease(
+    name: str,
+    user_key: str,
+    token: str,
+    now: float,
+    lease_seconds: int,
+    global_limit: int,
+    per_user_limit: int
+) -> int:
+    return await _ACQUIRE_LEASE_SCRIPT(
+        keys=[f"concurrency:{name}", f"concurrency:{name}:{user_key}"],
+        args=[now, now + lease_seconds, token, global_limit, per_user_limit, lease_seconds]
+    )
+
+# Frees a slot taken with acquire_concurrency_lease
+async def release_concurrency_lease(
+    name: str,
+    user_key: str,
+    token: str
+):
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.zrem(f"concurrency:{name}", token)
+        pipe.zrem(f"concurrency:{name}:{user_key}", token)
+        await pipe.execute()
+
+# Moves the expiry of slots still held forward. Leases that already expired are not taken again.
+async def renew_concurrency_leases(
+    name: str,
+    leases: list,
+    now: float,
+    lease_seconds: int
+):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for token, user_key in leases:
+            pipe.zadd(f"concurrency:{name}", {token: now + lease_seconds}, xx=True)
+            pipe.zadd(f"concurrency:{name}:{user_key}", {token: now + lease_seconds}, xx=True)
+            pipe.expire(f"concurrency:{name}:{user_key}", lease_seconds)
+        pipe.expire(f"concurrency:{name}", lease_seconds)
+        await pipe.execute()
+
+# Adds the hits counted by a worker to the fixed-window rate limit counters and reads the current totals.
+# KEYS are pairs of (current window, previous window) counters, ARGV pairs of (hits, window length in ms).
+# Returns the totals as a flat list: current and previous count of every pair.
+_SYNC_RATE_LIMITS_SCRIPT = redis_client.register_script("""
+local totals = {}
+for i = 1, #KEYS, 2 do
+    local hits = tonumber(ARGV[i])
+    local current = 0
+    if hits > 0 then
+        current = redis.call('INCRBY', KEYS[i], hits)
+        redis.call('PEXPIRE', KEYS[i], 2 * tonumber(ARGV[i + 1]))
+    else
+        current = tonumber(redis.call('GET', KEYS[i]) or '0')
+    end
+    table.insert(totals, current)
+    table.insert(totals, tonumber(redis.call('GET', KEYS[i + 1]) or '0'))
+end
+return totals
+""")
+
+# Counts a request against a sliding window (the current window plus the weighted previous one) if it fits.
+# ARGV: limit, weight of the previous window, window length in ms, unsynced hits of the worker (always added).
+# Returns {1 if allowed else 0, current count, previous count}.
+_CHECK_RATE_LIMIT_SCRIPT = redis_client.register_script("""
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local hits = tonumber(ARGV[4])
+local allowed = 0
+if previous * tonumber(ARGV[2]) + current + hits + 1 <= tonumber(ARGV[1]) then
+    allowed = 1
+    hits = hits + 1
+end
+if hits > 0 then
+    current = redis.call('INCRBY', KEYS[1], hits)
+    redis.call('PEXPIRE', KEYS[1], 2 * tonumber(ARGV[3]))
+end
+return {allowed, current, previous}
+""")
+
+async def sync_rate_limit_counters(
+    counters: list
+) -> list:
+    keys, args = [], []
+    for current_key, previous_key, hits, window_ms in counters:
+        keys += [current_key, previous_key]
+        args += [hits, window_ms]
+    totals = await _SYNC_RATE_LIMITS_SCRIPT(keys=keys, args=args)
+    return [(totals[i], totals[i + 1]) for i in range(0, len(totals), 2)]
+
+async def check_rate_limit_counter(
+    current_key: str,
+    previous_key: str,
+    limit: int,
+    previous_weight: float,
+    window_ms: int,
+    hits: int
+) -> tuple:
+    allowed, current, previous = await _CHECK_RATE_LIMIT_SCRIPT(
+        keys=[current_key, previous_key],
+        args=[limit, previous_weight, window_ms, hits]
+    )
+    return bool(allowed), current, previous
+
+# Counts a failed login of the username. The counter lives for the attempt window from the first failure;
+# the failure that reaches the limit extends it to the lockout time. Returns the number of failures.
+_LOGIN_FAILURE_SCRIPT = redis_client.register_script("""
+local failures = redis.call('INCR', KEYS[1])
+if failures == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+if failures == tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return failures
+""")
+
+async def record_login_failure(
+    username: str,
+    window_seconds: int,
+    max_attempts: int,
+    lockout_seconds: int
+) -> int:
+    return await _LOGIN_FAILURE_SCRIPT(keys=[f"login_failures:{username}"], args=[window_seconds, max_attempts, lockout_seconds])
+
+# Gets the number of recent failed logins of the username and the seconds until the counter expires
+async def get_login_failures(
+    username: str
+) -> tuple:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(f"login_failures:{username}")
+        pipe.ttl(f"login_failures:{username}")
+        failures, ttl = await pipe.execute()
+    return int(failures or 0), ttl
+
+# Resets the failed logins of the username (after a successful login)
+async def clear_login_failures(
+    username: str
+):
+    await redis_client.delete(f"login_failures:{username}")
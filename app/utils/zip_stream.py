@@ -0,0 +1,65 @@
+import time
+import zipfile
+
+# Collects the bytes zipfile writes, so they can be yielded to the client as they are produced.
+# zipfile treats the sink as an unseekable stream: entries get data descriptors (CRC and sizes
+# after the data) and nothing is ever rewritten, so the archive can be streamed.
+class _ZipSink:
+    def __init__(self):
+        self._chunks = []
+
+    def write(
+        self,
+        data
+    ) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    # Returns the bytes written since the previous call
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# Builds a ZIP archive incrementally: entries are written chunk by chunk and the produced bytes
+# are taken with drain() after every step. Entries are stored without compression
+# (stored content is mostly compressed media or documents); ZIP64 records are used when an entry,
+# an offset or the number of entries exceeds the classic ZIP limits.
+class ZipStreamWriter:
+    def __init__(self):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._entry = None
+
+    # Starts an entry; size is the exact number of bytes that will be written to it
+    def start_entry(
+        self,
+        name: str,
+        size: int,
+        modified: float | None = None
+    ) -> None:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(modified or time.time())[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = size
+        self._entry = self._zip.open(info, mode="w", force_zip64=size >= zipfile.ZIP64_LIMIT)
+
+    def write(
+        self,
+        data: bytes
+    ) -> None:
+        self._entry.write(data)
+
+    # Finishes the current entry (writes its data descriptor)
+    def end_entry(self) -> None:
+        self._entry.close()
+        self._entry = None
+
+    # Writes the central directory and the end records
+    def close(self) -> None:
+        self._zip.close()
+
+    def drain(self) -> bytes:
+        return self._sink.drain()
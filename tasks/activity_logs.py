@@ -0,0 +1,40 @@
+from app.db.database import AsyncSessionLocal
+from app.repositories.user_activity_log_repo import create_partitions, drop_logs_before, add_months
+from tasks.celery_app import celery_app
+from datetime import datetime, timezone, date
+from typing import Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Activity logs are kept for this many whole months before the current one
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv("ACTIVITY_LOG_RETENTION_MONTHS", 12))
+# Monthly partitions are created this many months ahead, so new rows never land in the default partition
+ACTIVITY_LOG_PARTITIONS_AHEAD = int(os.getenv("ACTIVITY_LOG_PARTITIONS_AHEAD", 3))
+
+# Creates the upcoming monthly partitions of user_activity_logs and drops the expired ones
+async def maintain_activity_logs(
+    retention_months: int = ACTIVITY_LOG_RETENTION_MONTHS,
+    partitions_ahead: int = ACTIVITY_LOG_PARTITIONS_AHEAD,
+    today: Optional[date] = None
+) -> dict:
+    current = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    cutoff = add_months(current, -retention_months)
+    async with AsyncSessionLocal() as db:
+        created = []
+        if db.bind.dialect.name == "postgresql":
+            created = await create_partitions(db, current, add_months(current, partitions_ahead))
+        dropped = await drop_logs_before(db, cutoff)
+    return {"created": created, "dropped": dropped, "cutoff": cutoff.isoformat()}
+
+# Celery beat task: keeps the monthly partitions of the activity log and applies the retention
+@celery_app.task
+def maintain_activity_logs_task():
+    report = asyncio.run(maintain_activity_logs())
+    logger.info(
+        f"Activity log maintenance: partitions created {report['created']}, "
+        f"dropped {report['dropped']} (logs before {report['cutoff']} removed)"
+    )
+    return report
@@ -0,0 +1,23 @@
+from celery import Celery
+from app.config import settings
+import os
+
+# Single Celery application shared by all task modules, so one worker/beat serves every task
+celery_app = Celery(
+    'tasks',
+    broker=settings.redis_url,
+    backend=settings.redis_url,
+    include=["tasks.scan", "tasks.cleanup", "tasks.uploads", "tasks.previews", "tasks.activity_logs"]
+)
+
+# Periodic tasks run by celery beat
+celery_app.conf.beat_schedule = {
+    "reap-stale-uploads": {
+        "task": "tasks.uploads.reap_stale_uploads_task",
+        "schedule": float(os.getenv("STALE_UPLOAD_REAP_INTERVAL", 60 * 60)),
+    },
+    "maintain-activity-logs": {
+        "task": "tasks.activity_logs.maintain_activity_logs_task",
+        "schedule": float(os.getenv("ACTIVITY_LOG_MAINTENANCE_INTERVAL", 60 * 60 * 24)),
+    },
+}
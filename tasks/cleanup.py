@@ -1,20 +1,21 @@
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func
 from app.db.database import AsyncSessionLocal
 from app.models.file import File as FileModel
 from app.models.file_encryption import FileEncryption
-from app.utils.minio_client import minio_client, BUCKET
+from app.repositories.blob_repo import release_blobs, purge_unreferenced_blobs
+from app.utils.minio_utils import remove_object_from_minio
+from app.utils.http_cache import mark_user_changed
+from app.utils.content_cache import content_cache
+from app.utils.previews import preview_kind, preview_object_name
+from tasks.celery_app import celery_app
 from datetime import datetime, timezone, timedelta
 import asyncio
-from app.config import settings
-from celery import Celery
+import logging
 
-celery_app = Celery(
-    'tasks',
-    broker=settings.redis_url,
-    backend=settings.redis_url
-)
+logger = logging.getLogger(__name__)
 
-# Empty the user's trash: removes files marked as deleted more than 24 hours ago
+# Empty the user's trash: removes files marked as deleted more than 24 hours ago.
+# Deduplicated content is shared, so a blob is removed only when its last file is gone.
 @celery_app.task
 def cleanup_trash(
     user_id: str
@@ -32,13 +33,32 @@ def cleanup_trash(
             )
             files = result.scalars().all()
             for file in files:
-                try:
-                    minio_client.remove_object(BUCKET, file.path)
-                except Exception:
-                    pass # You can add logging of deletion errors from MinIO
+                if file.blob_hash:
+                    await release_blobs(db, FileModel.id == file.id)
+                else:
+                    # Files stored before deduplication own their object, unless another file got the same path
+                    shared = await db.execute(
+                        select(func.count(FileModel.id)).where(FileModel.path == file.path, FileModel.id != file.id)
+                    )
+                    if shared.scalar_one() == 0:
+                        try:
+                            await remove_object_from_minio(file.path)
+                        except Exception as e:
+                            logger.error(f"Failed to remove {file.path} from MinIO: {e}")
+                if preview_kind(file.content_type):
+                    try:
+                        await remove_object_from_minio(preview_object_name(file.id))
+                    except Exception as e:
+                        logger.warning(f"Failed to remove preview of {file.id} from MinIO: {e}")
                 await db.execute(
                     delete(FileEncryption).where(FileEncryption.file_id == file.id)
                 )
                 await db.delete(file)
+                # Removes entries of the shared disk tier (the worker's memory tier is not reachable from here)
+                content_cache.invalidate(file.id)
             await db.commit()
-    asyncio.run(_cleanup())
\ No newline at end of file
+            if files:
+                await mark_user_changed(user_id)
+            purged = await purge_unreferenced_blobs(db)
+            logger.info(f"Trash cleanup for user {user_id}: {len(files)} files removed, {purged} blobs purged")
+    asyncio.run(_cleanup())
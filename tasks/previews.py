@@ -0,0 +1,68 @@
+# sqlalchemy
+from sqlalchemy import select
+# app
+from app.db.database import AsyncSessionLocal
+from app.models.file import File as FileModel, ScanStatus
+from app.core.encryption import encrypt_derivative
+from app.repositories.file_repo import get_file_decryptor
+from app.utils.minio_utils import iter_object_chunks, upload_bytes_to_minio
+from app.utils.previews import preview_kind, render_preview, preview_object_name, PREVIEW_MAX_SOURCE_SIZE
+# tasks
+from tasks.celery_app import celery_app
+# other
+from uuid import UUID
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Generates the preview of a clean file and stores it encrypted under the derivatives prefix.
+# Returns False if the file can not be previewed.
+async def _generate_preview(
+    file_id: UUID
+) -> bool:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(FileModel).where(FileModel.id == file_id, FileModel.is_deleted == False))
+        file = result.scalar_one_or_none()
+        # Only scanned content is parsed by the rendering libraries
+        if not file or file.scan_status != ScanStatus.clean.value or file.is_infected:
+            return False
+        if not preview_kind(file.content_type) or file.size > PREVIEW_MAX_SOURCE_SIZE:
+            return False
+        decryptor = await get_file_decryptor(db, file)
+    chunks = []
+    async for chunk in iter_object_chunks(file.path):
+        chunks.append(decryptor.update(chunk))
+    chunks.append(decryptor.finalize())
+    preview = await asyncio.to_thread(render_preview, b"".join(chunks), file.content_type)
+    if preview is None:
+        return False
+    await upload_bytes_to_minio(preview_object_name(file.id), encrypt_derivative(preview, file.id.bytes), "application/octet-stream")
+    return True
+
+# Celery background task to generate the preview (thumbnail) of a file after it becomes available
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
+def generate_preview_task(
+    self,
+    file_id_str: str
+):
+    try:
+        if asyncio.run(_generate_preview(UUID(file_id_str))):
+            logger.info(f"Preview generated for file {file_id_str}")
+    except OSError as e:
+        # MinIO is unreachable, try again later
+        logger.error(f"Preview generation failed for file {file_id_str}: {e}. Retrying task...")
+        raise self.retry(exc=e)
+    except Exception as e:
+        logger.exception(f"Unhandled error in generate_preview_task for file {file_id_str}: {e}")
+
+# Enqueues preview generation for a clean file whose content type can be previewed
+def enqueue_preview(
+    db_file
+) -> None:
+    if db_file.scan_status != ScanStatus.clean.value or not preview_kind(db_file.content_type):
+        return
+    try:
+        generate_preview_task.delay(str(db_file.id))
+    except Exception as e:
+        logger.error(f"Failed to enqueue preview generation for file {db_file.id}: {e}")
@@ -1,89 +1,126 @@
 # sqlalchemy
-from sqlalchemy import update
+from sqlalchemy import select, update
 # app
-from app.db.database import SessionLocal # Use SessionLocal to create sessions in the task
-from app.models.file import File as FileModel
-from app.utils.minio_utils import MINIO_BUCKET
-from app.utils.minio_async import get_object_async
-from app.config import celery_app
+from app.db.database import AsyncSessionLocal
+from app.models.file import File as FileModel, ScanStatus
+from app.core.encryption import FileDecryptor
+from app.repositories.file_repo import get_file_decryptor
+from app.utils.minio_utils import iter_object_chunks
+from app.utils.clamav_utils import scan_chunks
+from app.utils.previews import preview_kind
+from app.utils.http_cache import mark_user_changed
+# tasks
+from tasks.celery_app import celery_app
+from tasks.previews import generate_preview_task
 # other
+from datetime import datetime, timezone
 from uuid import UUID
+import asyncio
 import logging
-import os
-import pyclamd
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True, max_retries=3, default_retry_delay=60) 
-async def scan_file_task(
-    self, 
-    file_id_str: str, 
-    object_name: str
-):
-    # Celery background task to scan a file for viruses after upload.
-    # Updates the is_infected flag in the DB if a virus is found.
-    logger.info(f"Starting virus scan for file_id: {file_id_str}, object_name: {object_name}")
-    file_id = UUID(file_id_str)
-    # Use service name 'clamav' as default host in Docker
-    clamav_host = os.getenv("CLAMAV_HOST", "clamav")
-    clamav_port = int(os.getenv("CLAMAV_PORT", 3310))
-    cd = None
-    response = None
+# Size of the batches read from MinIO and fed to clamd
+SCAN_CHUNK_SIZE = 1024 * 1024
 
-    try:
-        # 1. Connecting to ClamAV
-        try:
-            cd = pyclamd.ClamdNetworkSocket(host=clamav_host, port=clamav_port)
-            if not cd.ping():
-                logger.warning(f"ClamAV service at {clamav_host}:{clamav_port} is not responding. Retrying...")
-                # Using ConnectionError for clarity
-                raise ConnectionError("ClamAV ping failed")
-        except Exception as clam_err:
-            logger.error(f"Failed to connect to ClamAV: {clam_err}. Retrying task...")
-            # Repeat the task if there is a connection error
-            raise self.retry(exc=clam_err)
-
-        # 2. Getting a file from MinIO (async)
-        try:
-            file_content = await get_object_async(MINIO_BUCKET, object_name)
-        except Exception as minio_err:
-            logger.error(f"Failed to get object {object_name} from MinIO: {minio_err}")
-            # Do not repeat the task if the file is not in MinIO - this is not a temporary error
-            return # Completing the task
+# Decrypts the object while it is being read from MinIO, yielding plaintext batches
+async def _plaintext_chunks(
+    object_name: str,
+    decryptor: FileDecryptor
+):
+    async for chunk in iter_object_chunks(object_name, SCAN_CHUNK_SIZE):
+        data = decryptor.update(chunk)
+        if data:
+            yield data
+    tail = decryptor.finalize()
+    if tail:
+        yield tail
 
-        # 3. Scanning
-        scan_result = cd.scan_stream(file_content)
-        is_infected = scan_result is not None
+# Scans a pending file and stores the verdict. Returns False if the file no longer needs scanning.
+async def _scan_file(
+    file_id: UUID,
+    object_name: str
+) -> bool:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(FileModel).where(FileModel.id == file_id))
+        file = result.scalar_one_or_none()
+        if not file or file.scan_status != ScanStatus.pending_scan.value:
+            logger.info(f"File {file_id} is not pending scan, skipping")
+            return False
+        decryptor = await get_file_decryptor(db, file)
+        virus_name = await scan_chunks(_plaintext_chunks(object_name, decryptor))
+        is_infected = virus_name is not None
         if is_infected:
-            # Get the virus name from the result
-            virus_name = scan_result.get('stream', ('UNKNOWN', 'UNKNOWN'))[1]
             logger.warning(f"Virus found in file_id: {file_id}, object_name: {object_name}. Virus: {virus_name}")
         else:
             logger.info(f"File is clean: file_id: {file_id}, object_name: {object_name}")
+        scanned_at = datetime.now(timezone.utc)
+        # Only a pending file is updated, so a repeated task cannot overwrite a newer verdict
+        await db.execute(
+            update(FileModel)
+            .where(FileModel.id == file_id, FileModel.scan_status == ScanStatus.pending_scan.value)
+            .values(
+                is_infected=is_infected,
+                scan_status=ScanStatus.infected.value if is_infected else ScanStatus.clean.value,
+                scanned_at=scanned_at
+            )
+        )
+        await db.commit()
+        # Listings show the scan status, so cached copies of them are stale now
+        await mark_user_changed(file.user_id)
+        if not is_infected and preview_kind(file.content_type):
+            generate_preview_task.delay(str(file_id))
+        uploaded_at = file.uploaded_at if file.uploaded_at.tzinfo else file.uploaded_at.replace(tzinfo=timezone.utc)
+        logger.info(f"Scan-to-available latency for file {file_id}: {(scanned_at - uploaded_at).total_seconds():.2f}s")
+        return True
 
-        # 4. Updating the status in the database (only if a virus is found)
-        if is_infected:
-            # Using SessionLocal to create an asynchronous session
-            async with SessionLocal() as db:
-                try:
-                    stmt = (
-                        update(FileModel)
-                        .where(FileModel.id == file_id)
-                        .values(is_infected=True)
-                        # Allows to get the update result if the DBMS supports RETURNING
-                        # .returning(FileModel.id)
-                    )
-                    result = await db.execute(stmt)
-                    await db.commit()
-                    # Check if at least one row has been updated
-                    if result.rowcount == 0:
-                         logger.warning(f"File with id {file_id} not found in DB during infection status update.")
-                    else:
-                         logger.info(f"Marked file {file_id} as infected in DB.")
-                except Exception as db_err:
-                    logger.error(f"Failed to update infection status for file {file_id} in DB: {db_err}")
-                    # You can add retry for DB errors too, if they can be temporary
-                    # raise self.retry(exc=db_err)
-    
-    except Exception as e: # Log unexpected errors but don't retry the task to avoid loops
-        logger.exception(f"Unhandled error in scan_file_task for file {file_id}: {e}")
+# Gives a pending file that can not be scanned a terminal status, so it does not stay pending forever
+async def _mark_scan_failed(
+    file_id: UUID
+) -> None:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(FileModel)
+            .where(FileModel.id == file_id, FileModel.scan_status == ScanStatus.pending_scan.value)
+            .values(scan_status=ScanStatus.scan_failed.value)
+        )
+        await db.commit()
+        if result.rowcount:
+            user_id = (await db.execute(select(FileModel.user_id).where(FileModel.id == file_id))).scalar_one()
+            await mark_user_changed(user_id)
+
+# Celery background task to scan a file for viruses after upload.
+# The object is streamed from MinIO, decrypted and sent to clamd in batches,
+# then the file is marked as clean or infected. A file that can not be scanned is marked as scan_failed.
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
+def scan_file_task(
+    self,
+    file_id_str: str,
+    object_name: str
+):
+    logger.info(f"Starting virus scan for file_id: {file_id_str}, object_name: {object_name}")
+    try:
+        asyncio.run(_scan_file(UUID(file_id_str), object_name))
+    except (OSError, RuntimeError) as clam_err:
+        # ClamAV is unreachable or returned an error: the file stays pending, try again later
+        if self.request.retries < self.max_retries:
+            logger.error(f"ClamAV scan failed for file {file_id_str}: {clam_err}. Retrying task...")
+            raise self.retry(exc=clam_err)
+        logger.error(f"ClamAV scan failed for file {file_id_str} after {self.max_retries} retries: {clam_err}")
+        asyncio.run(_mark_scan_failed(UUID(file_id_str)))
+    except Exception as e:
+        # The object is missing in MinIO (HTTPException) or can not be decrypted: a retry would fail the same way
+        logger.exception(f"Unhandled error in scan_file_task for file {file_id_str}: {e}")
+        asyncio.run(_mark_scan_failed(UUID(file_id_str)))
+
+# Enqueues the background virus scan of a pending file.
+# If the broker is down the file stays pending and shows up in the scan backlog.
+def enqueue_scan(
+    db_file
+) -> None:
+    if db_file.scan_status != ScanStatus.pending_scan.value:
+        return
+    try:
+        scan_file_task.delay(str(db_file.id), db_file.path)
+    except Exception as e:
+        logger.error(f"Failed to enqueue virus scan for file {db_file.id}: {e}")
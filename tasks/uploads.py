@@ -0,0 +1,70 @@
+from app.utils.minio_multipart import list_multipart_uploads, list_parts, abort_multipart_upload
+from app.utils.redis_client import upload_session_exists, release_storage, UPLOAD_EXPIRATION_SECONDS
+from tasks.celery_app import celery_app
+from datetime import datetime, timezone, timedelta
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Multipart uploads older than this and without a live session are aborted
+STALE_UPLOAD_TTL_SECONDS = int(os.getenv("STALE_UPLOAD_TTL", UPLOAD_EXPIRATION_SECONDS))
+# How many uploads are aborted at the same time
+STALE_UPLOAD_ABORT_CONCURRENCY = int(os.getenv("STALE_UPLOAD_ABORT_CONCURRENCY", 8))
+
+# Aborts one stale upload and returns the number of bytes its parts occupied
+async def _abort_stale_upload(
+    upload: dict,
+    semaphore: asyncio.Semaphore
+) -> int:
+    async with semaphore:
+        parts = await list_parts(upload["object_name"], upload["upload_id"])
+        await abort_multipart_upload(upload["object_name"], upload["upload_id"])
+        # Uploads through the API are stored under "<user_id>/uploads/", their quota reservation is released too
+        user_id = upload["object_name"].split("/", 1)[0]
+        try:
+            await release_storage(user_id, upload["upload_id"])
+        except Exception as e:
+            logger.warning(f"Failed to release storage reserved by upload {upload['upload_id']}: {e}")
+        return sum(part["size"] for part in parts.values())
+
+# Finds multipart uploads in MinIO that are older than the TTL and have no session in Redis, and aborts them in parallel.
+# Returns the number of aborted uploads and the reclaimed bytes.
+async def reap_stale_uploads(
+    ttl_seconds: int = STALE_UPLOAD_TTL_SECONDS,
+    concurrency: int = STALE_UPLOAD_ABORT_CONCURRENCY
+) -> dict:
+    expire_time = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    stale = []
+    for upload in await list_multipart_uploads():
+        if upload["initiated"] >= expire_time:
+            continue
+        # A live session means the client is still sending parts (the session is extended with every part)
+        if await upload_session_exists(upload["upload_id"]):
+            continue
+        stale.append(upload)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(_abort_stale_upload(upload, semaphore) for upload in stale),
+        return_exceptions=True
+    )
+    aborted = 0
+    reclaimed_bytes = 0
+    for upload, result in zip(stale, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to abort stale upload {upload['upload_id']} ({upload['object_name']}): {result}")
+            continue
+        aborted += 1
+        reclaimed_bytes += result
+    return {"found": len(stale), "aborted": aborted, "reclaimed_bytes": reclaimed_bytes}
+
+# Celery beat task: aborts abandoned multipart uploads, so their parts do not occupy storage forever
+@celery_app.task
+def reap_stale_uploads_task():
+    report = asyncio.run(reap_stale_uploads())
+    logger.info(
+        f"Stale upload reaper: {report['aborted']} of {report['found']} uploads aborted, "
+        f"{report['reclaimed_bytes']} bytes reclaimed"
+    )
+    return report
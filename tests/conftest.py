@@ -3,11 +3,15 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+# sqlalchemy
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
 # app
 from app.db.database import engine, Base
 from app.config import settings
 # other 
 import pytest
+import pytest_asyncio
 import asyncio
 
 @pytest.fixture(scope="session", autouse=True)
@@ -16,4 +20,19 @@ def create_test_db():
         async def _create():
             async with engine.begin() as conn:
                 await conn.run_sync(Base.metadata.create_all)
-        asyncio.get_event_loop().run_until_complete(_create())
\ No newline at end of file
+        asyncio.get_event_loop().run_until_complete(_create())
+
+# Session factory of a new in-memory SQLite database with all tables, for repository unit tests
+@pytest_asyncio.fixture
+async def sqlite_session_factory():
+    sqlite_engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with sqlite_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(bind=sqlite_engine, class_=AsyncSession, expire_on_commit=False)
+    await sqlite_engine.dispose()
+
+# Session of a new in-memory SQLite database
+@pytest_asyncio.fixture
+async def sqlite_db(sqlite_session_factory):
+    async with sqlite_session_factory() as session:
+        yield session
@@ -0,0 +1,40 @@
+# paths
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+# app
+from app.db.database import AsyncSessionLocal
+from app.models.user import User
+from app.models.user_activity_log import UserActivityLog
+from app.repositories.user_activity_log_repo import create_partitions, list_partitions
+# other
+from sqlalchemy import text
+from datetime import date, datetime, timezone
+import pytest
+import uuid
+
+# A month without a partition: its rows land in the default partition until create_partitions moves them
+MONTH = date(2099, 1, 1)
+
+@pytest.mark.asyncio
+async def test_create_partitions_moves_rows_out_of_default_partition():
+    async with AsyncSessionLocal() as db:
+        if db.bind.dialect.name != "postgresql":
+            pytest.skip("Partitions are PostgreSQL-only")
+        unique = uuid.uuid4().hex[:8]
+        user = User(username=f"partuser_{unique}", email=f"partuser_{unique}@example.com", password_hash="x")
+        db.add(user)
+        await db.flush()
+        db.add(UserActivityLog(user_id=user.id, action_type="login", action_time=datetime(2099, 1, 15, tzinfo=timezone.utc)))
+        await db.commit()
+        try:
+            assert await create_partitions(db, MONTH, MONTH) == ["user_activity_logs_y2099m01"]
+            assert "user_activity_logs_default" in await list_partitions(db)
+            moved = await db.execute(text("SELECT count(*) FROM user_activity_logs_y2099m01 WHERE user_id = :user_id"), {"user_id": user.id})
+            assert moved.scalar() == 1
+            left = await db.execute(text("SELECT count(*) FROM user_activity_logs_default WHERE action_time >= '2099-01-01'"))
+            assert left.scalar() == 0
+        finally:
+            await db.execute(text("DROP TABLE IF EXISTS user_activity_logs_y2099m01"))
+            await db.delete(user)
+            await db.commit()
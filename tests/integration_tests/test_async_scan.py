@@ -0,0 +1,48 @@
+# paths
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+# app
+from app.main import app
+# other
+from httpx import AsyncClient
+import pytest
+import uuid
+
+@pytest.mark.asyncio
+async def test_async_scan_mode_blocks_pending_file(
+    monkeypatch
+):
+    # In async mode the upload is saved as pending_scan, the scan task is enqueued
+    # and the file can not be downloaded until the scan finishes
+    enqueued = []
+    monkeypatch.setattr('app.routes.files.app_settings.SCAN_MODE', "async")
+    monkeypatch.setattr('tasks.scan.scan_file_task.delay', lambda *args: enqueued.append(args))
+    unique = uuid.uuid4().hex[:8]
+    user_data = {
+        "username": f"asyncscanuser_{unique}",
+        "email": f"asyncscanuser_{unique}@example.com",
+        "password": "Test1234!"
+    }
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp_reg = await ac.post("/users/", json=user_data)
+            assert resp_reg.status_code == 200, f"User create failed: {resp_reg.text}"
+            login = await ac.post("/users/login", data={"username": user_data["username"], "password": user_data["password"]})
+            assert login.status_code == 200, f"Login failed: {login.text}"
+            headers = {"Authorization": f"Bearer {login.json().get('access_token')}"}
+            files = {"file": (f"pending_{unique}.txt", b"pending scan content", "text/plain")}
+            upload_resp = await ac.post("/files/", files=files, headers=headers)
+            assert upload_resp.status_code == 200, f"Upload failed: {upload_resp.text}"
+            assert upload_resp.json()["scan_status"] == "pending_scan"
+            file_id = upload_resp.json()["id"]
+            assert enqueued and enqueued[0][0] == file_id
+            download_resp = await ac.get(f"/files/download/{file_id}", headers=headers)
+            assert download_resp.status_code == 409
+            presigned_resp = await ac.get(f"/files/presigned/{file_id}", headers=headers)
+            assert presigned_resp.status_code == 409
+            # Scan metrics are for administrators only
+            metrics_resp = await ac.get("/metrics/scan")
+            assert metrics_resp.status_code == 401
+            metrics_resp = await ac.get("/metrics/scan", headers=headers)
+            assert metrics_resp.status_code == 403
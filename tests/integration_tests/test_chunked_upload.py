@@ -76,3 +76,51 @@ async def test_chunked_upload():
             assert resp.status_code == 200, f"Get files failed: {resp.text}"
             files_list = resp.json()
             assert any(f["id"] == file_id for f in files_list), "Uploaded file not found in user files"
+
+@pytest.mark.asyncio
+async def test_parallel_parts_with_resume():
+    unique = uuid.uuid4().hex[:8]
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            user_data = {
+                "username": f"resumeuser_{unique}",
+                "email": f"resumeuser_{unique}@example.com",
+                "password": "Test1234!"
+            }
+            resp = await ac.post("/users/", json=user_data)
+            assert resp.status_code == 200, f"User create failed: {resp.text}"
+            login = await ac.post("/users/login", data={"username": user_data["username"], "password": user_data["password"]})
+            assert login.status_code == 200, f"Login failed: {login.text}"
+            headers = {"Authorization": f"Bearer {login.json().get('access_token')}"}
+
+            part_size = 5 * 1024 * 1024
+            total_content = b"A" * part_size + b"B" * part_size + b"C" * 1024
+            init_data = {
+                "filename": f"resume_test_{unique}.bin",
+                "size": len(total_content),
+                "content_type": "application/octet-stream",
+                "part_size": part_size
+            }
+            resp = await ac.post("/files/initiate_upload", json=init_data, headers=headers)
+            assert resp.status_code == 200, f"Initiate upload failed: {resp.text}"
+            upload_id = resp.json()["upload_id"]
+            object_name = resp.json()["object_name"]
+            assert resp.json()["part_count"] == 3
+
+            # Parts arrive out of order, part 2 is "lost"
+            for number in (3, 1):
+                chunk = total_content[(number - 1) * part_size:number * part_size]
+                resp = await ac.put(f"/files/uploads/{upload_id}/parts/{number}", content=chunk, headers=headers)
+                assert resp.status_code == 200, f"Upload part {number} failed: {resp.text}"
+
+            # Resume: the server reports what is missing
+            resp = await ac.get(f"/files/uploads/{upload_id}", headers=headers)
+            assert resp.status_code == 200
+            assert resp.json()["missing_parts"] == [2]
+            resp = await ac.put(f"/files/uploads/{upload_id}/parts/2", content=total_content[part_size:2 * part_size], headers=headers)
+            assert resp.status_code == 200
+
+            # ETags are tracked by the server, the client does not send them
+            resp = await ac.post("/files/complete_upload", json={"upload_id": upload_id, "object_name": object_name}, headers=headers)
+            assert resp.status_code == 200, f"Complete upload failed: {resp.text}"
+            assert resp.json()["size"] == len(total_content)
@@ -0,0 +1,50 @@
+# paths
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+# app
+from app.main import app
+# other
+from httpx import AsyncClient
+import pytest
+import hashlib
+import uuid
+
+@pytest.mark.asyncio
+async def test_identical_content_shares_one_blob():
+    unique = uuid.uuid4().hex[:8]
+    user_data = {
+        "username": f"dedupuser_{unique}",
+        "email": f"dedupuser_{unique}@example.com",
+        "password": "Test1234!"
+    }
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            resp_reg = await ac.post("/users/", json=user_data)
+            assert resp_reg.status_code == 200, f"User create failed: {resp_reg.text}"
+            login = await ac.post("/users/login", data={"username": user_data["username"], "password": user_data["password"]})
+            assert login.status_code == 200, f"Login failed: {login.text}"
+            headers = {"Authorization": f"Bearer {login.json().get('access_token')}"}
+            content = f"dedup content {unique}".encode()
+            content_hash = hashlib.sha256(content).hexdigest()
+            first = await ac.post("/files/", files={"file": ("first.txt", content, "text/plain")}, headers=headers)
+            second = await ac.post("/files/", files={"file": ("second.txt", content, "text/plain")}, headers=headers)
+            assert first.status_code == 200 and second.status_code == 200
+            assert first.json()["path"] == second.json()["path"]
+            assert first.json()["blob_hash"] == content_hash
+            # Deleting one copy does not affect the other
+            await ac.delete(f"/files/{first.json()['id']}", headers=headers)
+            download_resp = await ac.get(f"/files/download/{second.json()['id']}", headers=headers)
+            assert download_resp.status_code == 200
+            assert download_resp.content == content
+            # The client can skip uploading content it already stores
+            check_data = {"sha256": content_hash, "size": len(content), "filename": "third.txt", "content_type": "text/plain"}
+            check_resp = await ac.post("/files/check_hash", json=check_data, headers=headers)
+            assert check_resp.status_code == 200, f"Check hash failed: {check_resp.text}"
+            assert check_resp.json()["exists"] is True
+            assert check_resp.json()["file"]["path"] == second.json()["path"]
+            # Unknown content has to be uploaded
+            unknown_data = {"sha256": "0" * 64, "size": 1, "filename": "unknown.txt", "content_type": "text/plain"}
+            unknown_resp = await ac.post("/files/check_hash", json=unknown_data, headers=headers)
+            assert unknown_resp.status_code == 200
+            assert unknown_resp.json()["exists"] is False
@@ -0,0 +1,71 @@
+# Login benchmark for BatteryCloud API using Locust: throughput and latency percentiles (p99) of
+# legitimate logins while attackers guess passwords of the same and other accounts.
+# Run it against a backend with TESTING=1 (per-IP rate limits off) to measure the login path itself;
+# without it every request uses its own X-Forwarded-For address, like a distributed attack
+# (the backend must list the load generator in TRUSTED_PROXIES to use these addresses).
+from locust import HttpUser, task, between, constant, events
+import uuid
+import random
+
+PASSWORD = "TestPassword123!"
+# Accounts created at the start and targeted by the attackers
+VICTIMS = [f"victim_{uuid.uuid4().hex[:8]}" for _ in range(20)]
+
+def random_ip():
+    return f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+@events.test_start.add_listener
+def create_victims(environment, **kwargs):
+    import httpx
+    for username in VICTIMS:
+        httpx.post(
+            f"{environment.host}/users/",
+            json={"username": username, "email": f"{username}@example.com", "password": PASSWORD},
+            headers={"X-Forwarded-For": random_ip()}
+        )
+
+# Logs in with the correct password; its numbers are the ones the hardening must protect
+class LegitimateUser(HttpUser):
+    weight = 1
+    wait_time = between(1, 2)
+
+    def on_start(self):
+        self.username = f"legit_{uuid.uuid4().hex[:8]}"
+        self.client.post(
+            "/users/",
+            json={"username": self.username, "email": f"{self.username}@example.com", "password": PASSWORD},
+            headers={"X-Forwarded-For": random_ip()}
+        )
+
+    @task
+    def login(self):
+        with self.client.post(
+            "/users/login",
+            data={"username": self.username, "password": PASSWORD},
+            headers={"X-Forwarded-For": random_ip()},
+            name="/users/login [legitimate]",
+            catch_response=True
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"login failed: {response.status_code}")
+
+# Credential stuffing: wrong passwords for existing and unknown accounts, without pauses.
+# 401 and 429 are the expected answers.
+class Attacker(HttpUser):
+    weight = 4
+    wait_time = constant(0)
+
+    @task
+    def guess(self):
+        username = random.choice(VICTIMS) if random.random() < 0.8 else f"unknown_{uuid.uuid4().hex[:8]}"
+        with self.client.post(
+            "/users/login",
+            data={"username": username, "password": uuid.uuid4().hex},
+            headers={"X-Forwarded-For": random_ip()},
+            name="/users/login [attack]",
+            catch_response=True
+        ) as response:
+            if response.status_code in (401, 429):
+                response.success()
+            else:
+                response.failure(f"unexpected status: {response.status_code}")
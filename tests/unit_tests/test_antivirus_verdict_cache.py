@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+from app.utils import antivirus
+
+class FakeClamd:
+    scans = 0
+    version_string = "ClamAV 1.0.1/26890/Mon Apr 17 07:25:40 2023"
+    infected = False
+    alive = True
+
+    def __init__(self, host=None, port=None):
+        pass
+
+    def ping(self):
+        return FakeClamd.alive
+
+    def version(self):
+        return FakeClamd.version_string
+
+    def scan_stream(self, data):
+        FakeClamd.scans += 1
+        if FakeClamd.infected:
+            return {"stream": ("FOUND", "Eicar-Test-Signature")}
+        return None
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    cache = {}
+    async def fake_get(signature_version, content_sha256):
+        return cache.get((signature_version, content_sha256))
+    async def fake_store(signature_version, content_sha256, verdict):
+        cache[(signature_version, content_sha256)] = verdict
+    monkeypatch.setattr(antivirus, "get_scan_verdict", fake_get)
+    monkeypatch.setattr(antivirus, "store_scan_verdict", fake_store)
+    monkeypatch.setattr(antivirus.pyclamd, "ClamdNetworkSocket", FakeClamd)
+    monkeypatch.setattr(antivirus, "_signature_version", {"value": None, "checked_at": 0.0})
+    FakeClamd.scans = 0
+    FakeClamd.infected = False
+    FakeClamd.alive = True
+    FakeClamd.version_string = "ClamAV 1.0.1/26890/Mon Apr 17 07:25:40 2023"
+    return cache
+
+@pytest.mark.asyncio
+async def test_identical_content_is_scanned_once(fake_env):
+    await antivirus.scan_bytes_for_viruses(b"same content")
+    await antivirus.scan_bytes_for_viruses(b"same content")
+    assert FakeClamd.scans == 1
+    assert list(fake_env.values()) == ["clean"]
+
+@pytest.mark.asyncio
+async def test_cached_infected_verdict_blocks_upload(fake_env):
+    FakeClamd.infected = True
+    with pytest.raises(HTTPException) as first:
+        await antivirus.scan_bytes_for_viruses(b"bad content")
+    with pytest.raises(HTTPException) as second:
+        await antivirus.scan_bytes_for_viruses(b"bad content")
+    assert first.value.status_code == second.value.status_code == 400
+    assert FakeClamd.scans == 1
+
+@pytest.mark.asyncio
+async def test_signature_update_invalidates_verdicts(fake_env):
+    await antivirus.scan_bytes_for_viruses(b"content")
+    FakeClamd.version_string = "ClamAV 1.0.1/26891/Tue Apr 18 07:25:40 2023"
+    antivirus._signature_version["checked_at"] = 0.0
+    await antivirus.scan_bytes_for_viruses(b"content")
+    assert FakeClamd.scans == 2
+    assert {key[0] for key in fake_env} == {"26890", "26891"}
+
+@pytest.mark.asyncio
+async def test_cached_verdict_used_when_clamd_is_down(fake_env):
+    await antivirus.scan_bytes_for_viruses(b"known content")
+    FakeClamd.alive = False
+    await antivirus.scan_bytes_for_viruses(b"known content")
+    with pytest.raises(HTTPException) as exc:
+        await antivirus.scan_bytes_for_viruses(b"unknown content")
+    assert exc.value.status_code == 503
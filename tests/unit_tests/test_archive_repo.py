@@ -0,0 +1,81 @@
+import io
+import asyncio
+import zipfile
+import hashlib
+import pytest
+from uuid import uuid4
+from app.models.file import File
+from app.models.folder import Folder
+from app.core.encryption import encrypt_convergent
+from app.repositories import archive_repo
+from app.utils.zip_stream import ZipStreamWriter
+
+def test_zip_stream_writer_uses_zip64_for_large_entries(monkeypatch):
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 100)
+    writer = ZipStreamWriter()
+    out = []
+    for name, data in [("small.txt", b"abc"), ("large.bin", b"x" * 500)]:
+        writer.start_entry(name, len(data))
+        writer.write(data)
+        writer.end_entry()
+        out.append(writer.drain())
+    writer.close()
+    out.append(writer.drain())
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(out)))
+    assert archive.read("large.bin") == b"x" * 500
+    assert archive.testzip() is None
+
+@pytest.mark.asyncio
+async def test_folder_archive_streams_subtree(monkeypatch, sqlite_db):
+    user_id = uuid4()
+    root = Folder(name="docs", user_id=user_id)
+    sqlite_db.add(root)
+    await sqlite_db.flush()
+    sub = Folder(name="sub", user_id=user_id, parent_id=root.id)
+    other = Folder(name="other", user_id=user_id)
+    sqlite_db.add_all([sub, other])
+    await sqlite_db.flush()
+    objects = {}
+    def add_file(folder, name, content, **kwargs):
+        content_hash = hashlib.sha256(content).hexdigest()
+        objects[content_hash] = encrypt_convergent(content, content_hash)
+        sqlite_db.add(File(filename=name, user_id=user_id, size=len(content), content_type="text/plain", path=content_hash,
+                    folder_id=folder.id, blob_hash=content_hash, encryption_mode="convergent", **kwargs))
+    add_file(root, "a.txt", b"root file")
+    add_file(sub, "b.txt", b"nested file" * 1000)
+    add_file(sub, "pending.txt", b"not scanned", scan_status="pending_scan")
+    add_file(other, "c.txt", b"outside")
+    await sqlite_db.commit()
+
+    async def fake_chunks(object_name, chunk_size):
+        data = objects[object_name]
+        for i in range(0, len(data), 1000):
+            yield data[i:i + 1000]
+    monkeypatch.setattr(archive_repo, "iter_object_chunks", fake_chunks)
+    root_name, entries = await archive_repo.get_folder_archive_entries(sqlite_db, user_id, root.id)
+    response = await archive_repo.stream_archive(sqlite_db, entries, root_name)
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    archive = zipfile.ZipFile(io.BytesIO(body))
+    assert sorted(archive.namelist()) == ["docs/a.txt", "docs/sub/b.txt"]
+    assert archive.read("docs/sub/b.txt") == b"nested file" * 1000
+
+@pytest.mark.asyncio
+async def test_closing_archive_stream_cancels_all_fetches(monkeypatch):
+    tasks = []
+    async def fake_fetch(file, file_enc, queue):
+        tasks.append(asyncio.current_task())
+        while True:
+            await queue.put(b"x" * 10)
+    monkeypatch.setattr(archive_repo, "_fetch_file", fake_fetch)
+    entries = [(f"{i}.bin", File(filename=f"{i}.bin", user_id=uuid4(), size=10 ** 6, content_type="x", path=str(i)))
+               for i in range(3)]
+    stream = archive_repo._archive_chunks(entries, {})
+    await stream.__anext__()
+    # Client disconnects in the middle of the first entry
+    await stream.aclose()
+    await asyncio.sleep(0)
+    assert len(tasks) == len(entries) and all(task.cancelled() for task in tasks)
+
+def test_unique_name_disambiguates_duplicates():
+    used = set()
+    assert [archive_repo._unique_name(name, used) for name in ["a.txt", "A.txt", "a.txt", "b"]] == ["a.txt", "A (1).txt", "a (2).txt", "b"]
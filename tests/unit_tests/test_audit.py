@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.core import audit
+from app.core.audit import AuditWriter
+from app.core.security import get_current_user
+from app.models.user import User
+from app.models.user_activity_log import UserActivityLog
+from uuid import uuid4
+
+async def _add_user(session_factory):
+    user = User(username=uuid4().hex[:10], email=f"{uuid4().hex[:8]}@example.com", password_hash="x")
+    async with session_factory() as session:
+        session.add(user)
+        await session.commit()
+    return user.id
+
+async def _log_count(session_factory):
+    async with session_factory() as session:
+        return len((await session.execute(select(UserActivityLog))).scalars().all())
+
+@pytest.mark.asyncio
+async def test_events_are_written_in_batches(sqlite_session_factory):
+    user_id = await _add_user(sqlite_session_factory)
+    writer = AuditWriter(sqlite_session_factory, queue_size=100, batch_size=3, flush_interval_ms=10000)
+    writer.start()
+    for _ in range(3):
+        writer.record(user_id, "file_upload", "127.0.0.1", "pytest")
+    # A full batch is written without waiting for the interval
+    for _ in range(100):
+        if writer.written == 3:
+            break
+        await asyncio.sleep(0.01)
+    assert writer.written == 3
+    writer.record(user_id, "file_delete")
+    # Deleted users are skipped instead of failing the batch
+    writer.record(uuid4(), "file_delete")
+    await writer.stop()
+    assert await _log_count(sqlite_session_factory) == 4
+    assert writer.stats() == {"queued": 0, "written": 4, "dropped": 0, "failed": 0}
+
+@pytest.mark.asyncio
+async def test_stop_during_flush_wait_writes_all_events(sqlite_session_factory):
+    user_id = await _add_user(sqlite_session_factory)
+    writer = AuditWriter(sqlite_session_factory, queue_size=100, batch_size=10, flush_interval_ms=10000)
+    writer.start()
+    writer.record(user_id, "login")
+    writer.record(user_id, "logout")
+    # The writer has taken the first event and waits for the rest of the batch
+    await asyncio.sleep(0.01)
+    await writer.stop()
+    assert await _log_count(sqlite_session_factory) == 2
+    assert writer.written == 2
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_events_instead_of_blocking(sqlite_session_factory):
+    user_id = await _add_user(sqlite_session_factory)
+    writer = AuditWriter(sqlite_session_factory, queue_size=2, batch_size=10, flush_interval_ms=10000)
+    writer.start()
+    for _ in range(5):
+        writer.record(user_id, "login")
+    await writer.stop()
+    assert writer.written + writer.dropped == 5 and writer.dropped >= 2
+
+def test_audit_dependency_records_only_successful_requests(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(audit.audit_writer, "record", lambda *args: recorded.append(args))
+    user = User(id=uuid4())
+    app = FastAPI()
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    @app.post("/ok", dependencies=[audit.audit("folder_create")])
+    async def ok():
+        return {}
+
+    @app.post("/fail", dependencies=[audit.audit("folder_delete")])
+    async def fail():
+        raise HTTPException(status_code=404)
+
+    client = TestClient(app)
+    client.post("/ok", headers={"User-Agent": "pytest"})
+    client.post("/fail")
+    assert recorded == [(user.id, "folder_create", "testclient", "pytest")]
@@ -0,0 +1,55 @@
+import pytest
+import hashlib
+from uuid import uuid4
+from app.models.file import File
+from app.models.blob import Blob
+from app.repositories import blob_repo
+
+@pytest.fixture
+def storage(monkeypatch):
+    objects = {}
+    async def fake_upload(object_name, data, content_type):
+        objects[object_name] = data
+    async def fake_remove(object_name):
+        objects.pop(object_name)
+    monkeypatch.setattr(blob_repo, "upload_bytes_to_minio", fake_upload)
+    monkeypatch.setattr(blob_repo, "remove_object_from_minio", fake_remove)
+    return objects
+
+def make_file(content_hash, path):
+    return File(user_id=uuid4(), filename="f.txt", size=4, content_type="text/plain", path=path, blob_hash=content_hash)
+
+@pytest.mark.asyncio
+async def test_identical_content_is_stored_once(sqlite_db, storage):
+    content = b"data"
+    content_hash = hashlib.sha256(content).hexdigest()
+    first = await blob_repo.store_blob(sqlite_db, content, content_hash)
+    second = await blob_repo.store_blob(sqlite_db, content, content_hash)
+    await sqlite_db.commit()
+    assert first == second == blob_repo.blob_object_name(content_hash)
+    assert len(storage) == 1
+    blob = await blob_repo.get_blob(sqlite_db, content_hash)
+    assert blob.refcount == 2
+
+@pytest.mark.asyncio
+async def test_blob_is_purged_after_last_reference(sqlite_db, storage):
+    content = b"data"
+    content_hash = hashlib.sha256(content).hexdigest()
+    path = await blob_repo.store_blob(sqlite_db, content, content_hash)
+    await blob_repo.store_blob(sqlite_db, content, content_hash)
+    first, second = make_file(content_hash, path), make_file(content_hash, path)
+    sqlite_db.add_all([first, second])
+    await sqlite_db.commit()
+
+    await blob_repo.release_blobs(sqlite_db, File.id == first.id)
+    await sqlite_db.delete(first)
+    await sqlite_db.commit()
+    assert await blob_repo.purge_unreferenced_blobs(sqlite_db) == 0
+    assert path in storage
+
+    await blob_repo.release_blobs(sqlite_db, File.id == second.id)
+    await sqlite_db.delete(second)
+    await sqlite_db.commit()
+    assert await blob_repo.purge_unreferenced_blobs(sqlite_db) == 1
+    assert storage == {}
+    assert await blob_repo.get_blob(sqlite_db, content_hash) is None
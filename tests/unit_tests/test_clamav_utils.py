@@ -0,0 +1,31 @@
+import asyncio
+import struct
+import pytest
+from app.utils import clamav_utils
+
+# Minimal clamd INSTREAM emulation: reports a virus if the stream contains "EICAR"
+async def fake_clamd(reader, writer):
+    assert await reader.readuntil(b"\0") == b"zINSTREAM\0"
+    data = b""
+    while True:
+        size = struct.unpack("!L", await reader.readexactly(4))[0]
+        if size == 0:
+            break
+        data += await reader.readexactly(size)
+    reply = b"stream: Eicar-Test-Signature FOUND\0" if b"EICAR" in data else b"stream: OK\0"
+    writer.write(reply)
+    await writer.drain()
+    writer.close()
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+@pytest.mark.asyncio
+async def test_scan_chunks(monkeypatch):
+    server = await asyncio.start_server(fake_clamd, "127.0.0.1", 0)
+    monkeypatch.setattr(clamav_utils, "CLAMAV_HOST", "127.0.0.1")
+    monkeypatch.setattr(clamav_utils, "CLAMAV_PORT", server.sockets[0].getsockname()[1])
+    async with server:
+        assert await clamav_utils.scan_chunks(chunks(b"clean ", b"x" * 200000)) is None
+        assert await clamav_utils.scan_chunks(chunks(b"xx EICAR xx")) == "Eicar-Test-Signature"
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+import httpx
+from unittest.mock import AsyncMock
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from app.core import concurrency
+from app.core.concurrency import ConcurrencyLimiter, limit_concurrency
+
+@pytest.fixture
+def no_redis(monkeypatch):
+    acquire = AsyncMock(return_value=0)
+    release = AsyncMock()
+    monkeypatch.setattr(concurrency, "acquire_concurrency_lease", acquire)
+    monkeypatch.setattr(concurrency, "release_concurrency_lease", release)
+    monkeypatch.setattr(concurrency, "renew_concurrency_leases", AsyncMock())
+    return acquire, release
+
+@pytest.mark.asyncio
+async def test_queue_times_out_with_retry_after(no_redis):
+    limiter = ConcurrencyLimiter("test", local_limit=1, queue_timeout=0.05, retry_after=7)
+    async with limiter.slot("a"):
+        with pytest.raises(HTTPException) as error:
+            async with limiter.slot("b"):
+                pass
+    assert error.value.status_code == 503 and error.value.headers["Retry-After"] == "7"
+    assert limiter.stats()["rejected_timeout"] == 1
+    # The slot is free again
+    async with limiter.slot("b"):
+        assert limiter.active == 1
+    assert limiter.active == 0 and limiter.waiting == 0
+
+@pytest.mark.asyncio
+async def test_queued_request_runs_when_a_slot_frees(no_redis):
+    limiter = ConcurrencyLimiter("test", local_limit=1, queue_size=1, queue_timeout=1)
+    order = []
+
+    async def run(name, delay):
+        async with limiter.slot(name):
+            order.append(name)
+            await asyncio.sleep(delay)
+
+    first = asyncio.create_task(run("a", 0.1))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(run("b", 0))
+    await asyncio.sleep(0.01)
+    # The queue holds one request only
+    with pytest.raises(HTTPException) as error:
+        async with limiter.slot("c"):
+            pass
+    assert error.value.status_code == 503
+    await asyncio.gather(first, second)
+    assert order == ["a", "b"]
+    assert limiter.stats()["rejected_queue_full"] == 1
+
+@pytest.mark.asyncio
+async def test_per_user_and_global_caps(no_redis):
+    acquire, release = no_redis
+    limiter = ConcurrencyLimiter("test", local_limit=10, per_user_limit=1, global_limit=5)
+    async with limiter.slot("a"):
+        with pytest.raises(HTTPException) as error:
+            async with limiter.slot("a"):
+                pass
+        assert error.value.status_code == 429
+        async with limiter.slot("b"):
+            pass
+    assert release.await_count == 2
+
+    # Redis reports the user's slots in other workers or a full cluster
+    acquire.return_value = 1
+    with pytest.raises(HTTPException) as error:
+        async with limiter.slot("a"):
+            pass
+    assert error.value.status_code == 429
+    acquire.return_value = 2
+    with pytest.raises(HTTPException) as error:
+        async with limiter.slot("a"):
+            pass
+    assert error.value.status_code == 503
+    assert limiter.active == 0 and not limiter._semaphore.locked()
+
+@pytest.mark.asyncio
+async def test_redis_failure_keeps_local_limits(no_redis):
+    acquire, release = no_redis
+    acquire.side_effect = ConnectionError("redis down")
+    limiter = ConcurrencyLimiter("test", local_limit=1, global_limit=5)
+    async with limiter.slot("a"):
+        pass
+    release.assert_not_awaited()
+    assert limiter.stats()["redis_errors"] == 1 and limiter.stats()["admitted"] == 1
+
+@pytest.mark.asyncio
+async def test_leases_are_renewed_while_slots_are_held(no_redis):
+    limiter = ConcurrencyLimiter("test", local_limit=2, global_limit=5, lease_seconds=0.03)
+    async with limiter.slot("a"):
+        async with limiter.slot("b"):
+            await asyncio.sleep(0.035)
+        await asyncio.sleep(0.02)
+        renewed = [call.args[1] for call in concurrency.renew_concurrency_leases.await_args_list]
+    # One call renews every lease held at that moment; released leases are no longer renewed
+    assert len(renewed[0]) == 2
+    assert [user for _, user in renewed[-1]] == ["a"]
+    await asyncio.sleep(0.02)
+    assert not limiter._leases and limiter._heartbeat.done()
+
+@pytest.mark.asyncio
+async def test_slot_is_held_until_streamed_response_is_sent(no_redis):
+    limiter = ConcurrencyLimiter("test", local_limit=1)
+    app = FastAPI()
+    seen = []
+
+    @app.get("/stream", dependencies=[limit_concurrency(limiter, per_client=True)])
+    async def stream():
+        async def body():
+            seen.append(limiter.active)
+            yield b"data"
+        return StreamingResponse(body())
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/stream")
+    assert response.content == b"data"
+    assert seen == [1] and limiter.active == 0
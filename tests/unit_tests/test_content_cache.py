@@ -0,0 +1,57 @@
+import os
+from app.utils.content_cache import ContentCache
+from uuid import uuid4
+
+def test_memory_tier_is_lru_bounded_by_bytes():
+    cache = ContentCache(memory_bytes=10, max_file_size=4, directory="")
+    ids = [uuid4() for _ in range(4)]
+    for file_id in ids[:3]:
+        cache.put(file_id, "v1", b"abcd")
+    # 12 bytes do not fit into 10: the least recently used entry is evicted
+    assert cache.lookup(ids[0], "v1", 4) is None
+    assert cache.lookup(ids[1], "v1", 4) == b"abcd"
+    cache.put(ids[3], "v1", b"abcd")
+    assert cache.lookup(ids[2], "v1", 4) is None
+    assert cache.lookup(ids[1], "v1", 4) == b"abcd"
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 10 and stats["evictions"] == 2
+    assert stats["memory_hits"] == 2 and stats["misses"] == 2 and stats["hit_ratio"] == 0.5
+
+def test_versions_large_files_and_invalidation():
+    cache = ContentCache(memory_bytes=100, max_file_size=4, directory="")
+    file_id = uuid4()
+    cache.put(file_id, "v1", b"old")
+    # Replaced content has another version and is never served from the old entry
+    assert cache.lookup(file_id, "v2", 3) is None
+    assert cache.lookup(uuid4(), "v1", 5) is None
+    assert cache.stats()["bypassed"] == 1
+    cache.invalidate(file_id)
+    assert cache.lookup(file_id, "v1", 3) is None
+    assert cache.stats()["memory_bytes"] == 0
+
+def _read(cache, file_id, size):
+    f = cache.lookup(file_id, "v1", size)
+    if f is None:
+        return None
+    with f:
+        return f.read()
+
+def test_disk_tier_budget_restart_and_invalidation(tmp_path):
+    directory = str(tmp_path / "cache")
+    cache = ContentCache(memory_bytes=0, directory=directory, disk_bytes=25, disk_max_file_size=10)
+    ids = [uuid4() for _ in range(3)]
+    for file_id in ids:
+        cache.put(file_id, "v1", b"0123456789")
+    assert len(os.listdir(directory)) == 2
+    assert _read(cache, ids[0], 10) is None
+    assert _read(cache, ids[2], 10) == b"0123456789"
+    assert cache.stats()["disk_hits"] == 1
+    assert not cache.accepts(11)
+
+    # Entries written by a previous run (or another worker) are found again
+    restarted = ContentCache(memory_bytes=0, directory=directory, disk_bytes=25, disk_max_file_size=10)
+    assert restarted.stats()["disk_bytes"] == 20
+    assert _read(restarted, ids[1], 10) == b"0123456789"
+    cache.invalidate(ids[1])
+    assert _read(restarted, ids[1], 10) is None
+    assert restarted.stats()["disk_bytes"] == 10
@@ -1,4 +1,5 @@
 import pytest
+import hashlib
 from app.core import encryption
 
 @pytest.mark.parametrize("data", [b"test data", b"1234567890", b"ascii text"])
@@ -8,3 +9,33 @@ def test_encrypt_decrypt(data):
     assert encrypted != data
     decrypted = encryption.decrypt_file(encrypted, password, salt, iv)
     assert decrypted == data
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 16, 1000])
+def test_streaming_decryptor_matches_decrypt_file(chunk_size):
+    data = b"streamed content " * 50
+    encrypted, salt, iv = encryption.encrypt_file(data, "testpass")
+    decryptor = encryption.FileDecryptor(encryption.generate_key("testpass", salt), iv)
+    out = b"".join(decryptor.update(encrypted[i:i + chunk_size]) for i in range(0, len(encrypted), chunk_size))
+    out += decryptor.finalize()
+    assert out == data
+
+def test_convergent_encryption_is_deterministic():
+    data = b"shared installer bytes"
+    content_hash = hashlib.sha256(data).hexdigest()
+    first = encryption.encrypt_convergent(data, content_hash)
+    assert first == encryption.encrypt_convergent(data, content_hash)
+    assert first != encryption.encrypt_convergent(b"other bytes", hashlib.sha256(b"other bytes").hexdigest())
+    decryptor = encryption.FileDecryptor(*encryption.convergent_params(content_hash))
+    assert decryptor.update(first) + decryptor.finalize() == data
+
+@pytest.mark.parametrize("part_size", [5, 16, 33])
+def test_ctr_parts_decrypt_as_one_stream(part_size):
+    data = bytes(range(256)) * 3
+    key = encryption.ctr_key(b"s" * 16)
+    iv = b"\xff" * 16
+    encrypted = b"".join(
+        encryption.ctr_transform_at(key, iv, offset, data[offset:offset + part_size])
+        for offset in range(0, len(data), part_size)
+    )
+    decryptor = encryption.CTRDecryptor(key, iv)
+    assert decryptor.update(encrypted) + decryptor.finalize() == data
@@ -24,3 +24,277 @@ async def test_create_file():
     db.refresh.assert_awaited()
     assert result.filename == "test.txt"
     assert result.user_id == user_id
+
+@pytest.mark.parametrize("scan_status, is_infected, status_code", [
+    ("pending_scan", False, 409),
+    ("infected", True, 403),
+    ("scan_failed", False, 409),
+])
+def test_ensure_file_available_blocks_unscanned_files(scan_status, is_infected, status_code):
+    from fastapi import HTTPException
+    from app.models.file import File
+    file = File(scan_status=scan_status, is_infected=is_infected)
+    with pytest.raises(HTTPException) as exc:
+        file_repo.ensure_file_available(file)
+    assert exc.value.status_code == status_code
+    file_repo.ensure_file_available(File(scan_status="clean", is_infected=False))
+
+CTR_PARAMS = {"encryption_salt": "00" * 16, "encryption_iv": "11" * 16}
+
+class FakeChunk:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+@pytest.mark.asyncio
+async def test_upload_chunk_uses_shared_session(monkeypatch):
+    from fastapi import HTTPException
+    user_id = uuid4()
+    session = {"object_name": f"{user_id}/uploads/a.bin", "user_id": str(user_id), "size": 10, "parts": {1: {"etag": "e1", "size": 6, "offset": 0}}, **CTR_PARAMS}
+    stored = []
+    monkeypatch.setattr(file_repo, "get_upload_info", AsyncMock(return_value=session))
+    monkeypatch.setattr(file_repo, "upload_part", AsyncMock(return_value="e2"))
+    monkeypatch.setattr(file_repo, "store_upload_part", AsyncMock(side_effect=lambda *args: stored.append(args)))
+    result = await file_repo.upload_chunk(None, user_id, "up1", 2, FakeChunk(b"1234"))
+    assert result == {"etag": "e2"}
+    assert stored == [("up1", 2, "e2", 4, 6)]
+    # Chunks of arbitrary size must follow each other
+    with pytest.raises(HTTPException) as exc:
+        await file_repo.upload_chunk(None, user_id, "up1", 4, FakeChunk(b"1"))
+    assert exc.value.status_code == 400
+    # Declared size is enforced across parts
+    with pytest.raises(HTTPException) as exc:
+        await file_repo.upload_chunk(None, user_id, "up1", 2, FakeChunk(b"12345"))
+    assert exc.value.status_code == 413
+    # Another user can not write into the session
+    with pytest.raises(HTTPException) as exc:
+        await file_repo.upload_chunk(None, uuid4(), "up1", 2, FakeChunk(b"1"))
+    assert exc.value.status_code == 403
+
+async def body_chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+@pytest.mark.asyncio
+async def test_upload_parts_out_of_order_and_resume(monkeypatch):
+    from fastapi import HTTPException
+    user_id = uuid4()
+    part_size = 5 * 1024 * 1024
+    session = {"object_name": "obj", "user_id": str(user_id), "size": part_size * 2 + 10, "part_size": part_size, "parts": {}, **CTR_PARAMS}
+    monkeypatch.setattr(file_repo, "get_upload_info", AsyncMock(return_value=session))
+    monkeypatch.setattr(file_repo, "upload_part", AsyncMock(side_effect=lambda obj, up, number, data: f"etag{number}"))
+    async def fake_store(upload_id, part_number, etag, size, offset):
+        session["parts"][part_number] = {"etag": etag, "size": size, "offset": offset}
+    monkeypatch.setattr(file_repo, "store_upload_part", fake_store)
+
+    # The last part arrives first
+    result = await file_repo.upload_part_stream(user_id, "up1", 3, body_chunks(b"x" * 4, b"y" * 6))
+    assert result == {"part_number": 3, "etag": "etag3", "size": 10}
+    # Chunks are encrypted into the part buffer as one stream at the offset of the part
+    sent = file_repo.upload_part.await_args.args[3]
+    assert bytes(sent) == file_repo._encrypt_part(session, part_size * 2, b"x" * 4 + b"y" * 6)
+    # A part with a wrong length is rejected
+    with pytest.raises(HTTPException):
+        await file_repo.upload_part_stream(user_id, "up1", 1, body_chunks(b"x" * 10))
+    status = await file_repo.get_upload_status(user_id, "up1")
+    assert status["part_count"] == 3
+    assert status["missing_parts"] == [1, 2]
+    assert status["received_bytes"] == 10
+    assert session["parts"][3]["offset"] == part_size * 2
+
+@pytest.mark.asyncio
+async def test_complete_direct_upload_checks_parts_in_storage(monkeypatch):
+    from fastapi import HTTPException
+    from app.schemas.file import CompleteUploadRequest
+    user_id = uuid4()
+    part_size = 5 * 1024 * 1024
+    session = {"object_name": "obj", "user_id": str(user_id), "size": part_size + 10, "part_size": part_size, "mode": "direct", "parts": {}}
+    monkeypatch.setattr(file_repo, "get_upload_info", AsyncMock(return_value=session))
+    monkeypatch.setattr(file_repo, "list_parts", AsyncMock(return_value={1: {"etag": "e1", "size": part_size}}))
+    completion = CompleteUploadRequest(upload_id="up1", object_name="obj")
+    with pytest.raises(HTTPException) as exc:
+        await file_repo.complete_upload(None, user_id, completion)
+    assert "Missing parts: [2]" in exc.value.detail
+
+    monkeypatch.setattr(file_repo, "list_parts", AsyncMock(return_value={1: {"etag": "e1", "size": part_size}, 2: {"etag": "e2", "size": 10}}))
+    monkeypatch.setattr(file_repo, "complete_multipart_upload", AsyncMock())
+    monkeypatch.setattr(file_repo, "delete_upload_info", AsyncMock())
+    monkeypatch.setattr(file_repo, "release_storage", AsyncMock())
+    monkeypatch.setattr(file_repo, "get_file_by_name_and_folder", AsyncMock(return_value=None))
+    monkeypatch.setattr(file_repo, "stat_object", AsyncMock(return_value={"ContentLength": part_size + 10}))
+    created = {}
+    async def fake_create_file(db, **kwargs):
+        created.update(kwargs)
+    monkeypatch.setattr(file_repo, "create_file", fake_create_file)
+    await file_repo.complete_upload(None, user_id, completion)
+    assert created["scan_status"] == "pending_scan"
+    assert created["encryption_mode"] == "sse"
+
+@pytest.mark.asyncio
+async def test_complete_proxy_upload_registers_encryption_and_folder(monkeypatch):
+    from fastapi import HTTPException
+    from app.schemas.file import CompleteUploadRequest
+    user_id = uuid4()
+    folder_id = uuid4()
+    session = {
+        "object_name": "obj", "user_id": str(user_id), "size": 10, "part_size": 6, "filename": "a.bin",
+        "folder_id": str(folder_id), "parts": {1: {"etag": "e1", "size": 6, "offset": 0}, 2: {"etag": "e2", "size": 4, "offset": 5}},
+        **CTR_PARAMS
+    }
+    monkeypatch.setattr(file_repo, "get_upload_info", AsyncMock(return_value=session))
+    completion = CompleteUploadRequest(upload_id="up1", object_name="obj")
+    # A part encrypted at a wrong offset can not be decrypted as one stream
+    with pytest.raises(HTTPException) as exc:
+        await file_repo.complete_upload(None, user_id, completion)
+    assert exc.value.status_code == 400
+
+    session["parts"][2]["offset"] = 6
+    release = AsyncMock()
+    monkeypatch.setattr(file_repo, "get_file_by_name_and_folder", AsyncMock(return_value=None))
+    monkeypatch.setattr(file_repo, "complete_multipart_upload", AsyncMock())
+    monkeypatch.setattr(file_repo, "delete_upload_info", AsyncMock())
+    monkeypatch.setattr(file_repo, "release_storage", release)
+    monkeypatch.setattr(file_repo, "stat_object", AsyncMock(return_value={"ContentLength": 10}))
+    created = {}
+    async def fake_create_file(db, **kwargs):
+        created.update(kwargs)
+    monkeypatch.setattr(file_repo, "create_file", fake_create_file)
+    await file_repo.complete_upload(None, user_id, completion)
+    assert created["folder_id"] == folder_id
+    assert created["encryption_mode"] == "ctr"
+    assert created["scan_status"] == "pending_scan"
+    assert created["encryption_salt"] == bytes(16)
+    release.assert_awaited_once_with(str(user_id), "up1")
+
+@pytest.mark.asyncio
+async def test_complete_upload_keeps_reservation_until_file_is_registered(monkeypatch):
+    from app.schemas.file import CompleteUploadRequest
+    user_id = uuid4()
+    session = {"object_name": "obj", "user_id": str(user_id), "size": 10, "mode": "direct"}
+    calls = []
+    async def fake_create_file(db, **kwargs):
+        calls.append("create_file")
+        raise RuntimeError("database down")
+    monkeypatch.setattr(file_repo, "get_upload_info", AsyncMock(return_value=session))
+    monkeypatch.setattr(file_repo, "list_parts", AsyncMock(return_value={1: {"etag": "e1", "size": 10}}))
+    monkeypatch.setattr(file_repo, "get_file_by_name_and_folder", AsyncMock(return_value=None))
+    monkeypatch.setattr(file_repo, "complete_multipart_upload", AsyncMock())
+    monkeypatch.setattr(file_repo, "stat_object", AsyncMock(return_value={"ContentLength": 10}))
+    monkeypatch.setattr(file_repo, "create_file", fake_create_file)
+    monkeypatch.setattr(file_repo, "remove_object_from_minio", AsyncMock(side_effect=lambda name: calls.append(f"remove:{name}")))
+    monkeypatch.setattr(file_repo, "delete_upload_info", AsyncMock(side_effect=lambda upload_id: calls.append("delete_upload_info")))
+    monkeypatch.setattr(file_repo, "release_storage", AsyncMock(side_effect=lambda user, upload_id: calls.append("release_storage")))
+    completion = CompleteUploadRequest(upload_id="up1", object_name="obj")
+    with pytest.raises(RuntimeError):
+        await file_repo.complete_upload(None, user_id, completion)
+    # The unregistered object is removed before the session and the reservation are dropped
+    assert calls == ["create_file", "remove:obj", "delete_upload_info", "release_storage"]
+
+    calls.clear()
+    async def fake_create_file(db, **kwargs):
+        calls.append("create_file")
+        return "file"
+    monkeypatch.setattr(file_repo, "create_file", fake_create_file)
+    assert await file_repo.complete_upload(None, user_id, completion) == "file"
+    assert calls == ["create_file", "delete_upload_info", "release_storage"]
+
+@pytest.mark.asyncio
+async def test_get_files_batch_checks_ownership_and_scan_status(monkeypatch, sqlite_db):
+    from app.models.file import File
+    monkeypatch.setattr(file_repo, "get_presigned_get_url", lambda path, expires_in: f"url:{path}")
+    user_id, other_id = uuid4(), uuid4()
+    clean = File(filename="a", user_id=user_id, size=1, content_type="text/plain", path="p/a")
+    pending = File(filename="b", user_id=user_id, size=1, content_type="text/plain", path="p/b", scan_status="pending_scan")
+    foreign = File(filename="c", user_id=other_id, size=1, content_type="text/plain", path="p/c")
+    sqlite_db.add_all([clean, pending, foreign])
+    await sqlite_db.commit()
+    result = await file_repo.get_files_batch(sqlite_db, user_id, [pending.id, clean.id, foreign.id], include_urls=True)
+    assert [item["file"].id for item in result["files"]] == [pending.id, clean.id]
+    assert result["files"][0]["url"] is None and result["files"][0]["url_error"] == "File is pending antivirus scan"
+    assert result["files"][1]["url"] == "url:p/a"
+    assert result["missing"] == [foreign.id]
+
+@pytest.mark.asyncio
+async def test_bulk_delete_and_restore_respect_owner_and_quota(monkeypatch, sqlite_db):
+    from app.models.file import File
+    from app.models.user_settings import UserSettings
+    monkeypatch.setattr(file_repo, "get_reserved_storage", AsyncMock(return_value=0))
+    changed = AsyncMock()
+    monkeypatch.setattr(file_repo, "mark_user_changed", changed)
+    user_id = uuid4()
+    files = [File(filename=f"f{i}", user_id=user_id, size=40, content_type="text/plain", path=f"p/{i}") for i in range(3)]
+    foreign = File(filename="x", user_id=uuid4(), size=1, content_type="text/plain", path="p/x")
+    sqlite_db.add_all([*files, foreign, UserSettings(user_id=user_id, storage_limit=100)])
+    await sqlite_db.commit()
+    ids = [file.id for file in files]
+
+    result = await file_repo.bulk_delete_files(sqlite_db, user_id, ids + [foreign.id])
+    assert result["succeeded"] == 3
+    assert result["results"][-1] == {"id": foreign.id, "status": "not_found"}
+
+    # Only two files fit into the limit again
+    result = await file_repo.bulk_restore_files(sqlite_db, user_id, ids)
+    assert [item["status"] for item in result["results"]] == ["restored", "restored", "storage_limit_exceeded"]
+    assert await file_repo.get_user_storage_usage(sqlite_db, user_id) == 80
+    # Every committed change invalidates the user's cached listings
+    assert changed.await_count == 2
+    changed.assert_awaited_with(user_id)
+
+@pytest.mark.asyncio
+async def test_download_revalidation_does_not_touch_storage(monkeypatch, sqlite_db):
+    from app.models.file import File
+    fetch = AsyncMock(side_effect=AssertionError("MinIO must not be called"))
+    monkeypatch.setattr(file_repo, "get_bytes_from_minio", fetch)
+    file = File(filename="a", user_id=uuid4(), size=1, content_type="text/plain", path="p/a", blob_hash="ab" * 32)
+    sqlite_db.add(file)
+    await sqlite_db.commit()
+    etag = f'"{file.id.hex}-{file.blob_hash}"'
+
+    response = await file_repo.download_file(sqlite_db, file.id, {"if-none-match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    response = await file_repo.download_file(sqlite_db, file.id, {"if-modified-since": response.headers["last-modified"]})
+    assert response.status_code == 304
+
+@pytest.mark.asyncio
+async def test_download_serves_small_files_from_content_cache(monkeypatch, sqlite_db):
+    from app.models.file import File
+    from app.utils.content_cache import ContentCache
+    monkeypatch.setattr(file_repo, "content_cache", ContentCache(memory_bytes=1024, max_file_size=16, directory=""))
+    monkeypatch.setattr(file_repo, "mark_user_changed", AsyncMock())
+    fetch = AsyncMock(return_value=b"plain")
+    monkeypatch.setattr(file_repo, "get_bytes_from_minio", fetch)
+    file = File(filename="a", user_id=uuid4(), size=5, content_type="text/plain", path="p/a", encryption_mode="sse")
+    sqlite_db.add(file)
+    await sqlite_db.commit()
+
+    for _ in range(2):
+        response = await file_repo.download_file(sqlite_db, file.id)
+        assert response.content == b"plain"
+    fetch.assert_awaited_once()
+    assert file_repo.content_cache.stats()["memory_hits"] == 1
+
+    # Moving the file to the Recycle Bin evicts its content
+    await file_repo.delete_file(sqlite_db, file.id)
+    assert file_repo.content_cache.stats()["memory_entries"] == 0
+
+@pytest.mark.asyncio
+async def test_scan_stats_latency_covers_background_scans_only(monkeypatch, sqlite_db):
+    from datetime import datetime, timezone, timedelta
+    from app.models.file import File
+    monkeypatch.setattr(file_repo, "mark_user_changed", AsyncMock())
+    user_id = uuid4()
+    await file_repo.create_file(sqlite_db, "inline.txt", user_id, 1, "text/plain", "a")
+    now = datetime.now(timezone.utc)
+    sqlite_db.add_all([
+        File(user_id=user_id, filename="async.txt", size=1, content_type="text/plain", path="b",
+             uploaded_at=now - timedelta(seconds=30), scan_status="clean", scanned_at=now),
+        File(user_id=user_id, filename="pending.txt", size=1, content_type="text/plain", path="c", scan_status="pending_scan"),
+        File(user_id=user_id, filename="failed.txt", size=1, content_type="text/plain", path="d", scan_status="scan_failed"),
+    ])
+    await sqlite_db.commit()
+    stats = await file_repo.get_scan_stats(sqlite_db)
+    assert (stats["pending"], stats["failed"], stats["scanned_in_window"]) == (1, 1, 1)
+    assert stats["latency_avg_seconds"] == pytest.approx(30)
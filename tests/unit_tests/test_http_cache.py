@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.utils import http_cache
+from datetime import datetime, timezone
+
+def test_etag_matches_uses_weak_comparison():
+    assert http_cache.etag_matches('W/"a", "b"', '"a"')
+    assert http_cache.etag_matches("*", '"a"')
+    assert not http_cache.etag_matches('"b"', '"a"')
+    assert not http_cache.etag_matches(None, '"a"')
+
+def test_if_none_match_takes_priority_over_if_modified_since():
+    modified = datetime(2024, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    since = http_cache.http_date(modified)
+    assert http_cache.is_not_modified({"if-modified-since": since}, '"a"', modified)
+    assert not http_cache.is_not_modified({"if-none-match": '"b"', "if-modified-since": since}, '"a"', modified)
+    assert not http_cache.is_not_modified({"if-modified-since": "Mon, 01 Jan 2024 11:59:59 GMT"}, '"a"', modified)
+    assert not http_cache.is_not_modified({"if-modified-since": "garbage"}, '"a"', modified)
+
+def _request(query="", if_none_match=None):
+    request = MagicMock()
+    request.url.path = "/files/"
+    request.url.query = query
+    request.headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return request
+
+@pytest.mark.asyncio
+async def test_listing_etag_follows_change_counter(monkeypatch):
+    counter = AsyncMock(return_value="e-1")
+    monkeypatch.setattr(http_cache, "get_change_counter", counter)
+    response = MagicMock(headers={})
+    assert await http_cache.conditional_listing("u", _request(), response) is None
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"e-1-')
+    # Another query of the same listing has its own ETag
+    assert await http_cache.listing_etag("u", _request("page=2")) != etag
+
+    not_modified = await http_cache.conditional_listing("u", _request(if_none_match=etag), MagicMock(headers={}))
+    assert not_modified.status_code == 304
+
+    counter.return_value = "e-2"
+    assert await http_cache.conditional_listing("u", _request(if_none_match=etag), MagicMock(headers={})) is None
+
+@pytest.mark.asyncio
+async def test_listing_without_redis_is_sent_without_etag(monkeypatch):
+    monkeypatch.setattr(http_cache, "get_change_counter", AsyncMock(side_effect=ConnectionError("down")))
+    response = MagicMock(headers={})
+    assert await http_cache.conditional_listing("u", _request(if_none_match='W/"x"'), response) is None
+    assert response.headers == {}
@@ -0,0 +1,140 @@
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from fastapi import HTTPException
+from unittest.mock import AsyncMock
+from uuid import uuid4
+from sqlalchemy import select
+from app.models.blob import Blob
+from app.models.file import File
+from app.models.folder import Folder
+from app.models.file_encryption import FileEncryption
+from app.core.encryption import CTRDecryptor, ctr_key
+from app.repositories import import_repo, folder_repo
+
+@pytest.fixture
+def storage(monkeypatch):
+    objects = {}
+    parts = {}
+    async def fake_upload(object_name, data, content_type):
+        objects[object_name] = data
+    async def fake_upload_part(object_name, upload_id, part_number, data):
+        parts[(object_name, part_number)] = data
+        return f"etag{part_number}"
+    async def fake_complete(object_name, upload_id, part_list):
+        objects[object_name] = b"".join(parts[(object_name, part["part_number"])] for part in part_list)
+    monkeypatch.setattr(import_repo, "upload_bytes_to_minio", fake_upload)
+    monkeypatch.setattr(import_repo, "initiate_multipart_upload", AsyncMock(return_value="up1"))
+    monkeypatch.setattr(import_repo, "upload_part", fake_upload_part)
+    monkeypatch.setattr(import_repo, "complete_multipart_upload", fake_complete)
+    monkeypatch.setattr(import_repo, "update_import_job", AsyncMock())
+    monkeypatch.setattr(import_repo, "IMPORT_BLOB_MAX_SIZE", 100)
+    monkeypatch.setattr(import_repo, "IMPORT_PART_SIZE", 64)
+    return objects
+
+def write_archive(path, kind, entries):
+    if kind == "zip":
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, data in entries:
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(path, "w:gz") as archive:
+            for name, data in entries:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["zip", "tar"])
+async def test_import_archive_creates_tree_and_files(sqlite_db, storage, tmp_path, kind):
+    user_id = uuid4()
+    large = bytes(range(256)) * 2
+    archive_path = str(tmp_path / f"a.{kind}")
+    write_archive(archive_path, kind, [
+        ("photos/2020/a.jpg", b"same"),
+        ("photos/b.txt", b"same"),
+        ("docs/big.bin", large),
+        ("../evil.txt", b"x"),
+    ])
+    folders, files, total_size = import_repo._list_archive(archive_path)
+    assert files == 3 and total_size == 8 + len(large)
+    created = []
+    batch = await import_repo._import_archive(sqlite_db, "job", user_id, archive_path, None, folders, created.append)
+    assert (batch.processed_files, batch.failed_files) == (3, 1)
+    assert sorted(file.filename for file in created) == ["a.jpg", "b.txt", "big.bin"]
+
+    result = await sqlite_db.execute(select(Folder.name))
+    assert sorted(result.scalars().all()) == ["2020", "docs", "photos"]
+    # Identical entries share one blob
+    blob = (await sqlite_db.execute(select(Blob))).scalar_one()
+    assert blob.refcount == 2
+    big = (await sqlite_db.execute(select(File).where(File.filename == "big.bin"))).scalar_one()
+    assert big.encryption_mode == "ctr" and big.size == len(large) and big.scan_status == "pending_scan"
+    enc = (await sqlite_db.execute(select(FileEncryption).where(FileEncryption.file_id == big.id))).scalar_one()
+    decryptor = CTRDecryptor(ctr_key(enc.encryption_salt), enc.encryption_iv)
+    assert decryptor.update(storage[big.path]) + decryptor.finalize() == large
+
+@pytest.mark.asyncio
+async def test_failed_batch_removes_large_entries(sqlite_db, storage, tmp_path, monkeypatch):
+    removed = []
+    async def fake_remove(object_name):
+        removed.append(object_name)
+    monkeypatch.setattr(import_repo, "remove_object_from_minio", fake_remove)
+    monkeypatch.setattr(import_repo.blob_repo, "insert_blob", AsyncMock(side_effect=RuntimeError("db down")))
+    archive_path = str(tmp_path / "a.zip")
+    write_archive(archive_path, "zip", [("a.txt", b"small"), ("big.bin", bytes(200))])
+    folders, _, _ = import_repo._list_archive(archive_path)
+    batch = await import_repo._import_archive(sqlite_db, "job", uuid4(), archive_path, None, folders)
+    assert (batch.processed_files, batch.failed_files) == (0, 2)
+    assert (await sqlite_db.execute(select(File))).scalars().all() == []
+    large = [name for name in storage if "/uploads/" in name]
+    assert removed == large and len(large) == 1
+
+@pytest.mark.asyncio
+async def test_failed_batch_releases_existing_blobs(sqlite_db, storage, tmp_path, monkeypatch):
+    user_id = uuid4()
+    first_path = str(tmp_path / "first.zip")
+    write_archive(first_path, "zip", [("a.txt", b"same")])
+    folders, _, _ = import_repo._list_archive(first_path)
+    await import_repo._import_archive(sqlite_db, "job", user_id, first_path, None, folders)
+
+    # The reference to the existing blob is committed before the batch and released when it fails
+    monkeypatch.setattr(import_repo.blob_repo, "insert_blob", AsyncMock(side_effect=RuntimeError("db down")))
+    second_path = str(tmp_path / "second.zip")
+    write_archive(second_path, "zip", [("b.txt", b"same"), ("c.txt", b"new")])
+    folders, _, _ = import_repo._list_archive(second_path)
+    batch = await import_repo._import_archive(sqlite_db, "job", user_id, second_path, None, folders)
+    assert (batch.processed_files, batch.failed_files) == (0, 2)
+    blob = (await sqlite_db.execute(select(Blob))).scalar_one()
+    await sqlite_db.refresh(blob)
+    assert blob.refcount == 1
+
+@pytest.mark.asyncio
+async def test_create_folder_tree_reuses_existing_folders(sqlite_db):
+    user_id = uuid4()
+    existing = Folder(name="photos", user_id=user_id)
+    sqlite_db.add(existing)
+    await sqlite_db.commit()
+    folder_ids = await folder_repo.create_folder_tree(sqlite_db, user_id, None, [("photos", "2020"), ("docs",)])
+    await sqlite_db.commit()
+    assert folder_ids[("photos",)] == existing.id
+    result = await sqlite_db.execute(select(Folder).where(Folder.parent_id == existing.id))
+    assert result.scalar_one().id == folder_ids[("photos", "2020")]
+
+@pytest.mark.asyncio
+async def test_start_import_stops_spooling_over_available_storage(sqlite_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(import_repo, "get_available_storage", AsyncMock(return_value=100))
+    monkeypatch.setattr(import_repo.tempfile, "tempdir", str(tmp_path))
+    received = []
+    async def body():
+        for _ in range(10):
+            received.append(1)
+            yield b"x" * 40
+    with pytest.raises(HTTPException) as error:
+        await import_repo.start_import(sqlite_db, uuid4(), body())
+    assert error.value.status_code == 413
+    # The body is not read to the end and the partial archive is removed
+    assert len(received) == 3
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,85 @@
+import io
+import json
+import logging
+import pytest
+from app.middleware import logging_middleware
+from app.middleware.logging_middleware import LoggingMiddleware
+from app.utils import log_queue
+
+def _scope(content_type, body_size):
+    headers = [(b"content-type", content_type), (b"content-length", str(body_size).encode())]
+    return {"type": "http", "method": "POST", "path": "/x", "headers": headers}
+
+async def _run(scope, chunks, monkeypatch):
+    logged = {}
+    received = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message["body"])
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = iter([{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)])
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        pass
+
+    middleware = LoggingMiddleware(app)
+    monkeypatch.setattr(middleware.logger, "info", lambda msg, *args, **kwargs: logged.update(message=msg % args, extra=kwargs["extra"]))
+    await middleware(scope, receive, send)
+    return received, logged
+
+@pytest.mark.asyncio
+async def test_small_json_body_is_logged_without_private_fields(monkeypatch):
+    body = json.dumps({"email": "a@b.c", "password": "secret"}).encode()
+    received, logged = await _run(_scope(b"application/json", len(body)), [body[:10], body[10:]], monkeypatch)
+    assert b"".join(received) == body
+    assert "'password': '***'" in logged["message"] and "secret" not in logged["message"]
+    assert logged["extra"]["status_code"] == 201
+
+@pytest.mark.asyncio
+async def test_uploads_and_large_bodies_are_streamed_without_capture(monkeypatch):
+    monkeypatch.setattr(logging_middleware, "LOG_BODY_MAX_BYTES", 8)
+    chunks = [b"x" * 4, b"y" * 4, b"z" * 4]
+    received, logged = await _run(_scope(b"application/octet-stream", 12), chunks, monkeypatch)
+    # The application gets the stream chunk by chunk, as sent by the client
+    assert received == chunks
+    assert logged["message"].endswith("body: None")
+    received, logged = await _run(_scope(b"application/json", 12), chunks, monkeypatch)
+    assert received == chunks and logged["message"].endswith("body: None")
+
+def test_queue_handler_drops_records_instead_of_blocking():
+    handler = log_queue.DroppingQueueHandler(log_queue.queue.Queue(1))
+    record = logging.makeLogRecord({"msg": "m"})
+    handler.emit(record)
+    handler.emit(record)
+    assert handler.dropped == 1
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({"msg": "GET %s", "args": ("/x",), "name": "uvicorn.access", "levelname": "INFO", "status_code": 200})
+    data = json.loads(log_queue.JsonFormatter().format(record))
+    assert data["message"] == "GET /x" and data["status_code"] == 200 and data["logger"] == "uvicorn.access"
+
+def test_uvicorn_access_records_keep_their_arguments_through_the_queue():
+    from uvicorn.logging import AccessFormatter
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(AccessFormatter('%(client_addr)s - "%(request_line)s" %(status_code)s', use_colors=False))
+    logger = logging.getLogger("test.queue.access")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    log_queue.setup_queue_logging(logger_names=("test.queue.access",))
+    try:
+        logger.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:5000", "GET", "/files/", "1.1", 200)
+    finally:
+        log_queue.stop_queue_logging()
+    assert stream.getvalue() == '127.0.0.1:5000 - "GET /files/ HTTP/1.1" 200 OK\n'
+    assert logger.handlers == [handler]
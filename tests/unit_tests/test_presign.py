@@ -0,0 +1,37 @@
+from urllib.parse import urlparse, parse_qs
+from app.utils import presign
+
+def test_sign_get_url_is_sigv4_path_style():
+    url = presign.sign_get_url("user/a b.txt", 600)
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    assert parsed.path == f"/{presign.BUCKET}/user/a%20b.txt"
+    assert query["X-Amz-Algorithm"] == ["AWS4-HMAC-SHA256"]
+    assert query["X-Amz-Expires"] == ["600"]
+
+def test_expiry_bucket_rounds_down_and_caps():
+    assert presign.expiry_bucket(0) == 1
+    assert presign.expiry_bucket(60) == 60
+    assert presign.expiry_bucket(2 * presign.PRESIGN_EXPIRY_BUCKET_SECONDS - 1) == presign.PRESIGN_EXPIRY_BUCKET_SECONDS
+    assert presign.expiry_bucket(10 ** 9) == presign.MAX_PRESIGN_EXPIRES
+
+def test_cache_reuses_url_while_lifetime_remains(monkeypatch):
+    now = [1000.0]
+    signed = []
+    monkeypatch.setattr(presign.time, "time", lambda: now[0])
+    monkeypatch.setattr(presign, "sign_get_url", lambda object_name, expires_in: signed.append(object_name) or f"{object_name}#{len(signed)}")
+    cache = presign.PresignedUrlCache(max_size=2, reuse_threshold=0.5)
+    first = cache.get_url("a", 3600)
+    # Same expiry bucket, more than half of the lifetime left
+    now[0] += 1000
+    assert cache.get_url("a", 3890) == first
+    # A shorter request does not get the URL of a longer bucket
+    assert cache.get_url("a", 3590) != first
+    # Less than half of the lifetime left: a new URL is signed
+    now[0] += 1000
+    assert cache.get_url("a", 3600) != first
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Least recently used entries are evicted
+    cache.get_url("b", 3600)
+    cache.get_url("c", 3600)
+    assert ("a", 3600) not in cache._items
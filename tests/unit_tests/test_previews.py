@@ -0,0 +1,48 @@
+import io
+import pytest
+from uuid import uuid4
+from app.utils import previews
+from app.utils.http_cache import etag_matches
+from app.core.encryption import encrypt_derivative, decrypt_derivative
+
+Image = pytest.importorskip("PIL.Image")
+
+def open_preview(data):
+    image = Image.open(io.BytesIO(data))
+    assert image.format == "JPEG"
+    assert max(image.size) <= max(previews.PREVIEW_SIZE)
+    return image
+
+def test_image_preview_is_thumbnail():
+    source = io.BytesIO()
+    Image.new("RGBA", (2000, 1000), (255, 0, 0, 128)).save(source, "PNG")
+    image = open_preview(previews.render_preview(source.getvalue(), "image/png"))
+    assert image.size == (320, 160)
+
+def test_text_preview():
+    open_preview(previews.render_preview(b"line one\nline two\n" * 100, "text/plain; charset=utf-8"))
+
+def test_pdf_preview():
+    pdfium = pytest.importorskip("pypdfium2")
+    document = pdfium.PdfDocument.new()
+    document.new_page(595, 842)
+    source = io.BytesIO()
+    document.save(source)
+    image = open_preview(previews.render_preview(source.getvalue(), "application/pdf"))
+    assert image.size[1] == 320
+
+def test_unsupported_or_broken_content_has_no_preview():
+    assert previews.render_preview(b"data", "application/zip") is None
+    assert previews.render_preview(b"not an image", "image/png") is None
+
+def test_derivative_encryption_is_bound_to_file():
+    file_id = uuid4().bytes
+    encrypted = encrypt_derivative(b"preview bytes", file_id)
+    assert decrypt_derivative(encrypted, file_id) == b"preview bytes"
+    assert decrypt_derivative(encrypted, uuid4().bytes) != b"preview bytes"
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"x"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
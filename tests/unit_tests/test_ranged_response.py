@@ -0,0 +1,57 @@
+import pytest
+from app.utils.ranged_response import parse_range, RangedContentResponse
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-3", (0, 3)),
+    ("bytes=4-", (4, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=5-100", (5, 9)),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+    ("bytes=x-1", None),
+    ("bytes=5-2", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 10) == expected
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 10)
+
+async def _send(response, extensions=None):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http", "extensions": extensions or {}}, None, send)
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    return messages[0]["status"], headers, messages[1:]
+
+@pytest.mark.asyncio
+async def test_range_of_bytes_and_if_range():
+    status, headers, body = await _send(RangedContentResponse(b"0123456789", 10, headers={"ETag": '"e"'}, range_header="bytes=2-4"))
+    assert status == 206 and headers["content-range"] == "bytes 2-4/10" and headers["content-length"] == "3"
+    assert body[0]["body"] == b"234"
+    # A range of another version is not applied, the whole content is sent
+    status, headers, body = await _send(RangedContentResponse(b"0123456789", 10, headers={"ETag": '"e"'}, range_header="bytes=2-4", if_range='"old"'))
+    assert status == 200 and body[0]["body"] == b"0123456789"
+    status, headers, _ = await _send(RangedContentResponse(b"0123456789", 10, range_header="bytes=20-"))
+    assert status == 416 and headers["content-range"] == "bytes */10"
+
+@pytest.mark.asyncio
+async def test_file_is_sent_with_zerocopy_extension_or_in_chunks(tmp_path, monkeypatch):
+    path = tmp_path / "entry"
+    path.write_bytes(b"0123456789")
+    f = open(path, "rb")
+    _, _, body = await _send(RangedContentResponse(f, 10, range_header="bytes=3-"), {"http.response.zerocopysend": {}})
+    assert body == [{"type": "http.response.zerocopysend", "file": f, "offset": 3, "count": 7, "more_body": False}]
+    assert f.closed
+
+    monkeypatch.setattr("app.utils.ranged_response.RANGED_RESPONSE_CHUNK_SIZE", 4)
+    status, _, body = await _send(RangedContentResponse(open(path, "rb"), 10, range_header="bytes=1-8"))
+    assert status == 206
+    assert [message["body"] for message in body] == [b"1234", b"5678"]
+    assert body[-1]["more_body"] is False
@@ -0,0 +1,107 @@
+import ipaddress
+import pytest
+from unittest.mock import AsyncMock
+from starlette.requests import Request
+from app.core import rate_limit
+from app.core.rate_limit import HybridRateLimiter
+
+class FakeRedis:
+    def __init__(self):
+        self.counters = {}
+        self.checks = 0
+        self.syncs = 0
+
+    async def check(self, current_key, previous_key, limit, previous_weight, window_ms, hits):
+        self.checks += 1
+        current = self.counters.get(current_key, 0)
+        previous = self.counters.get(previous_key, 0)
+        allowed = previous * previous_weight + current + hits + 1 <= limit
+        self.counters[current_key] = current + hits + int(allowed)
+        return allowed, self.counters[current_key], previous
+
+    async def sync(self, counters):
+        self.syncs += 1
+        totals = []
+        for current_key, previous_key, hits, window_ms in counters:
+            self.counters[current_key] = self.counters.get(current_key, 0) + hits
+            totals.append((self.counters[current_key], self.counters.get(previous_key, 0)))
+        return totals
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(rate_limit, "check_rate_limit_counter", redis.check)
+    monkeypatch.setattr(rate_limit, "sync_rate_limit_counters", redis.sync)
+    return redis
+
+@pytest.mark.asyncio
+async def test_burst_is_rejected_locally(fake_redis):
+    limiter = HybridRateLimiter()
+    results = [await limiter.hit("ip:/users/login", 5, 60, now=30) for _ in range(100)]
+    assert results[:5] == [0] * 5
+    assert all(retry_after == 30 for retry_after in results[5:])
+    stats = limiter.stats()
+    # Every admission is decided by Redis; once the limit is known to be reached, the rest never reach it
+    assert stats["local_allowed"] == 0 and stats["remote_allowed"] == 5
+    assert stats["local_rejected"] == 95 and fake_redis.checks == 5
+    assert fake_redis.counters["rate-limit:ip:/users/login:0"] == 5
+
+@pytest.mark.asyncio
+async def test_workers_together_admit_at_most_the_limit(fake_redis):
+    workers = [HybridRateLimiter() for _ in range(4)]
+    results = [await worker.hit("k", 5, 60, now=1) for _ in range(3) for worker in workers]
+    assert results.count(0) == 5
+    assert sum(worker.stats()["remote_rejected"] for worker in workers) == 3
+    # Workers that have seen the full count reject without Redis
+    assert all(retry_after == 59 for retry_after in results[8:])
+    assert await workers[0].hit("k", 5, 60, now=3) == 57
+
+@pytest.mark.asyncio
+async def test_previous_window_slides_out(fake_redis):
+    limiter = HybridRateLimiter()
+    for _ in range(4):
+        assert await limiter.hit("k", 4, 60, now=50) == 0
+    assert await limiter.hit("k", 4, 60, now=59) > 0
+    # Early in the next window the previous window still counts with most of its weight
+    assert await limiter.hit("k", 4, 60, now=61) > 0
+    assert await limiter.hit("k", 4, 60, now=110) == 0
+    limiter._prune(now=200)
+    assert limiter.stats()["keys"] == 0
+
+@pytest.mark.asyncio
+async def test_redis_failure_falls_back_to_local_counts(monkeypatch):
+    limiter = HybridRateLimiter()
+    monkeypatch.setattr(rate_limit, "check_rate_limit_counter", AsyncMock(side_effect=ConnectionError("redis down")))
+    monkeypatch.setattr(rate_limit, "sync_rate_limit_counters", AsyncMock(side_effect=ConnectionError("redis down")))
+    assert [await limiter.hit("k", 3, 60, now=1) for _ in range(4)] == [0, 0, 0, 59]
+    await limiter.sync()
+    # Hits are kept for the next synchronisation
+    assert limiter._pending == {("k", 0, 60): 3}
+    assert limiter.stats()["redis_errors"] == 4
+
+@pytest.mark.asyncio
+async def test_keys_are_bounded(monkeypatch):
+    limiter = HybridRateLimiter(max_keys=3)
+    monkeypatch.setattr(rate_limit, "sync_rate_limit_counters", AsyncMock(side_effect=ConnectionError("redis down")))
+    for i in range(10):
+        await limiter.hit(f"ip{i}", 5, 60, now=1)
+    await limiter.hit("ip7", 5, 60, now=2)
+    await limiter.sync()
+    # The least recently used keys are forgotten first
+    assert list(limiter._windows) == ["ip8", "ip9", "ip7"]
+    assert len(limiter._pending) == 3
+    assert limiter.stats()["evicted"] == 14
+
+def request_from(
+    peer,
+    forwarded=None
+):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+def test_forwarded_for_is_only_trusted_from_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    assert rate_limit.client_address(request_from("203.0.113.5", "1.2.3.4")) == "203.0.113.5"
+    assert rate_limit.client_address(request_from("10.0.0.2")) == "10.0.0.2"
+    # A spoofed first address sent by the client is skipped
+    assert rate_limit.client_address(request_from("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.9")) == "198.51.100.7"
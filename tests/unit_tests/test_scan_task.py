@@ -0,0 +1,40 @@
+import pytest
+from fastapi import HTTPException
+from unittest.mock import AsyncMock
+from uuid import uuid4
+from app.models.file import File
+from tasks import scan
+
+@pytest.mark.asyncio
+async def test_mark_scan_failed_only_updates_pending_files(sqlite_session_factory, monkeypatch):
+    changed = AsyncMock()
+    monkeypatch.setattr(scan, "AsyncSessionLocal", sqlite_session_factory)
+    monkeypatch.setattr(scan, "mark_user_changed", changed)
+    user_id = uuid4()
+    pending = File(user_id=user_id, filename="a", size=1, content_type="text/plain", path="a", scan_status="pending_scan")
+    clean = File(user_id=user_id, filename="b", size=1, content_type="text/plain", path="b", scan_status="clean")
+    async with sqlite_session_factory() as db:
+        db.add_all([pending, clean])
+        await db.commit()
+    await scan._mark_scan_failed(pending.id)
+    await scan._mark_scan_failed(clean.id)
+    async with sqlite_session_factory() as db:
+        assert (await db.get(File, pending.id)).scan_status == "scan_failed"
+        assert (await db.get(File, clean.id)).scan_status == "clean"
+    changed.assert_awaited_once_with(user_id)
+
+@pytest.mark.parametrize("error, retries", [
+    (HTTPException(status_code=404, detail="File not found in storage"), 0),
+    (OSError("clamd unreachable"), scan.scan_file_task.max_retries),
+])
+def test_scan_file_task_marks_unscannable_files_as_failed(monkeypatch, error, retries):
+    failed = AsyncMock()
+    monkeypatch.setattr(scan, "_scan_file", AsyncMock(side_effect=error))
+    monkeypatch.setattr(scan, "_mark_scan_failed", failed)
+    file_id = uuid4()
+    scan.scan_file_task.push_request(retries=retries)
+    try:
+        scan.scan_file_task.run(str(file_id), "obj")
+    finally:
+        scan.scan_file_task.pop_request()
+    failed.assert_awaited_once_with(file_id)
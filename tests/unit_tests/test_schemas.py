@@ -1,5 +1,9 @@
+import pytest
+from pydantic import ValidationError
 from app.schemas.folder import FolderCreate
 from app.schemas.user_session import UserSessionCreate
+from app.schemas.file import InitiateUploadRequest, MAX_PART_SIZE
+from app.schemas.user import UserProvisionRequest, USER_PROVISION_MAX_PLAIN_PASSWORDS
 
 def test_folder_create_schema():
     folder = FolderCreate(name="Test", parent_id=None)
@@ -9,3 +13,18 @@ def test_folder_create_schema():
 def test_user_session_create_schema():
     session = UserSessionCreate(device_info={"os": "win"})
     assert session.device_info["os"] == "win"
+
+def test_initiate_upload_caps_part_size():
+    request = {"filename": "a.bin", "size": 10, "content_type": "application/octet-stream"}
+    assert InitiateUploadRequest(**request, part_size=MAX_PART_SIZE).part_size == MAX_PART_SIZE
+    with pytest.raises(ValidationError):
+        InitiateUploadRequest(**request, part_size=MAX_PART_SIZE + 1)
+
+def test_bulk_provisioning_limits_plain_passwords():
+    def users(count, **password):
+        return [{"username": f"u{i}", "email": f"u{i}@example.com", **password} for i in range(count)]
+    hashed = {"password_hash": "$2b$12$" + "a" * 53}
+    plain = {"password": "Test1234!"}
+    assert len(UserProvisionRequest(users=users(1000, **hashed) + users(USER_PROVISION_MAX_PLAIN_PASSWORDS, **plain)).users) == 1020
+    with pytest.raises(ValidationError):
+        UserProvisionRequest(users=users(USER_PROVISION_MAX_PLAIN_PASSWORDS + 1, **plain))
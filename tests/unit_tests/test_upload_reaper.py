@@ -0,0 +1,30 @@
+import pytest
+from unittest.mock import AsyncMock
+from datetime import datetime, timezone, timedelta
+from tasks import uploads
+
+@pytest.mark.asyncio
+async def test_reaper_aborts_only_stale_uploads_without_session(monkeypatch):
+    now = datetime.now(timezone.utc)
+    listed = [
+        {"object_name": "u1/uploads/a", "upload_id": "stale", "initiated": now - timedelta(days=2)},
+        {"object_name": "u1/uploads/b", "upload_id": "active", "initiated": now - timedelta(days=2)},
+        {"object_name": "u2/uploads/c", "upload_id": "fresh", "initiated": now - timedelta(minutes=5)},
+        {"object_name": "u2/uploads/d", "upload_id": "broken", "initiated": now - timedelta(days=3)},
+    ]
+    aborted = []
+    async def fake_abort(object_name, upload_id):
+        if upload_id == "broken":
+            raise RuntimeError("MinIO error")
+        aborted.append(upload_id)
+    release = AsyncMock()
+    monkeypatch.setattr(uploads, "list_multipart_uploads", AsyncMock(return_value=listed))
+    monkeypatch.setattr(uploads, "upload_session_exists", AsyncMock(side_effect=lambda upload_id: upload_id == "active"))
+    monkeypatch.setattr(uploads, "list_parts", AsyncMock(return_value={1: {"etag": "e1", "size": 100}, 2: {"etag": "e2", "size": 20}}))
+    monkeypatch.setattr(uploads, "abort_multipart_upload", fake_abort)
+    monkeypatch.setattr(uploads, "release_storage", release)
+
+    report = await uploads.reap_stale_uploads(ttl_seconds=60 * 60 * 24)
+    assert aborted == ["stale"]
+    assert report == {"found": 2, "aborted": 1, "reclaimed_bytes": 120}
+    release.assert_awaited_once_with("u1", "stale")
@@ -18,3 +18,33 @@ async def test_create_user_activity_log():
     db.refresh.assert_awaited()
     assert result.user_id == user_id
     assert result.action_type == "login"
+
+@pytest.mark.asyncio
+async def test_date_range_is_scoped_to_user_and_keyset_paginated(sqlite_db):
+    from app.models.user_activity_log import UserActivityLog
+    from datetime import datetime, timezone, timedelta, date
+    user_id, other_id = uuid4(), uuid4()
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    sqlite_db.add_all([UserActivityLog(user_id=user_id, action_type="login", action_time=start + timedelta(days=i)) for i in range(5)])
+    sqlite_db.add(UserActivityLog(user_id=other_id, action_type="login", action_time=start))
+    await sqlite_db.commit()
+    end = start + timedelta(days=4)
+    page = await user_activity_log_repo.get_logs_by_date_range(sqlite_db, user_id, start, end, limit=3)
+    assert [log.action_time.day for log in page] == [4, 3, 2]
+    page = await user_activity_log_repo.get_logs_by_date_range(sqlite_db, user_id, start, end, 3, page[-1].action_time, page[-1].id)
+    assert [log.action_time.day for log in page] == [1]
+
+    # Retention falls back to deleting rows where the database has no partitions
+    await user_activity_log_repo.drop_logs_before(sqlite_db, date(2026, 1, 1))
+    assert len(await user_activity_log_repo.get_logs_by_date_range(sqlite_db, user_id, start, start + timedelta(days=10))) == 5
+    await user_activity_log_repo.drop_logs_before(sqlite_db, date(2026, 2, 1))
+    remaining = await user_activity_log_repo.get_logs_by_date_range(sqlite_db, user_id, start, start + timedelta(days=10))
+    assert remaining == []
+
+def test_partition_names_and_months():
+    from datetime import date
+    assert user_activity_log_repo.partition_name(date(2026, 3, 1)) == "user_activity_logs_y2026m03"
+    assert user_activity_log_repo.partition_month("user_activity_logs_y2025m12") == date(2025, 12, 1)
+    assert user_activity_log_repo.partition_month("user_activity_logs_default") is None
+    assert user_activity_log_repo.add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert user_activity_log_repo.add_months(date(2026, 1, 1), -12) == date(2025, 1, 1)
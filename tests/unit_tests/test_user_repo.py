@@ -1,19 +1,101 @@
 import pytest
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock
+from passlib.context import CryptContext
+from app.models.user import User, UserRole
+from app.core.password_utils import BCRYPT_ROUNDS, verify_password
 from app.repositories import user_repo
 
+@pytest.fixture
+def failures(monkeypatch):
+    counters = {}
+
+    async def record(username, window_seconds, max_attempts, lockout_seconds):
+        counters[username] = counters.get(username, 0) + 1
+        return counters[username]
+
+    async def get(username):
+        return counters.get(username, 0), 900
+
+    async def clear(username):
+        counters.pop(username, None)
+
+    monkeypatch.setattr(user_repo, "record_login_failure", record)
+    monkeypatch.setattr(user_repo, "get_login_failures", get)
+    monkeypatch.setattr(user_repo, "clear_login_failures", clear)
+    return counters
+
+async def _user_with_cheap_hash(db, password="Test1234!"):
+    # Stored with a lower cost than the configured one, like a hash from before a cost upgrade
+    user = User(username="alice", email="alice@example.com", password_hash=CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(password))
+    db.add(user)
+    await db.commit()
+    return user
+
+@pytest.mark.asyncio
+async def test_lockout_is_checked_before_hashing(monkeypatch, sqlite_db, failures):
+    user = await _user_with_cheap_hash(sqlite_db)
+    for _ in range(user_repo.LOGIN_MAX_ATTEMPTS):
+        assert await user_repo.authenticate_user(sqlite_db, "alice", "wrong") is None
+    assert user.locked_until is not None and user.login_attempts == user_repo.LOGIN_MAX_ATTEMPTS
+
+    verify = AsyncMock()
+    monkeypatch.setattr(user_repo, "verify_and_update_password", verify)
+    with pytest.raises(user_repo.HTTPException) as error:
+        await user_repo.authenticate_user(sqlite_db, "alice", "Test1234!")
+    assert error.value.status_code == 429 and error.value.headers["Retry-After"] == "900"
+    verify.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_successful_login_rehashes_and_resets_failures(sqlite_db, failures):
+    user = await _user_with_cheap_hash(sqlite_db)
+    assert await user_repo.authenticate_user(sqlite_db, "alice", "wrong") is None
+    assert await user_repo.authenticate_user(sqlite_db, "alice", "Test1234!") is user
+    assert user.password_hash.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert "alice" not in failures
+    assert user.last_login is not None and user.login_attempts == 0
+    # Unknown users are counted too, without hashing
+    assert await user_repo.authenticate_user(sqlite_db, "nobody", "x") is None
+    assert failures["nobody"] == 1
+
+@pytest.mark.asyncio
+async def test_database_lock_applies_without_redis(monkeypatch, sqlite_db):
+    broken = AsyncMock(side_effect=ConnectionError("redis down"))
+    for name in ("record_login_failure", "get_login_failures", "clear_login_failures"):
+        monkeypatch.setattr(user_repo, name, broken)
+    user = await _user_with_cheap_hash(sqlite_db)
+    for _ in range(user_repo.LOGIN_MAX_ATTEMPTS):
+        assert await user_repo.authenticate_user(sqlite_db, "alice", "wrong") is None
+    with pytest.raises(user_repo.HTTPException) as error:
+        await user_repo.authenticate_user(sqlite_db, "alice", "Test1234!")
+    assert error.value.status_code == 429
+
+@pytest.mark.asyncio
+async def test_register_user_creates_default_settings_in_one_transaction(sqlite_db):
+    from app.repositories.user_settings_repo import get_settings_by_user
+    user = await user_repo.register_user(sqlite_db, "bob", "bob@example.com", "Test1234!")
+    assert user.username == "bob" and user.role == UserRole.user and user.created_at is not None
+    assert verify_password("Test1234!", user.password_hash)
+    settings = await get_settings_by_user(sqlite_db, user.id)
+    assert settings.storage_limit == 1024 * 1024 * 1024 and settings.theme == "system"
+    # Taken username or email
+    assert await user_repo.register_user(sqlite_db, "bob", "other@example.com", "Test1234!") is None
+    assert await user_repo.register_user(sqlite_db, "other", "bob@example.com", "Test1234!") is None
+
 @pytest.mark.asyncio
-async def test_create_user():
-    db = AsyncMock()
-    username = "testuser"
-    email = "test@example.com"
-    password = "Test1234!"
-    db.add = MagicMock()
-    db.commit = AsyncMock()
-    db.refresh = AsyncMock()
-    result = await user_repo.create_user(db, username, email, password)
-    db.add.assert_called_once()
-    db.commit.assert_awaited()
-    db.refresh.assert_awaited()
-    assert result.username == username
-    assert result.email == email
+async def test_provision_users_skips_taken_accounts(sqlite_db):
+    from sqlalchemy import select, func
+    from app.models.user_settings import UserSettings
+    await user_repo.register_user(sqlite_db, "taken", "taken@example.com", "Test1234!")
+    items = [
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "$2b$04$" + "a" * 53}
+        for i in range(50)
+    ]
+    items.append({"username": "taken", "email": "new@example.com", "password_hash": "$2b$04$" + "a" * 53})
+    items.append({"username": "admin", "email": "admin@example.com", "password_hash": "$2b$04$" + "a" * 53,
+                  "role": "admin", "settings": {"storage_limit": 10}})
+    created = await user_repo.provision_users(sqlite_db, items)
+    assert len(created) == 51 and "taken" not in created
+    assert created["admin"].role == UserRole.admin
+    admin_settings = await sqlite_db.scalar(select(UserSettings).where(UserSettings.user_id == created["admin"].id))
+    assert admin_settings.storage_limit == 10 and admin_settings.language == "en"
+    assert await sqlite_db.scalar(select(func.count(UserSettings.id))) == 52
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import AsyncMock
+from uuid import uuid4
+from app.repositories import user_settings_repo
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    store = {}
+    versions = {}
+
+    async def get(user_id):
+        return store.get(user_id), versions.get(user_id, "0")
+
+    async def put(user_id, data, version):
+        if versions.get(user_id, "0") != version:
+            return False
+        store[user_id] = data
+        return True
+
+    async def delete(user_id):
+        store.pop(user_id, None)
+        versions[user_id] = str(int(versions.get(user_id, "0")) + 1)
+
+    monkeypatch.setattr(user_settings_repo, "get_cached_settings", get)
+    monkeypatch.setattr(user_settings_repo, "store_cached_settings", put)
+    monkeypatch.setattr(user_settings_repo, "delete_cached_settings", delete)
+    user_settings_repo._local_settings.clear()
+    return store
+
+@pytest.mark.asyncio
+async def test_cached_settings_skip_the_database(monkeypatch, sqlite_db, fake_redis):
+    user_id = uuid4()
+    await user_settings_repo.create_settings(sqlite_db, {"user_id": user_id, "storage_limit": 100})
+    settings = await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)
+    assert settings.storage_limit == 100 and settings.user_id == user_id
+    assert fake_redis[str(user_id)]["storage_limit"] == 100
+
+    monkeypatch.setattr(user_settings_repo, "get_settings_by_user", AsyncMock(side_effect=AssertionError("database must not be queried")))
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).storage_limit == 100
+    # Another worker: empty local cache, the Redis entry is used
+    user_settings_repo._local_settings.clear()
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).theme == "system"
+
+@pytest.mark.asyncio
+async def test_changes_invalidate_both_tiers(sqlite_db, fake_redis):
+    user_id = uuid4()
+    await user_settings_repo.create_settings(sqlite_db, {"user_id": user_id, "storage_limit": 100})
+    await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)
+    await user_settings_repo.update_settings(sqlite_db, user_id, {"storage_limit": 200})
+    assert str(user_id) not in fake_redis
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).storage_limit == 200
+
+    assert await user_settings_repo.delete_settings_by_user(sqlite_db, user_id)
+    assert await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id) is None
+    assert not await user_settings_repo.delete_settings_by_user(sqlite_db, user_id)
+
+@pytest.mark.asyncio
+async def test_redis_failure_falls_back_to_the_database(monkeypatch, sqlite_db, fake_redis):
+    user_id = uuid4()
+    await user_settings_repo.create_settings(sqlite_db, {"user_id": user_id, "storage_limit": 100})
+    monkeypatch.setattr(user_settings_repo, "get_cached_settings", AsyncMock(side_effect=ConnectionError("redis down")))
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).storage_limit == 100
+
+@pytest.mark.asyncio
+async def test_fill_racing_with_a_change_is_not_cached(monkeypatch, sqlite_db, fake_redis):
+    user_id = uuid4()
+    await user_settings_repo.create_settings(sqlite_db, {"user_id": user_id, "storage_limit": 100})
+    read_settings = user_settings_repo.get_settings_by_user
+
+    async def read_then_change(session, user_id):
+        settings = await read_settings(session, user_id)
+        stale = user_settings_repo.UserSettings(**{field: getattr(settings, field) for field in user_settings_repo.SETTINGS_FIELDS})
+        # Another request changes the settings after this one has read them
+        settings.storage_limit = 200
+        await session.commit()
+        await user_settings_repo.invalidate_settings_cache(user_id)
+        return stale
+    monkeypatch.setattr(user_settings_repo, "get_settings_by_user", read_then_change)
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).storage_limit == 100
+    monkeypatch.setattr(user_settings_repo, "get_settings_by_user", read_settings)
+    # The stale read was not written back to either cache
+    assert str(user_id) not in fake_redis
+    assert (await user_settings_repo.get_cached_settings_by_user(sqlite_db, user_id)).storage_limit == 200